@@ -0,0 +1,283 @@
+#!/usr/bin/python3
+
+"""
+Local SQLite cache for the read-only describe calls the report scripts make
+(ec2-ssm.py, ebs-discover-stale-volumes.py, rds-maintenance-windows.py).
+
+Rerunning one of those reports a few minutes later with different flags pulls exactly the same
+inventory again.  With the cache switched on (the scripts' --cache True, it's off by default so
+monitoring runs always see live data), the responses are kept on local disk keyed by
+(account, region, operation, normalized parameters) and served back until they're older than the
+TTL for that operation, so a repeat run over dozens of accounts makes no describe calls at all.
+
+It hooks in at the botocore event level, so it works the same for session.client() and
+session.resource().  A paginated listing is cached as one unit: its pages are stored with the time
+the first page was fetched, a listing whose first page comes from the API fetches every following
+page from the API too, and a cached first page is only used when every later page of that same
+fetch is still there (they're read in right away), so pages and their NextTokens from different
+fetches never mix.
+Nothing that changes anything (create_snapshot, modify_snapshot_tier, ...) is ever cached, only the
+operations listed in operation_ttls below.
+
+usage from a script:
+
+    import aws_inventory_cache
+
+    inventory_cache = aws_inventory_cache.InventoryCache(max_age=args.max_age)
+    ...
+    # once we know which account a session points to
+    aws_inventory_cache.enable_cache(session, CURRENT_ACCOUNT_ID, inventory_cache)
+
+    -> any client or resource created from that session afterwards is served from the cache
+
+notes:
+
+    The cache lives in ~/.cache/aws-admin-scripts/inventory-cache.sqlite unless you pass cache_file,
+    the file (and directory) are only created once there's something to put in it
+    Responses are stored as compact JSON compressed with zlib, datetimes survive the round trip
+    max_age (seconds) overrides every TTL below; 0 means always go to the API but still refresh the cache
+"""
+
+import json
+import os
+import sqlite3
+import threading
+import time
+import zlib
+from datetime import datetime
+
+from botocore.awsrequest import AWSResponse
+
+default_cache_file = os.path.join(os.path.expanduser('~'), '.cache', 'aws-admin-scripts', 'inventory-cache.sqlite')
+
+## how long (seconds) each cached operation stays fresh
+## things that change minute to minute (ping status, status checks) get short TTLs
+operation_ttls = {
+    ('ec2', 'DescribeRegions'): 86400,
+    ('ec2', 'DescribeInstances'): 300,
+    ('ec2', 'DescribeInstanceStatus'): 120,
+    ('ec2', 'DescribeVolumes'): 900,
+    ('ec2', 'DescribeSnapshots'): 900,
+    ('ec2', 'DescribeVpcEndpoints'): 3600,
+    ('ec2', 'DescribeRouteTables'): 3600,
+    ('ec2', 'DescribeSubnets'): 3600,
+    ('ssm', 'DescribeInstanceInformation'): 60,
+    ('rds', 'DescribeDBInstances'): 900,
+}
+
+## anything older than this (or max_age, if that's longer) is dropped when the cache is opened
+max_ttl = max(operation_ttls.values())
+
+## request parameters / response fields that carry the position within a paginated listing
+pagination_tokens = ('NextToken', 'Marker')
+
+def pagination_token(values):
+    for name in pagination_tokens:
+        if values.get(name):
+            return values[name]
+    return None
+
+def pagination_token_name(values):
+    for name in pagination_tokens:
+        if values.get(name):
+            return name
+    return None
+
+## turn the parameters into a stable string so the same query always maps to the same key
+## filter and id lists are sorted since their order doesn't change what comes back
+def normalize_params(params):
+    def normalize(value):
+        if isinstance(value, dict):
+            return {k: normalize(v) for k, v in value.items()}
+        if isinstance(value, list):
+            value = [normalize(v) for v in value]
+            if all(isinstance(v, (str, int, float)) for v in value):
+                return sorted(value)
+            if all(isinstance(v, dict) for v in value):
+                return sorted(value, key=lambda v: json.dumps(v, sort_keys=True, default=str))
+            return value
+        return value
+
+    return json.dumps(normalize(params), sort_keys=True, separators=(',', ':'), default=str)
+
+def encode_value(value):
+    if isinstance(value, datetime):
+        return {'$dt': value.isoformat()}
+    if isinstance(value, bytes):
+        return {'$b': value.decode('latin-1')}
+    raise TypeError("can't cache a " + type(value).__name__)
+
+def decode_value(value):
+    if '$dt' in value and len(value) == 1:
+        return datetime.fromisoformat(value['$dt'])
+    if '$b' in value and len(value) == 1:
+        return value['$b'].encode('latin-1')
+    return value
+
+def compress_response(parsed):
+    parsed = {k: v for k, v in parsed.items() if k != 'ResponseMetadata'}
+    return zlib.compress(json.dumps(parsed, separators=(',', ':'), default=encode_value).encode('utf-8'), 6)
+
+def decompress_response(body):
+    return json.loads(zlib.decompress(body).decode('utf-8'), object_hook=decode_value)
+
+class InventoryCache:
+
+    def __init__(self, cache_file=None, max_age=None):
+        if cache_file is None:
+            cache_file = default_cache_file
+        self.cache_file = cache_file
+        self.max_age = max_age
+        self.hits = 0
+        self.misses = 0
+        self.lock = threading.Lock()
+        self.connection = None
+
+        # the listings in progress, by the token that fetches their next page: when a live listing started, and the
+        # compressed remaining pages of a listing that's being served from the cache
+        self.live_listings = {}
+        self.cached_pages = {}
+
+    ## open the sqlite file the first time it's needed, and only create it when there's something to write
+    ## call with self.lock held, returns False if there's no cache file yet
+    def open(self, create):
+        if self.connection is not None:
+            return True
+        if not create and not os.path.exists(self.cache_file):
+            return False
+        if os.path.dirname(self.cache_file):
+            os.makedirs(os.path.dirname(self.cache_file), exist_ok=True)
+
+        # the scripts that use threads share one connection, the lock keeps sqlite happy
+        self.connection = sqlite3.connect(self.cache_file, timeout=30, check_same_thread=False)
+        self.connection.execute('PRAGMA journal_mode=WAL')
+        self.connection.execute(
+            'CREATE TABLE IF NOT EXISTS inventory_cache ('
+            'account TEXT, region TEXT, operation TEXT, params TEXT, fetched REAL, body BLOB, '
+            'PRIMARY KEY (account, region, operation, params)) WITHOUT ROWID'
+        )
+        self.connection.execute('DELETE FROM inventory_cache WHERE fetched < ?', (time.time() - max(max_ttl, self.max_age or 0),))
+        self.connection.commit()
+        return True
+
+    def ttl_for(self, service, operation):
+        if self.max_age is not None:
+            return self.max_age
+        return operation_ttls.get((service, operation), 0)
+
+    ## call with self.lock held
+    def read_row(self, key):
+        return self.connection.execute(
+            'SELECT fetched, body FROM inventory_cache WHERE account=? AND region=? AND operation=? AND params=?',
+            key
+        ).fetchone()
+
+    ## the cached response for key, or None
+    ## the first page of a listing has to be younger than ttl, and is only served if the rest of the listing from the
+    ## same fetch is there too; later pages (token) only ever come from the listing their first page came from
+    def get(self, key, ttl, token=None, params=None):
+        if token is not None:
+            body = self.cached_pages.pop(token, None)
+            return decompress_response(body) if body is not None else None
+        if ttl <= 0:
+            return None
+
+        with self.lock:
+            if not self.open(False):
+                return None
+            row = self.read_row(key)
+            if row is None or row[0] < time.time() - ttl:
+                return None
+            parsed = decompress_response(row[1])
+
+            # read the rest of the listing in now, any page missing or from another fetch means the whole listing
+            # goes to the API instead
+            pages = {}
+            page = parsed
+            while pagination_token_name(page) is not None:
+                name = pagination_token_name(page)
+                next_params = dict(params or {})
+                next_params[name] = page[name]
+                next_row = self.read_row(key[:3] + (normalize_params(next_params),))
+                if next_row is None or next_row[0] != row[0]:
+                    return None
+                pages[page[name]] = next_row[1]
+                page = decompress_response(next_row[1])
+
+        self.cached_pages.update(pages)
+        return parsed
+
+    ## a page that came from the API, stored with the time its listing started
+    def put(self, key, parsed, token=None):
+        fetched = self.live_listings.pop(token, None) if token is not None else None
+        if fetched is None:
+            fetched = time.time()
+        next_token = pagination_token(parsed)
+        if next_token is not None:
+            self.live_listings[next_token] = fetched
+
+        body = compress_response(parsed)
+        with self.lock:
+            self.open(True)
+            self.connection.execute(
+                'INSERT OR REPLACE INTO inventory_cache (account, region, operation, params, fetched, body) VALUES (?,?,?,?,?,?)',
+                key + (fetched, body)
+            )
+            self.connection.commit()
+
+    def close(self):
+        with self.lock:
+            if self.connection is not None:
+                self.connection.close()
+                self.connection = None
+
+## hook the cache into a boto3 session for a given account
+## must be called before the clients/resources are created from that session
+def enable_cache(session, account_id, inventory_cache):
+    if inventory_cache is None:
+        return
+
+    def build_key(params, model, context, **kwargs):
+        service = model.service_model.service_id.hyphenize()
+        context['inventory_cache_service'] = service
+        context['inventory_cache_key'] = (
+            str(account_id),
+            str(context.get('client_region')),
+            service + ':' + model.name,
+            normalize_params(params)
+        )
+        context['inventory_cache_token'] = pagination_token(params)
+        context['inventory_cache_params'] = dict(params)
+
+    def serve_from_cache(model, context, **kwargs):
+        key = context.get('inventory_cache_key')
+        if key is None:
+            return None
+        parsed = inventory_cache.get(key, inventory_cache.ttl_for(context['inventory_cache_service'], model.name),
+                                     context.get('inventory_cache_token'), context.get('inventory_cache_params'))
+        if parsed is None:
+            inventory_cache.misses += 1
+            return None
+
+        inventory_cache.hits += 1
+        context['inventory_cache_hit'] = True
+        parsed['ResponseMetadata'] = {'HTTPStatusCode': 200, 'HTTPHeaders': {}, 'RetryAttempts': 0}
+        return AWSResponse('inventory-cache', 200, {}, None), parsed
+
+    def store_in_cache(http_response, parsed, model, context, **kwargs):
+        key = context.get('inventory_cache_key')
+        if key is None or context.get('inventory_cache_hit') or http_response.status_code >= 300:
+            return
+        try:
+            inventory_cache.put(key, parsed, context.get('inventory_cache_token'))
+        except (TypeError, sqlite3.Error):
+            # a cache we can't write to shouldn't stop the report
+            pass
+
+    for (service, operation) in operation_ttls:
+        session.events.register('before-parameter-build.' + service + '.' + operation, build_key,
+                                unique_id='inventory-cache-key-' + service + operation)
+        session.events.register('before-call.' + service + '.' + operation, serve_from_cache,
+                                unique_id='inventory-cache-get-' + service + operation)
+        session.events.register('after-call.' + service + '.' + operation, store_in_cache,
+                                unique_id='inventory-cache-put-' + service + operation)
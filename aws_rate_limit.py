@@ -0,0 +1,168 @@
+#!/usr/bin/python3
+
+"""
+Client side API rate limiter for the report scripts (ec2-ssm.py, ebs-discover-stale-volumes.py).
+
+EC2 throttles per account and region, and counts the describe calls and the calls that change something against
+separate budgets.  When two of our jobs run against the same accounts at the same time, each one on its own is
+under the limit but together they aren't, so they both get RequestLimitExceeded and spend their time in botocore's
+retry backoff.  With the limiter switched on every call first takes a token from a bucket for its
+(account, region, service, operation class), and waits when the bucket is empty, so the calls stay under the budget
+instead of retrying into the throttle.
+
+It hooks in at the botocore event level like the inventory cache, so it covers clients, resources, paginators and
+waiters.  The hook is on request-created, which botocore fires for every attempt, so the retries botocore makes after
+a throttle or a transient error wait for a token as well instead of going around the budget (a before-call hook only
+sees the first attempt).  Calls answered by the inventory cache never get as far as a request, so they never reach
+the limiter and don't use up tokens.
+
+The buckets either live in the process (shared by its threads) or, to share one budget between scripts running at
+the same time, in a small JSON file that every process updates under an exclusive file lock.
+
+usage from a script:
+
+    import aws_rate_limit
+
+    rate_limiter = aws_rate_limit.RateLimiter(state_file=None)    # or aws_rate_limit.default_state_file
+    ...
+    # once we know which account a session points to
+    aws_rate_limit.enable_rate_limit(session, CURRENT_ACCOUNT_ID, rate_limiter)
+
+    -> every call from clients or resources created from that session afterwards waits for a token
+
+notes:
+
+    The rates below are a share of the documented EC2 defaults, leaving room for the console and anything else
+    Operation classes: "describe" for Describe*/Get*/List* calls, "mutate" for everything else
+    The shared file needs fcntl (Linux/macOS), elsewhere the buckets stay per process
+"""
+
+import json
+import os
+import threading
+import time
+
+try:
+    import fcntl
+except ImportError:
+    fcntl = None
+
+default_state_file = os.path.join(os.path.expanduser('~'), '.cache', 'aws-admin-scripts', 'rate-limit.json')
+
+## (tokens per second, bucket size) per service and operation class
+## EC2's own buckets are 20/s with a burst of 100 for describes, 5/s with a burst of 200 for changes
+operation_rates = {
+    ('ec2', 'describe'): (10.0, 50),
+    ('ec2', 'mutate'): (2.5, 50),
+    ('ssm', 'describe'): (5.0, 20),
+    ('cloudwatch', 'describe'): (20.0, 40),
+    ('cloudwatch', 'mutate'): (20.0, 40),
+    ('rds', 'describe'): (5.0, 20),
+}
+
+## anything not listed above
+default_rate = (10.0, 20)
+
+## buckets in the shared file that haven't been touched for this long (seconds) are dropped
+state_expiry = 3600
+
+def operation_class(operation):
+    if operation.startswith(('Describe', 'Get', 'List')):
+        return 'describe'
+    return 'mutate'
+
+class RateLimiter:
+
+    def __init__(self, state_file=None, rates=None):
+        self.state_file = state_file
+        if fcntl is None:
+            self.state_file = None
+        self.rates = dict(operation_rates)
+        if rates:
+            self.rates.update(rates)
+        self.buckets = {}
+        self.lock = threading.Lock()
+        self.waits = 0
+        self.waited = 0.0
+
+        if self.state_file and os.path.dirname(self.state_file):
+            os.makedirs(os.path.dirname(self.state_file), exist_ok=True)
+
+    def rate_for(self, service, op_class):
+        return self.rates.get((service, op_class), default_rate)
+
+    ## refill a [tokens, last refill time] bucket and take a token if there is one
+    ## returns how long to wait before trying again, 0 if the token was taken
+    @staticmethod
+    def take(bucket, rate, size, now):
+        bucket[0] = min(size, bucket[0] + (now - bucket[1]) * rate)
+        bucket[1] = now
+        if bucket[0] >= 1:
+            bucket[0] -= 1
+            return 0.0
+        return (1 - bucket[0]) / rate
+
+    def take_local(self, key, rate, size):
+        now = time.monotonic()
+        with self.lock:
+            bucket = self.buckets.setdefault(key, [float(size), now])
+            return self.take(bucket, rate, size, now)
+
+    ## same as take_local, but the bucket lives in the state file so every process using it shares the budget
+    ## the lock file is held just long enough to read, update and write the buckets
+    def take_shared(self, key, rate, size):
+        name = "/".join(key)
+        with self.lock:
+            with open(self.state_file, 'a+', encoding='utf-8') as f:
+                fcntl.flock(f, fcntl.LOCK_EX)
+                try:
+                    f.seek(0)
+                    try:
+                        state = json.loads(f.read() or '{}')
+                    except ValueError:
+                        state = {}
+                    now = time.time()
+                    state = {k: v for k, v in state.items() if v[1] > now - state_expiry}
+                    bucket = state.setdefault(name, [float(size), now])
+                    wait = self.take(bucket, rate, size, now)
+                    f.seek(0)
+                    f.truncate()
+                    f.write(json.dumps(state, separators=(',', ':')))
+                    f.flush()
+                finally:
+                    fcntl.flock(f, fcntl.LOCK_UN)
+        return wait
+
+    ## block until a token is available for this account/region/service/operation class
+    def acquire(self, account, region, service, op_class):
+        rate, size = self.rate_for(service, op_class)
+        key = (str(account), str(region), service, op_class)
+        while True:
+            if self.state_file:
+                wait = self.take_shared(key, rate, size)
+            else:
+                wait = self.take_local(key, rate, size)
+            if wait <= 0:
+                return
+            with self.lock:
+                self.waits += 1
+                self.waited += wait
+            time.sleep(wait)
+
+## hook the rate limiter into a boto3 session for a given account
+## must be called before the clients/resources are created from that session
+def enable_rate_limit(session, account_id, rate_limiter):
+    if rate_limiter is None:
+        return
+
+    # request-created.<service>.<operation> fires once per attempt, before the request is signed
+    def wait_for_token(request, operation_name, event_name, **kwargs):
+        rate_limiter.acquire(
+            account_id,
+            request.context.get('client_region'),
+            event_name.split('.')[1],
+            operation_class(operation_name)
+        )
+
+    # registered first so the request is signed after the wait, not before it
+    session.events.register_first('request-created', wait_for_token, unique_id='rate-limit-' + str(account_id))
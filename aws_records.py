@@ -0,0 +1,137 @@
+#!/usr/bin/python3
+
+"""
+Compact record types for the inventory the scripts hold in memory: EC2 instances, SSM agents, EBS volumes and
+snapshots, RDS instances, and the volume/snapshot lists ebs-snapshot-to-archive.py reads and writes.
+
+Each one is a namedtuple built straight from a client response dict, keeping only the fields the scripts use.
+A boto3 resource object carries its whole response dict plus the resource machinery, and a raw dict keeps every
+field AWS sends back, so for accounts with 100k+ snapshots the records take a fraction of the memory.  They're
+still tuples, so code that indexes them (record[2]) or unpacks them keeps working, and they pickle for the
+worker processes of ebs-snapshot-to-archive.py --processes.
+
+usage from a script:
+
+    import aws_records
+
+    paginator = ec2_client.get_paginator('describe_volumes')
+    volumes = list(aws_records.page_records(paginator.paginate(), 'Volumes', aws_records.volume_record))
+    ...
+    volumes[0].volume_id, volumes[0].size, volumes[0].name
+
+notes:
+
+    Fields that can be missing from a response are None in the record (or "" for the SSM fields, which the report
+    prints as empty columns), same as the attribute on a boto3 resource
+"""
+
+from collections import namedtuple
+
+InstanceRecord = namedtuple('InstanceRecord', [
+    'instance_id', 'instance_type', 'state', 'private_ip', 'public_ip', 'subnet_id', 'availability_zone',
+    'iam_profile_arn',
+])
+
+SsmAgentRecord = namedtuple('SsmAgentRecord', [
+    'instance_id', 'ping_status', 'agent_version', 'computer_name', 'resource_type', 'platform_type',
+    'platform_name', 'platform_version', 'ip_address',
+])
+
+## tags are ((key, value), ...) and instance_ids are the instances the volume is attached to
+VolumeRecord = namedtuple('VolumeRecord', [
+    'volume_id', 'name', 'volume_type', 'availability_zone', 'size', 'state', 'encrypted', 'create_time', 'iops',
+    'throughput', 'instance_ids', 'tags',
+])
+
+SnapshotRecord = namedtuple('SnapshotRecord', [
+    'snapshot_id', 'volume_id', 'start_time', 'volume_size', 'state', 'storage_tier',
+])
+
+RdsInstanceRecord = namedtuple('RdsInstanceRecord', [
+    'identifier', 'instance_class', 'engine', 'engine_version', 'status', 'availability_zone',
+    'auto_minor_version_upgrade', 'maintenance_window',
+])
+
+## one line of the ebs-snapshot-to-archive.py input CSV (keyed by volume id) and one line of its output file
+VolumeRequest = namedtuple('VolumeRequest', ['account', 'region', 'notes'])
+ArchivedSnapshot = namedtuple('ArchivedSnapshot', ['snapshot_id', 'volume_id', 'account', 'region', 'notes'])
+
+def tag_value(tags, key, default=None):
+    for tag in tags or []:
+        if tag['Key'] == key:
+            return tag['Value']
+    return default
+
+def instance_record(instance):
+    return InstanceRecord(
+        instance['InstanceId'],
+        instance.get('InstanceType'),
+        instance.get('State', {}).get('Name'),
+        instance.get('PrivateIpAddress'),
+        instance.get('PublicIpAddress'),
+        instance.get('SubnetId'),
+        instance.get('Placement', {}).get('AvailabilityZone'),
+        instance.get('IamInstanceProfile', {}).get('Arn'),
+    )
+
+def ssm_agent_record(information):
+    return SsmAgentRecord(
+        information['InstanceId'],
+        information.get('PingStatus', ""),
+        information.get('AgentVersion', ""),
+        information.get('ComputerName', ""),
+        information.get('ResourceType', ""),
+        information.get('PlatformType', ""),
+        information.get('PlatformName', ""),
+        information.get('PlatformVersion', ""),
+        information.get('IPAddress', ""),
+    )
+
+def volume_record(volume):
+    return VolumeRecord(
+        volume['VolumeId'],
+        tag_value(volume.get('Tags'), 'Name', "unnamed"),
+        volume.get('VolumeType'),
+        volume.get('AvailabilityZone'),
+        volume.get('Size'),
+        volume.get('State'),
+        volume.get('Encrypted'),
+        volume.get('CreateTime'),
+        volume.get('Iops'),
+        volume.get('Throughput'),
+        tuple(a['InstanceId'] for a in volume.get('Attachments', [])),
+        tuple((t['Key'], t['Value']) for t in volume.get('Tags', [])),
+    )
+
+def snapshot_record(snapshot):
+    return SnapshotRecord(
+        snapshot['SnapshotId'],
+        snapshot.get('VolumeId'),
+        snapshot.get('StartTime'),
+        snapshot.get('VolumeSize'),
+        snapshot.get('State'),
+        snapshot.get('StorageTier'),
+    )
+
+def rds_instance_record(db_instance):
+    return RdsInstanceRecord(
+        db_instance['DBInstanceIdentifier'],
+        db_instance.get('DBInstanceClass'),
+        db_instance.get('Engine'),
+        db_instance.get('EngineVersion'),
+        db_instance.get('DBInstanceStatus'),
+        db_instance.get('AvailabilityZone'),
+        db_instance.get('AutoMinorVersionUpgrade'),
+        db_instance.get('PreferredMaintenanceWindow'),
+    )
+
+## turn the pages of a paginated call into records as they come in, so only one page of raw dicts is alive at a time
+## describe_instances nests its instances in reservations, that's handled here too
+def page_records(pages, key, builder):
+    for page in pages:
+        for item in page[key]:
+            if key == 'Reservations':
+                for instance in item['Instances']:
+                    yield builder(instance)
+            else:
+                yield builder(item)
@@ -0,0 +1,66 @@
+#!/usr/bin/python3
+
+"""
+boto3 sessions that share one botocore data loader for the whole process.
+
+Every boto3.Session gets its own loader, so the first client of each service on every new session reads and parses
+the service model, endpoint rules and endpoints.json from botocore's data directory all over again (the ec2 model
+alone is a few MB of JSON).  The scripts open a session per profile, and ebs-snapshot-to-archive.py opens several
+per account, so with -a True most of the time before the first real API call went into parsing the same JSON over
+and over.  Sessions made here share one loader, so each file is only parsed once per process and a new session's
+clients come up in a few milliseconds instead of ~100.
+
+Everything else about the session (profile, credentials, region, event hooks) is its own, same as boto3.Session.
+
+usage from a script:
+
+    import aws_session
+
+    session = aws_session.new_session(this_profile)     # or new_session() / "noprofile" for env vars / the default profile
+    ec2_client = session.client('ec2', region_name=region)
+
+notes:
+
+    Worker processes started with fork inherit the loader and whatever it already parsed
+"""
+
+import boto3
+import botocore.loaders
+import botocore.session
+import os
+
+## the one data loader every session in this process uses, created with the first session
+data_loader = None
+
+## boto3.Session appends its own data directory to the loader of every session it wraps, which on a shared loader
+## would grow the search path by one entry per session, so a path that's already there isn't added again
+class SearchPaths(list):
+
+    def append(self, path):
+        if path not in self:
+            super().append(path)
+
+## the shared loader, searching the same places a session's own loader would (AWS_DATA_PATH, ~/.aws/models and
+## botocore's data, like botocore.loaders.create_loader) plus boto3's resource models, added here once
+def create_data_loader(botocore_session):
+    search_paths = SearchPaths()
+    data_path = botocore_session.get_config_variable('data_path')
+    if data_path:
+        search_paths.extend(os.path.expanduser(os.path.expandvars(path)) for path in data_path.split(os.pathsep))
+    loader = botocore.loaders.Loader(extra_search_paths=search_paths)
+    loader.search_paths.append(os.path.join(os.path.dirname(boto3.__file__), 'data'))
+    return loader
+
+## "noprofile" is what the scripts use for "no -p given", it means the default credentials the same as None
+def new_session(profile_name=None):
+    global data_loader
+
+    if profile_name == "noprofile":
+        profile_name = None
+
+    botocore_session = botocore.session.Session(profile=profile_name)
+    if data_loader is None:
+        data_loader = create_data_loader(botocore_session)
+    botocore_session.register_component('data_loader', data_loader)
+
+    return boto3.Session(botocore_session=botocore_session)
@@ -0,0 +1,179 @@
+#!/usr/bin/python3
+
+"""
+Timeline tracing for the scripts' --trace option, written as Chrome Trace Event JSON so a run can be opened in
+https://ui.perfetto.dev or chrome://tracing to see where the time went: a slow region, a throttled account, or
+everything waiting on one thread.
+
+Spans nest by time on each thread: the run, then a span per profile, per region, per phase (STS, describe, join,
+snapshot wait, tier, ...) and finally every API call, which is recorded from botocore's events with the account,
+region, HTTP status and whether the inventory cache answered it.
+
+Tracing is off until start() is called.  When it's off a span costs one check of a module variable, when it's on a
+span is a tuple appended to a list (about half a microsecond), and nothing is formatted until the file is written at
+exit, so a million spans add about 3 seconds (mostly writing the ~100 MB file) to a run.
+
+usage from a script:
+
+    import aws_trace
+
+    if args.trace:
+        aws_trace.start(args.trace, "ec2-ssm.py")      # the run span, the file is written when the script exits
+    ...
+    aws_trace.enable_tracing(session, CURRENT_ACCOUNT_ID)
+    ...
+    region_span = aws_trace.begin(region, "region")
+    with aws_trace.span("describe"):
+        ...
+    region_span.end()
+
+notes:
+
+    Worker processes (ebs-snapshot-to-archive.py --processes) hand their spans back with collect() and the main
+    process adds them with merge(), each process gets its own row in the viewer
+"""
+
+import atexit
+import json
+import os
+import threading
+import time
+
+## None while tracing is off, otherwise (name, category, start ns, duration ns, pid, thread id, args) per span
+events = None
+## (pid, thread id) -> thread name
+thread_names = {}
+pid = os.getpid()
+trace_file = None
+run_span = None
+run_pid = None
+
+perf_counter_ns = time.perf_counter_ns
+get_ident = threading.get_ident
+
+def reset_pid():
+    global pid
+    pid = os.getpid()
+
+os.register_at_fork(after_in_child=reset_pid)
+
+def record(name, category, start, duration, args):
+    tid = get_ident()
+    if (pid, tid) not in thread_names:
+        thread_names[(pid, tid)] = threading.current_thread().name
+    events.append((name, category, start, duration, pid, tid, args))
+
+class span:
+    __slots__ = ('name', 'category', 'args', 'start')
+
+    def __init__(self, name, category='phase', args=None):
+        self.name = name
+        self.category = category
+        self.args = args
+        self.start = perf_counter_ns() if events is not None else None
+
+    def end(self):
+        if self.start is not None and events is not None:
+            record(self.name, self.category, self.start, perf_counter_ns() - self.start, self.args)
+            self.start = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.end()
+
+## for spans that can't be a with block, e.g. one per loop iteration; call .end() on what it returns
+def begin(name, category='phase', args=None):
+    return span(name, category, args)
+
+## turn tracing on, open the run span and write the file when the script exits
+def start(filename, run_name):
+    global events, trace_file, run_span, run_pid
+    events = []
+    trace_file = filename
+    run_pid = pid
+    run_span = span(run_name, 'run')
+    atexit.register(finish)
+
+def finish():
+    # forked workers inherit the atexit list, only the process that started tracing writes the file
+    if events is None or pid != run_pid:
+        return
+    run_span.end()
+    write(trace_file)
+
+## turn recording on in a worker process that didn't inherit it (the spawn/forkserver start methods), without a run
+## span or a file of its own, everything goes back with collect()
+def start_worker():
+    global events
+    if events is None:
+        events = []
+
+## the spans a worker process recorded since mark, and its thread names, to send back to the main process
+def mark():
+    return len(events) if events is not None else 0
+
+def collect(since=0):
+    if events is None:
+        return None
+    return (events[since:], {k: v for k, v in thread_names.items() if k[0] == pid})
+
+def merge(collected):
+    if events is None or collected is None:
+        return
+    worker_events, worker_thread_names = collected
+    # spans from this process are already here when the "worker" ran in-process
+    events.extend(e for e in worker_events if e[4] != pid)
+    thread_names.update(worker_thread_names)
+
+def write(filename):
+    with open(filename, 'w', encoding='utf-8') as f:
+        f.write('{"displayTimeUnit":"ms","traceEvents":[\n')
+        first = True
+        for (this_pid, tid), name in thread_names.items():
+            f.write(('' if first else ',\n') + json.dumps({"name": "thread_name", "ph": "M", "pid": this_pid, "tid": tid, "args": {"name": name}}))
+            first = False
+        for name, category, start, duration, this_pid, tid, args in events:
+            event = {"name": name, "cat": category, "ph": "X", "ts": start / 1000, "dur": duration / 1000, "pid": this_pid, "tid": tid}
+            if args:
+                event["args"] = args
+            f.write(('' if first else ',\n') + json.dumps(event, separators=(',', ':'), default=str))
+            first = False
+        f.write('\n]}\n')
+
+## record every API call made from a session as a span, with its account, region and outcome
+## must be called before the clients/resources are created from that session
+def enable_tracing(session, account_id):
+    if events is None:
+        return
+
+    def call_started(context, **kwargs):
+        context['trace_start'] = perf_counter_ns()
+
+    def call_finished(http_response, model, context, **kwargs):
+        start = context.get('trace_start')
+        if start is None or events is None:
+            return
+        record(model.service_model.service_id.hyphenize() + "." + model.name, 'api', start, perf_counter_ns() - start, {
+            'account': account_id,
+            'region': context.get('client_region'),
+            'status': http_response.status_code,
+            'cached': context.get('inventory_cache_hit', False),
+        })
+
+    def call_failed(exception, model, context, **kwargs):
+        start = context.get('trace_start')
+        if start is None or events is None:
+            return
+        record(model.service_model.service_id.hyphenize() + "." + model.name, 'api', start, perf_counter_ns() - start, {
+            'account': account_id,
+            'region': context.get('client_region'),
+            'error': type(exception).__name__,
+        })
+
+    # before-parameter-build comes before the inventory cache and rate limiter get a look at the call,
+    # so time spent waiting for a token shows up in the call's span
+    session.events.register('before-parameter-build', call_started, unique_id='trace-start-' + str(account_id))
+    session.events.register('after-call', call_finished, unique_id='trace-end-' + str(account_id))
+    session.events.register('after-call-error', call_failed, unique_id='trace-error-' + str(account_id))
@@ -0,0 +1,163 @@
+#!/usr/bin/python3
+
+"""
+Peak memory of holding a synthetic fleet of EBS snapshots the three ways the scripts have done it: boto3 resources
+from an ec2.snapshots collection, the raw dicts from the describe_snapshots paginator, and aws_records.SnapshotRecord
+tuples built from the same pages.
+
+No AWS account is needed.  Every describe_snapshots call is answered from a before-call hook with a page of 1000
+made-up snapshots (the size of a real page), so the collection and the paginator run their normal code paths and
+only the network is missing.  Each way is measured in its own process with tracemalloc, so one doesn't inherit the
+other's loaded models or freed memory.
+
+arguments:
+
+    -n or --snapshots [number]
+        How many snapshots in the fleet (default is 10000)
+
+    -m or --mode [resource/dict/record/all]
+        Which way to hold them (default is all, one after the other)
+
+    --header [True/False]
+        Print the CSV header line (default is True)
+
+usage:
+
+    python3 bench_records.py
+    python3 bench_records.py -n 100000 -m record
+
+notes:
+
+    tracemalloc counts Python allocations only, so the figures are what the objects themselves take, not the RSS of
+    the process.  It also slows everything down a lot, so don't read anything into the times
+    The snapshots look like the ones CreateImage leaves behind, two tags each and seven to a volume
+    The pages skip the XML parsing a real response goes through, so the peak doesn't include the parser's own
+    short lived garbage, only what each way builds and keeps
+"""
+
+import argparse
+import gc
+import os
+import subprocess
+import sys
+import time
+import tracemalloc
+from datetime import datetime, timedelta, timezone
+
+## describe_snapshots hands back at most this many per page
+page_size = 1000
+
+def setup_args():
+    parser = argparse.ArgumentParser(
+        description='Optional arguments')
+
+    parser.add_argument('-n', '--snapshots',
+                        required=False,
+                        action='store',
+                        help='How many snapshots in the fleet (default is 10000)')
+
+    parser.add_argument('-m', '--mode',
+                        required=False,
+                        action='store',
+                        help='resource, dict, record or all (default is all)')
+
+    parser.add_argument('--header',
+                        required=False,
+                        action='store',
+                        help='Print the CSV header line, True/False (default is True)')
+
+    return (parser.parse_args())
+
+## one describe_snapshots page of made-up snapshots, starting at snapshot number first
+def snapshot_page(first, count, total):
+    start_time = datetime(2024, 1, 1, tzinfo=timezone.utc)
+    page = {'Snapshots': []}
+    for number in range(first, min(first + count, total)):
+        page['Snapshots'].append({
+            'Description': 'Created by CreateImage(i-0123456789abcdef0) for ami-0123456789abcdef0',
+            'Encrypted': False,
+            'OwnerId': '123456789012',
+            'Progress': '100%',
+            'SnapshotId': 'snap-%017x' % number,
+            'StartTime': start_time + timedelta(minutes=number),
+            'State': 'completed',
+            'VolumeId': 'vol-%017x' % (number // 7),
+            'VolumeSize': [8, 100, 500][number % 3],
+            'StorageTier': 'standard',
+            'Tags': [{'Key': 'Name', 'Value': 'snapshot ' + str(number)}, {'Key': 'Notes', 'Value': 'made up for bench_records.py'}],
+        })
+    if first + count < total:
+        page['NextToken'] = str(first + count)
+    return page
+
+## answer every describe_snapshots call on this client from snapshot_page instead of the API
+def fake_describe_snapshots(ec2_client, total):
+
+    class FakeHttpResponse:
+        status_code = 200
+        headers = {}
+
+    def answer(params, **kwargs):
+        first = int(params['body'].get('NextToken', 0))
+        return FakeHttpResponse(), snapshot_page(first, page_size, total)
+
+    ec2_client.meta.events.register('before-call.ec2.DescribeSnapshots', answer)
+
+## build the fleet one way under tracemalloc, returns (held MB, peak MB, seconds)
+def measure(mode, total):
+    import boto3
+    import aws_records
+
+    session = boto3.session.Session(region_name='us-east-1', aws_access_key_id='bench', aws_secret_access_key='bench')
+    if mode == "resource":
+        ec2 = session.resource('ec2')
+        fake_describe_snapshots(ec2.meta.client, total)
+    else:
+        ec2_client = session.client('ec2')
+        fake_describe_snapshots(ec2_client, total)
+        pages = ec2_client.get_paginator('describe_snapshots').paginate(OwnerIds=['self'])
+
+    gc.collect()
+    tracemalloc.start()
+    start = time.perf_counter()
+    if mode == "resource":
+        held = list(ec2.snapshots.filter(OwnerIds=['self']))
+    elif mode == "dict":
+        held = [snapshot for page in pages for snapshot in page['Snapshots']]
+    else:
+        held = list(aws_records.page_records(pages, 'Snapshots', aws_records.snapshot_record))
+    seconds = time.perf_counter() - start
+    current, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    if len(held) != total:
+        raise SystemExit(mode + " only got " + str(len(held)) + " of " + str(total) + " snapshots")
+    return current / 2**20, peak / 2**20, seconds
+
+def main():
+    args = setup_args()
+
+    if args.snapshots:
+        total = int(args.snapshots)
+    else:
+        total = 10000
+
+    if args.mode:
+        mode = str(args.mode).lower()
+    else:
+        mode = "all"
+
+    if mode == "all":
+        # each way in a fresh process so the numbers don't depend on what ran before
+        print("mode,snapshots,held MB,peak MB,seconds")
+        for this_mode in ["resource", "dict", "record"]:
+            subprocess.run([sys.executable, os.path.abspath(__file__), '-n', str(total), '-m', this_mode, '--header', 'False'], check=False)
+        return
+
+    held_mb, peak_mb, seconds = measure(mode, total)
+    if args.header != "False" and args.header != "false":
+        print("mode,snapshots,held MB,peak MB,seconds")
+    print(mode + "," + str(total) + "," + str(round(held_mb, 1)) + "," + str(round(peak_mb, 1)) + "," + str(round(seconds, 1)))
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,188 @@
+#!/usr/bin/python3
+
+"""
+Startup time of the multi-profile scripts: how long from starting the process to its first API request, to its first
+EC2 request, and to its exit.
+
+No AWS account is needed.  A local stub endpoint (AWS_ENDPOINT_URL) answers STS, EC2 and SSM with empty but valid
+responses, and a throwaway credentials file gives the scripts a few profiles, each of which the stub reports as its
+own account.  The scripts run unchanged as subprocesses, so what's measured is everything they do before and around
+the API: importing boto3, opening a session per profile, loading the service models and building the clients.
+
+arguments:
+
+    -r or --runs [number]
+        How many times each case runs, the median is reported (default is 7)
+
+    -n or --profiles [number]
+        How many profiles in the credentials file (default is 5)
+
+usage:
+
+    python3 bench_startup.py
+    python3 bench_startup.py -r 15 -n 20
+
+notes:
+
+    The cases pass --cache False and --rate-limit False so the numbers stay comparable with older versions of the
+    scripts, where those were on by default
+    The stub answers every EC2 describe call with empty lists and DescribeRegions with us-east-1 and eu-west-1, so the
+    time after the first EC2 call is mostly the scripts' own per region overhead
+"""
+
+import argparse
+import http.server
+import json
+import os
+import re
+import statistics
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import urllib.parse
+
+## the list elements the scripts read from EC2 responses, all sent back empty
+ec2_result_sets = ['volumeSet', 'snapshotSet', 'reservationSet', 'instanceStatusSet', 'vpcEndpointSet', 'routeTableSet', 'subnetSet']
+
+## the first profile gets this account, the rest count up from first_account
+default_account = '123456789012'
+first_account = 100000000000
+
+def setup_args():
+    parser = argparse.ArgumentParser(
+        description='Optional arguments')
+
+    parser.add_argument('-r', '--runs',
+                        required=False,
+                        action='store',
+                        help='How many times each case runs (default is 7)')
+
+    parser.add_argument('-n', '--profiles',
+                        required=False,
+                        action='store',
+                        help='How many profiles in the credentials file (default is 5)')
+
+    return (parser.parse_args())
+
+## answers every request with an empty response and remembers when it came in and what it was
+class StubEndpoint(http.server.BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+    disable_nagle_algorithm = True
+
+    # (time, "service.Action") for every request since the list was last cleared
+    requests = []
+
+    def log_message(self, *args):
+        pass
+
+    def do_POST(self):
+        now = time.time()
+        body = self.rfile.read(int(self.headers.get('Content-Length', 0))).decode()
+
+        # the access key is KEY<n> for profile n, which is account first_account + n
+        match = re.search(r'Credential=KEY(\d+)/', self.headers.get('Authorization', ''))
+        if match:
+            account = str(first_account + int(match.group(1)))
+        else:
+            account = default_account
+
+        target = self.headers.get('X-Amz-Target')
+        if target:
+            # SSM speaks JSON
+            self.requests.append((now, 'ssm.' + target.split('.')[-1]))
+            out = json.dumps({"InstanceInformationList": []}).encode()
+            content_type = 'application/x-amz-json-1.1'
+        else:
+            action = urllib.parse.parse_qs(body)['Action'][0]
+            if action == 'GetCallerIdentity':
+                self.requests.append((now, 'sts.' + action))
+                out = ('<GetCallerIdentityResponse xmlns="https://sts.amazonaws.com/doc/2011-06-15/"><GetCallerIdentityResult>'
+                       '<Arn>arn:aws:iam::' + account + ':user/bench</Arn><UserId>bench</UserId><Account>' + account + '</Account>'
+                       '</GetCallerIdentityResult><ResponseMetadata><RequestId>1</RequestId></ResponseMetadata></GetCallerIdentityResponse>').encode()
+            else:
+                self.requests.append((now, 'ec2.' + action))
+                if action == 'DescribeRegions':
+                    inner = '<regionInfo><item><regionName>us-east-1</regionName></item><item><regionName>eu-west-1</regionName></item></regionInfo>'
+                else:
+                    inner = ''.join('<' + s + '/>' for s in ec2_result_sets)
+                out = ('<' + action + 'Response xmlns="http://ec2.amazonaws.com/doc/2016-11-15/"><requestId>1</requestId>' +
+                       inner + '</' + action + 'Response>').encode()
+            content_type = 'text/xml'
+
+        self.send_response(200)
+        self.send_header('Content-Type', content_type)
+        self.send_header('Content-Length', str(len(out)))
+        self.end_headers()
+        self.wfile.write(out)
+
+def milliseconds(seconds):
+    return '%7.1f' % (seconds * 1000)
+
+def main():
+    args = setup_args()
+
+    if args.runs:
+        runs = int(args.runs)
+    else:
+        runs = 7
+
+    if args.profiles:
+        profiles = int(args.profiles)
+    else:
+        profiles = 5
+
+    repo = os.path.dirname(os.path.abspath(__file__))
+    server = http.server.ThreadingHTTPServer(('127.0.0.1', 0), StubEndpoint)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+
+    work = tempfile.mkdtemp(prefix='bench_startup.')
+    with open(os.path.join(work, 'credentials'), 'w', encoding='utf-8') as f:
+        for i in range(profiles):
+            if i == 0:
+                f.write('[default]\n')
+            else:
+                f.write('[profile' + str(i) + ']\n')
+            f.write('aws_access_key_id=KEY' + str(i) + '\naws_secret_access_key=bench\n')
+    with open(os.path.join(work, 'volumes.csv'), 'w', encoding='utf-8') as f:
+        for i in range(profiles):
+            f.write('vol-' + str(i).zfill(17) + ',' + str(first_account + i) + ',us-east-1,"bench"\n')
+
+    # HOME points at the throwaway directory too, so nothing from ~/.aws or ~/.cache gets in
+    env = dict(os.environ,
+               AWS_ENDPOINT_URL='http://127.0.0.1:' + str(server.server_port),
+               AWS_SHARED_CREDENTIALS_FILE=os.path.join(work, 'credentials'),
+               AWS_CONFIG_FILE=os.path.join(work, 'config'),
+               AWS_DEFAULT_REGION='us-east-1',
+               HOME=work)
+
+    cases = [
+        ('ec2-ssm.py -a True', ['ec2-ssm.py', '-a', 'True', '--cache', 'False', '--rate-limit', 'False']),
+        ('ebs-discover-stale-volumes.py -a True', ['ebs-discover-stale-volumes.py', '-a', 'True', '--cache', 'False', '--rate-limit', 'False']),
+        ('ebs-discover-stale-volumes.py -p default', ['ebs-discover-stale-volumes.py', '-p', 'default', '--cache', 'False', '--rate-limit', 'False']),
+        ('ebs-snapshot-to-archive.py -a True --preflight only', ['ebs-snapshot-to-archive.py', '-a', 'True', '-f', os.path.join(work, 'volumes.csv'), '--preflight', 'only']),
+    ]
+
+    print('%-52s %9s %9s %9s %6s' % ('case (' + str(profiles) + ' profiles, median of ' + str(runs) + ', ms)', 'first', 'first ec2', 'exit', 'calls'))
+    for name, argv in cases:
+        first, first_ec2, total, calls = [], [], [], []
+        for _ in range(runs):
+            del StubEndpoint.requests[:]
+            start = time.time()
+            process = subprocess.run([sys.executable, os.path.join(repo, argv[0])] + argv[1:], cwd=work, env=env, capture_output=True, text=True)
+            end = time.time()
+            ec2_times = [t for t, action in StubEndpoint.requests if action.startswith('ec2.')]
+            if len(ec2_times) == 0:
+                print(name + " made no EC2 calls, its output was:")
+                print(process.stdout[-2000:] + process.stderr[-2000:])
+                return 1
+            first.append(min(t for t, action in StubEndpoint.requests) - start)
+            first_ec2.append(min(ec2_times) - start)
+            total.append(end - start)
+            calls.append(len(StubEndpoint.requests))
+        print('%-52s %9s %9s %9s %6d' % (name, milliseconds(statistics.median(first)), milliseconds(statistics.median(first_ec2)),
+                                         milliseconds(statistics.median(total)), statistics.median(calls)))
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,142 @@
+#!/usr/bin/python3
+
+"""
+Follows up on a run of ebs-snapshot-to-archive.py: reads the snapshots it wrote to archived_snapshots_output.csv and
+keeps polling their archive tier status until every one of them is archival-completed or archival-failed, showing the
+counts per state and a rough ETA as it goes.  Moving a snapshot to the archive tier can take hours, so this saves
+checking them one at a time in the console.
+
+The status is fetched with describe_snapshot_tier_status filtered by snapshot id, a batch of ids per call, once per
+account/region on every poll, no matter how many snapshots there are.
+
+arguments:
+
+    -f or --filename [full path to the file]
+        The output of ebs-snapshot-to-archive.py (default is archived_snapshots_output.csv)
+
+    -p or --profile [String]
+        Specify the AWS client profile to use - found under ~/.aws/credentials
+        If you don't have multiple profiles, leave this alone
+
+    -a or --allprofilesallregions [True/False]
+        Use all configured AWS CLI profiles on this local machine, matching each account in the file to a profile
+        (default is False)
+
+    -i or --interval [seconds]
+        How long to wait between polls (default is 60)
+
+    --trace [full path to the file]
+        Record a timeline of the run (profile, STS, each status poll and every API call, per thread) as Chrome Trace Event JSON
+        that opens in https://ui.perfetto.dev or chrome://tracing.  See aws_trace.py
+
+prerequisites:
+
+    pip3 install boto3
+    pip3 install argparse
+
+examples:
+
+    python3 ebs-archive-status.py -a True
+
+        Tracks the snapshots from the last ebs-snapshot-to-archive.py run in this directory until they're all done
+
+    python3 ebs-archive-status.py -p myprofile -f ./archived_snapshots_output.csv -i 300
+"""
+
+import boto3
+import argparse
+import sys
+import aws_trace
+import ebs_archive
+
+def setup_args():
+    parser = argparse.ArgumentParser(
+        description='Optional arguments')
+
+    parser.add_argument('-f', '--filename',
+                        required=False,
+                        action='store',
+                        help='Output file of ebs-snapshot-to-archive.py')
+
+    parser.add_argument('-p', '--profile',
+                        required=False,
+                        action='store',
+                        help='If you want to use a non-default profile')
+
+    parser.add_argument('-a', '--allprofilesallregions',
+                        required=False,
+                        action='store',
+                        help='If you want to use all local profiles')
+
+    parser.add_argument('-i', '--interval',
+                        required=False,
+                        action='store',
+                        help='Seconds between polls (default is 60)')
+
+    parser.add_argument('--trace',
+                        required=False,
+                        action='store',
+                        help='Write a Chrome trace of the run to this file')
+
+    return (parser.parse_args())
+
+def main():
+    args = setup_args()
+
+    if args.filename:
+        filename = str(args.filename)
+    else:
+        filename = "archived_snapshots_output.csv"
+
+    if args.profile:
+        profile = str(args.profile)
+    else:
+        profile = "noprofile"
+
+    if args.interval:
+        interval = int(args.interval)
+    else:
+        interval = 60
+
+    ## everything from here on is timed when --trace is on, the file is written on the way out
+    if args.trace:
+        aws_trace.start(str(args.trace), "ebs-archive-status.py")
+
+    if args.allprofilesallregions == "True" or args.allprofilesallregions == "true":
+        profile_list = boto3.session.Session().available_profiles
+    else:
+        profile_list = profile.split()
+
+    snapshots = ebs_archive.read_archived_snapshots(filename)
+    if len(snapshots) == 0:
+        sys.exit("No snapshots found in " + filename)
+
+    # work out which profile gets us into each account
+    session_dict = ebs_archive.account_sessions(profile_list)
+
+    groups = {}
+    for (this_account, this_region), snapshot_ids in snapshots.items():
+        if this_account not in session_dict:
+            print("ERROR: account " + this_account + " has no matching local profile/credentials, skipping its " + str(len(snapshot_ids)) + " snapshots")
+            continue
+        groups[(this_account, this_region)] = (session_dict[this_account].client('ec2', region_name=this_region), snapshot_ids)
+
+    print("Tracking " + str(sum(len(ids) for _, ids in groups.values())) + " snapshots in " + str(len(groups)) + " account/regions, polling every " + str(interval) + "s")
+    with aws_trace.span("track"):
+        final = ebs_archive.track_tiering(groups, interval)
+
+    failed = [snapshot_id for snapshot_id, status in final.items() if status.endswith("-failed")]
+    missing = [snapshot_id for snapshot_id, status in final.items() if status == "not-found"]
+    unknown = [snapshot_id for snapshot_id, status in final.items() if status == "unknown"]
+    print(" ")
+    print("Done: " + str(len(final) - len(failed) - len(missing) - len(unknown)) + " archived, " + str(len(failed)) + " failed, " + str(len(missing)) + " not found, " + str(len(unknown)) + " unknown")
+    for snapshot_id in failed:
+        print("FAILED: " + snapshot_id + " did not make it to the archive tier, you will need to manually tier this one down")
+    for snapshot_id in unknown:
+        print("UNKNOWN: couldn't get the tier status of " + snapshot_id + ", run this again to check on it")
+
+    if len(failed) > 0:
+        return 1
+
+if __name__ == "__main__":
+    exit(main())
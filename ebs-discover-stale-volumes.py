@@ -18,6 +18,85 @@ arguments:
         Note: The script looks for profiles that point to the same account ID and will ignore all duplicates after the first
               This is common when one has a default profile AND an explicit profile pointing to the same account
 
+    --cache [True/False]
+        Serve repeat describe calls from the local inventory cache in ~/.cache/aws-admin-scripts (default is False)
+        Cached answers can be minutes old, see aws_inventory_cache.py for the per-call TTLs
+        --archive always rechecks its picks against the API before snapshotting
+
+    --max-age [seconds]
+        Override every inventory cache TTL.  0 means always go to the API (the cache is still refreshed)
+
+    --rate-limit [True/False/shared]
+        Keep the API calls under a per account/region/service budget with a client side token bucket (default is False)
+        Retries count against the budget too, every attempt waits for its own token
+        "shared" shares the budget with every other script running with "shared" at the same time, through a locked
+        file in ~/.cache/aws-admin-scripts, so overlapping jobs don't throttle each other.  See aws_rate_limit.py
+
+    --rate-limit-file [full path to the file]
+        Share the budget through this file instead (implies --rate-limit shared)
+
+    --trace [full path to the file]
+        Record a timeline of the run (profile, region, phase and every API call, per thread) as Chrome Trace Event JSON
+        that opens in https://ui.perfetto.dev or chrome://tracing.  See aws_trace.py
+
+    -i or --idle [days]
+        Also look at attached volumes, using their CloudWatch VolumeReadOps/VolumeWriteOps/VolumeIdleTime over the last
+        [days] days.  In-use volumes are listed when their average IOPS over that window is at or under --max-iops, and
+        every row gets four extra columns: "Vol State", "Days Since Last IO" (">N" if there was none in the window),
+        "Avg IOPS" and "Pct Time Idle" (of the days the volume reported, "unknown" if it reported none)
+        A volume whose metrics didn't come back complete, or that has no read/write data points at all, shows "unknown"
+        and is never listed for being idle
+        The metrics come from get_metric_data, three plain queries per volume and 500 per call, so 10,000 volumes take
+        about 60 calls per region (more only when a call hits the data point limit and pages)
+
+    --max-iops [Number]
+        With --idle, the highest average IOPS an in-use volume can have and still be listed (default is 1)
+
+    -s or --stopped [days]
+        Also list in-use volumes whose instance has been stopped for more than [days] days
+        Every row gets two extra columns: "Instance ID" and "Stopped Days" (empty unless the instance is stopped)
+        The stop date comes from the instance's StateTransitionReason, or UsageOperationUpdateTime when that has no date
+
+    -c or --costs [full path to a file]
+        Work out what every listed volume costs per month and write the totals per account, region and volume type
+        (plus a subtotal per account and a grand total) to this CSV once the report is done
+        Every row gets three extra columns: "Monthly Cost", "Archive Snap Monthly Cost" (its snapshots already in the
+        archive tier) and "Monthly Cost If Archived" (the volume kept as an archive tier snapshot instead)
+
+    --prices [full path to a JSON file]
+        Override any of the bundled EBS prices, see ebs_pricing.py for the format
+        Only us-east-1, us-east-2, us-west-2 and eu-west-1 are bundled, other regions are priced at us-east-1 rates
+        (with a note for each one at the end of the run) unless the file has an entry for them
+
+    --archive [True/False]
+        Snapshot every listed volume that passes the rules below and move the snapshot to the archive tier, the same
+        way ebs-snapshot-to-archive.py does (default is False).  Each region's picks are checked again on a live
+        (uncached) client and go onto the archive queue as soon as that region is listed, so snapshots are already
+        being taken while discovery is still paging through the other regions
+        The volumes that were archived are written to --actioned in ebs-snapshot-to-archive.py's CSV format
+
+    --min-age [days]
+        With --archive, only volumes created more than this many days ago (default is 0)
+
+    --min-size / --max-size [GB]
+        With --archive, only volumes at least / at most this big
+
+    --tag [Key=Value,...]
+        With --archive, only volumes that have all of these tags
+
+    --exclude-tag [Key=Value,...]
+        With --archive, never volumes that have any of these tags
+
+    --archived-within [days]
+        With --archive, skip volumes that already have a snapshot in the archive tier, or one from an earlier archive
+        run that is still tiering down, from the last [days] days (default is 90)
+
+    --workers [Number]
+        With --archive, how many volumes are snapshotted at the same time (default is 4)
+
+    --actioned [full path to a file]
+        Where --archive writes the volumes it archived (default is archived_volumes.csv)
+
 prerequisites:
 
     pip install boto3
@@ -37,10 +116,39 @@ example 2 (all profiles all regions)
 
         The example above loops over all local AWS CLI profiles configured on this box AND pulls data from all regions
         Note: This can take a long time to run if you have more than a couple profiles
+
+example 3 (attached volumes nobody uses)
+
+    python ebs-discover-stale-volumes.py -r eu-west-1 -i 30 > mycsv.csv
+
+        Unattached volumes plus any attached ones that averaged 1 IOPS or less over the last 30 days
+
+    python ebs-discover-stale-volumes.py -a True -s 90 > mycsv.csv
+
+        Unattached volumes plus the ones attached to instances that have been stopped for more than 90 days
+
+    python ebs-discover-stale-volumes.py -a True -c ./stale-costs.csv > mycsv.csv
+
+        Every unattached volume with its monthly cost, and the dollars per account/region/type in stale-costs.csv
+
+    python ebs-discover-stale-volumes.py -a True --archive True --min-age 180 --exclude-tag Keep=true > mycsv.csv
+
+        Archives every unattached volume older than six months that isn't tagged Keep=true and wasn't archived recently
 """
 
 import boto3
 import argparse
+import re
+import sys
+import aws_inventory_cache
+import aws_rate_limit
+import aws_records
+import aws_session
+import aws_trace
+from datetime import datetime, timedelta, timezone
+
+## get_metric_data takes at most 500 queries per call
+max_metric_queries_per_call = 500
 
 def setup_args():
     parser = argparse.ArgumentParser(
@@ -66,11 +174,265 @@ def setup_args():
                         action='store',
                         help='If you want to loop over all local profiles and pull from all regions')
 
+    parser.add_argument('--cache',
+                        required=False,
+                        action='store',
+                        help='Serve repeat describe calls from the local inventory cache (default is False)')
+
+    parser.add_argument('--max-age',
+                        required=False,
+                        action='store',
+                        help='Override the inventory cache TTLs, in seconds (0 forces fresh data)')
+
+    parser.add_argument('--rate-limit',
+                        required=False,
+                        action='store',
+                        help='Client side API rate limiting, True/False/shared (default is False)')
+
+    parser.add_argument('--rate-limit-file',
+                        required=False,
+                        action='store',
+                        help='File to share the API budget with other scripts through')
+
+    parser.add_argument('--trace',
+                        required=False,
+                        action='store',
+                        help='Write a Chrome trace of the run to this file')
+
+    parser.add_argument('-i', '--idle',
+                        required=False,
+                        action='store',
+                        help='Lookback in days for CloudWatch I/O metrics, also lists idle attached volumes')
+
+    parser.add_argument('--max-iops',
+                        required=False,
+                        action='store',
+                        help='Highest average IOPS an attached volume can have to count as idle (default is 1)')
+
+    parser.add_argument('-s', '--stopped',
+                        required=False,
+                        action='store',
+                        help='Also list volumes attached to instances stopped for more than this many days')
+
+    parser.add_argument('-c', '--costs',
+                        required=False,
+                        action='store',
+                        help='CSV to write the monthly cost totals to')
+
+    parser.add_argument('--prices',
+                        required=False,
+                        action='store',
+                        help='JSON file with EBS prices to override')
+
+    parser.add_argument('--archive',
+                        required=False,
+                        action='store',
+                        help='Snapshot and archive the volumes that pass the selection rules (default is False)')
+
+    parser.add_argument('--min-age',
+                        required=False,
+                        action='store',
+                        help='Only archive volumes created more than this many days ago')
+
+    parser.add_argument('--min-size',
+                        required=False,
+                        action='store',
+                        help='Only archive volumes of at least this many GB')
+
+    parser.add_argument('--max-size',
+                        required=False,
+                        action='store',
+                        help='Only archive volumes of at most this many GB')
+
+    parser.add_argument('--tag',
+                        required=False,
+                        action='store',
+                        help='Only archive volumes with all of these Key=Value tags (comma separated)')
+
+    parser.add_argument('--exclude-tag',
+                        required=False,
+                        action='store',
+                        help='Never archive volumes with any of these Key=Value tags (comma separated)')
+
+    parser.add_argument('--archived-within',
+                        required=False,
+                        action='store',
+                        help='Skip volumes with an archive tier snapshot from the last this many days (default is 90)')
+
+    parser.add_argument('--workers',
+                        required=False,
+                        action='store',
+                        help='Volumes to snapshot at the same time (default is 4)')
+
+    parser.add_argument('--actioned',
+                        required=False,
+                        action='store',
+                        help='CSV of the volumes that were archived (default is archived_volumes.csv)')
+
     return (parser.parse_args())
 
+## daily read and write op counts and idle time for every volume over the lookback window, batched 500 plain
+## MetricStat queries to a get_metric_data call (three per volume) instead of one get_metric_statistics per volume
+## and metric.  Metric math (m1+m2) doesn't lower the call count, the hidden inputs count against the 500 as well
+## returns {vol_id: (days since the last day with any I/O or None if there wasn't one, average IOPS,
+##                   percent of the reported time the volume was idle or None if it reported none)}
+## or {vol_id: None} when its numbers can't be trusted: a query that didn't come back Complete (throttled,
+## InternalError, Forbidden, ...) or no read/write data points at all, so it's never mistaken for an idle volume
+def get_volume_io(cw_client, volumes, lookback_days, log=print):
+    end_time = datetime.now(timezone.utc).replace(minute=0, second=0, microsecond=0)
+    start_time = end_time - timedelta(days=lookback_days)
+
+    queries = []
+    query_volume = {}
+    for i, volume in enumerate(volumes):
+        for metric in ["VolumeReadOps", "VolumeWriteOps", "VolumeIdleTime"]:
+            query_id = "v" + str(i) + metric[6].lower()
+            query_volume[query_id] = (volume.volume_id, metric)
+            queries.append({
+                'Id': query_id,
+                'MetricStat': {
+                    'Metric': {
+                        'Namespace': 'AWS/EBS',
+                        'MetricName': metric,
+                        'Dimensions': [{'Name': 'VolumeId', 'Value': volume.volume_id}]
+                    },
+                    'Period': 86400,
+                    'Stat': 'Sum'
+                },
+                'ReturnData': True
+            })
+
+    # ops per volume per day, read and write added together, and idle seconds per volume per day
+    daily_ops = {volume.volume_id: {} for volume in volumes}
+    daily_idle = {volume.volume_id: {} for volume in volumes}
+    # volumes with a query that came back anything but Complete, and volumes with any read/write data point
+    incomplete = set()
+    reported = set()
+    for start in range(0, len(queries), max_metric_queries_per_call):
+        request = {
+            'MetricDataQueries': queries[start:start + max_metric_queries_per_call],
+            'StartTime': start_time,
+            'EndTime': end_time,
+        }
+        while True:
+            try:
+                response = cw_client.get_metric_data(**request)
+            except Exception as exc:
+                # the whole batch is unknown rather than idle
+                log("couldn't get the CloudWatch metrics of " + str(len(request['MetricDataQueries']) // 3) + " volumes: " + str(exc))
+                incomplete.update(query_volume[q['Id']][0] for q in request['MetricDataQueries'])
+                break
+            for result in response['MetricDataResults']:
+                vol_id, metric = query_volume[result['Id']]
+                # PartialData with a NextToken just means the rest is on the next page
+                status = result.get('StatusCode')
+                if status != 'Complete' and not (status == 'PartialData' and 'NextToken' in response):
+                    incomplete.add(vol_id)
+                if metric == "VolumeIdleTime":
+                    days = daily_idle[vol_id]
+                else:
+                    days = daily_ops[vol_id]
+                    if len(result['Values']) > 0:
+                        reported.add(vol_id)
+                for timestamp, value in zip(result['Timestamps'], result['Values']):
+                    days[timestamp] = days.get(timestamp, 0) + value
+            if 'NextToken' not in response:
+                break
+            request['NextToken'] = response['NextToken']
+
+    volume_io = {}
+    for volume in volumes:
+        if volume.volume_id in incomplete or volume.volume_id not in reported:
+            volume_io[volume.volume_id] = None
+            continue
+
+        days = daily_ops[volume.volume_id]
+        active_days = [timestamp for timestamp, ops in days.items() if ops > 0]
+        if len(active_days) > 0:
+            # counted from the end of the last day that had any I/O
+            days_since_io = max((end_time - max(active_days) - timedelta(days=1)).days, 0)
+        else:
+            days_since_io = None
+
+        # a volume created inside the window only gets averaged over the time it has existed (at least an hour)
+        seconds = max((end_time - max(start_time, volume.create_time)).total_seconds(), 3600)
+
+        # idle time is only reported while the volume is attached, so it's measured against the days it reported
+        idle = daily_idle[volume.volume_id]
+        if len(idle) > 0:
+            idle_pct = min(sum(idle.values()) / (len(idle) * 86400) * 100, 100)
+        else:
+            idle_pct = None
+
+        volume_io[volume.volume_id] = (days_since_io, sum(days.values()) / seconds, idle_pct)
+
+    return volume_io
+
+## when a stopped instance was stopped, or None if we can't tell
+## StateTransitionReason reads like "User initiated (2023-01-05 12:34:56 GMT)", UsageOperationUpdateTime is the fallback
+def get_stop_time(instance):
+    match = re.search(r'\((\d{4}-\d{2}-\d{2} \d{2}:\d{2}:\d{2}) (?:GMT|UTC)\)', instance.get('StateTransitionReason', ''))
+    if match:
+        return datetime.strptime(match.group(1), '%Y-%m-%d %H:%M:%S').replace(tzinfo=timezone.utc)
+    return instance.get('UsageOperationUpdateTime')
+
+## every stopped instance in the region in a few paginated calls, so volumes can be joined to them by instance id
+## returns {instance_id: stop time or None}
+def get_stopped_instances(ec2_client):
+    stopped_instances = {}
+    paginator = ec2_client.get_paginator('describe_instances')
+    for page in paginator.paginate(Filters=[{'Name': 'instance-state-name', 'Values': ['stopped']}], PaginationConfig={'PageSize': 1000}):
+        for reservation in page['Reservations']:
+            for instance in reservation['Instances']:
+                stopped_instances[instance['InstanceId']] = get_stop_time(instance)
+    return stopped_instances
+
+## the instance a volume is attached to and how many days it has been stopped (None if it's running or we can't tell)
+## a multi-attach volume only counts as stopped when every instance it's attached to is, and then by the most recent stop
+def get_stopped_attachment(volume, stopped_instances):
+    instance_ids = list(volume.instance_ids)
+    if len(instance_ids) == 0:
+        return "", None
+
+    now = datetime.now(timezone.utc)
+    stopped_for = []
+    for instance_id in instance_ids:
+        if stopped_instances.get(instance_id) is None:
+            return " ".join(instance_ids), None
+        stopped_for.append((now - stopped_instances[instance_id]).days)
+    return " ".join(instance_ids), min(stopped_for)
+
+## turn "Key=Value,Key2=Value2" into a list of (key, value) pairs
+def parse_tag_rules(tag_rules):
+    if not tag_rules:
+        return []
+    return [tuple(rule.split("=", 1)) for rule in str(tag_rules).split(",") if "=" in rule]
+
+## whether a listed volume passes the --archive selection rules
+## recent snapshots are checked later on a live client, see ebs_archive.confirm_archive_candidates
+def archive_selected(volume, rules):
+    now = datetime.now(timezone.utc)
+    tags = volume.tags
+
+    if (now - volume.create_time).days < rules["min_age"]:
+        return False
+    if rules["min_size"] is not None and volume.size < rules["min_size"]:
+        return False
+    if rules["max_size"] is not None and volume.size > rules["max_size"]:
+        return False
+    if any(tag not in tags for tag in rules["tags"]):
+        return False
+    if any(tag in tags for tag in rules["exclude_tags"]):
+        return False
+    return True
+
 def main():
     args = setup_args()
 
+    ## everything from here on is timed when --trace is on, the file is written on the way out
+    if args.trace:
+        aws_trace.start(str(args.trace), "ebs-discover-stale-volumes.py")
+
     if args.region:
         region = str(args.region)
     else:
@@ -92,11 +454,78 @@ def main():
     else:
         allprofilesallregions = False
 
+    if args.idle:
+        idle_days = int(args.idle)
+    else:
+        idle_days = 0
+
+    if args.max_iops:
+        max_iops = float(args.max_iops)
+    else:
+        max_iops = 1.0
+
+    if args.stopped:
+        stopped_days = int(args.stopped)
+    else:
+        stopped_days = 0
+
+    ## costs are added to the rollup as each row is printed, so nothing has to be read back afterwards
+    ## ebs_pricing and ebs_archive are only imported for the options that use them, a plain report doesn't load them
+    if args.costs:
+        import ebs_pricing
+        prices = ebs_pricing.load_prices(args.prices)
+        cost_rollup = ebs_pricing.CostRollup()
+        # regions that had listed volumes but no entry of their own in the price table
+        default_priced_regions = set()
+    else:
+        cost_rollup = None
+
+    ## with --archive the listed volumes that pass these rules are queued for snapshot + archive region by region
+    if args.archive == "True" or args.archive == "true":
+        archive_rules = {
+            "min_age": int(args.min_age) if args.min_age else 0,
+            "min_size": int(args.min_size) if args.min_size else None,
+            "max_size": int(args.max_size) if args.max_size else None,
+            "tags": parse_tag_rules(args.tag),
+            "exclude_tags": parse_tag_rules(args.exclude_tag),
+            "archived_within": int(args.archived_within) if args.archived_within else 90,
+        }
+        # progress goes to stderr so stdout stays a clean CSV
+        import ebs_archive
+        archive_engine = ebs_archive.ArchiveEngine(int(args.workers) if args.workers else 4, log=lambda *a: print(*a, file=sys.stderr))
+        archived_notes = "stale volume archived by ebs-discover-stale-volumes.py on " + datetime.utcnow().strftime('%Y-%m-%d')
+    else:
+        archive_engine = None
+
+    if args.actioned:
+        actioned_file = str(args.actioned)
+    else:
+        actioned_file = "archived_volumes.csv"
+
+    ## with --cache True, repeat runs within the TTLs are served from the local inventory cache instead of the API
+    if args.cache == "True" or args.cache == "true":
+        if args.max_age:
+            inventory_cache = aws_inventory_cache.InventoryCache(max_age=int(args.max_age))
+        else:
+            inventory_cache = aws_inventory_cache.InventoryCache()
+    else:
+        inventory_cache = None
+
+    ## a token bucket per account/region/service keeps us under the API limits, optionally shared with other scripts
+    if args.rate_limit_file:
+        rate_limiter = aws_rate_limit.RateLimiter(state_file=str(args.rate_limit_file))
+    elif args.rate_limit == "shared":
+        rate_limiter = aws_rate_limit.RateLimiter(state_file=aws_rate_limit.default_state_file)
+    elif args.rate_limit == "True" or args.rate_limit == "true":
+        rate_limiter = aws_rate_limit.RateLimiter()
+    else:
+        rate_limiter = None
+
     ## Addresses the case where user just wants to use environment variables or default profile
     if (profile == "noprofile"):
-        session = boto3.Session()
+        session = aws_session.new_session()
     else:
-        session = boto3.Session(profile_name=profile)
+        session = aws_session.new_session(profile)
 
     ## If profile is set to "all", get a list of available local profiles on this box
     if allprofilesallregions == "True" or allprofilesallregions == "true":
@@ -128,7 +557,10 @@ def main():
             "GB Size" + "," +
             "Created" + "," +            
             "Snaps in Archive" + "," +
-            "Most Recent Snap in Archive"
+            "Most Recent Snap in Archive" +
+            ("," + "Vol State" + "," + "Days Since Last IO" + "," + "Avg IOPS" + "," + "Pct Time Idle" if idle_days > 0 else "") +
+            ("," + "Instance ID" + "," + "Stopped Days" if stopped_days > 0 else "") +
+            ("," + "Monthly Cost" + "," + "Archive Snap Monthly Cost" + "," + "Monthly Cost If Archived" if cost_rollup else "")
         )
 
     # set up an empty list to track account ids and errors
@@ -139,13 +571,18 @@ def main():
     error_list = []
 
     for this_profile in profile_list:
+        profile_span = aws_trace.begin(this_profile, "profile")
+
         # Open a session and get the info for list particular profile
         # UNLESS they didn't specify a profile at all in which case just use env vars or whatever they're doing
         if this_profile == "noprofile":
-            session = boto3.Session()
+            session = aws_session.new_session()
+            archive_session = aws_session.new_session()
         else:
-            session = boto3.Session(profile_name=this_profile)
+            session = aws_session.new_session(this_profile)
+            archive_session = aws_session.new_session(this_profile)
 
+        sts_span = aws_trace.begin("sts")
         try:
             STS_CLIENT = session.client('sts')
             CURRENT_ACCOUNT_ID = STS_CLIENT.get_caller_identity()['Account']
@@ -154,43 +591,71 @@ def main():
             if CURRENT_ACCOUNT_ID not in account_id_list:
                 account_id_list.append(CURRENT_ACCOUNT_ID)
                 continue_listing = True
+                aws_inventory_cache.enable_cache(session, CURRENT_ACCOUNT_ID, inventory_cache)
+                aws_rate_limit.enable_rate_limit(session, CURRENT_ACCOUNT_ID, rate_limiter)
+                aws_rate_limit.enable_rate_limit(archive_session, CURRENT_ACCOUNT_ID, rate_limiter)
+                aws_trace.enable_tracing(session, CURRENT_ACCOUNT_ID)
+                aws_trace.enable_tracing(archive_session, CURRENT_ACCOUNT_ID)
             else:
                 continue_listing = False
         except:
             error_list.append("ERROR: cannot get the current Account ID from the STS service for profile " + this_profile + ".  This can be caused by a profile meant for a snow family device or insufficient permissions")
             continue_listing = False
+        sts_span.end()
 
         if continue_listing == True:
             # Loop over the region_list, which is either a single specified region or all of them
             for this_region in region_list:
+                region_span = aws_trace.begin(this_region, "region", {'account': CURRENT_ACCOUNT_ID})
+                describe_span = aws_trace.begin("describe")
                 ## boto3 is the main python sdk for AWS
                 ## you open connections on a per-service basis
-                ec2 = session.resource('ec2',region_name=this_region)
+                ec2_client = session.client('ec2',region_name=this_region)
 
-                ## retrieve all ebs volume info in the target region
-                vol_data = ec2.volumes.filter(
-                    Filters=[
-                        {
-                            'Name': 'status',
-                            'Values': [
-                                'available',
-                            ]           
-                        }
-                    ]
-                )
+                ## the archive engine gets a client without the inventory cache, its snapshot waiter needs live answers
+                if archive_engine:
+                    archive_client = archive_session.client('ec2',region_name=this_region)
 
-                ## retrieve all snapshots owned by this account in this region, excluding the many public ones
-                snap_data = ec2.snapshots.filter(
+                ## retrieve all ebs volume info in the target region
+                ## with --idle or --stopped we need the attached ones as well
+                ## both are kept as compact records with just the fields the report uses
+                volume_pages = ec2_client.get_paginator('describe_volumes')
+                if idle_days > 0 or stopped_days > 0:
+                    vol_data = list(aws_records.page_records(volume_pages.paginate(), 'Volumes', aws_records.volume_record))
+                    if idle_days > 0:
+                        volume_io = get_volume_io(session.client('cloudwatch', region_name=this_region), vol_data, idle_days, log=lambda *a: print(*a, file=sys.stderr))
+                    if stopped_days > 0:
+                        stopped_instances = get_stopped_instances(ec2_client)
+                else:
+                    vol_data = aws_records.page_records(
+                        volume_pages.paginate(
+                            Filters=[
+                                {
+                                    'Name': 'status',
+                                    'Values': [
+                                        'available',
+                                    ]
+                                }
+                            ]
+                        ),
+                        'Volumes', aws_records.volume_record
+                    )
+
+                ## retrieve the completed archive tier snapshots owned by this account in this region, excluding the many public ones
+                ## indexed by volume id once, rather than going through all of them for every volume
+                snaps_by_volume = {}
+                snapshot_pages = ec2_client.get_paginator('describe_snapshots').paginate(
+                    OwnerIds=[
+                        CURRENT_ACCOUNT_ID,
+                    ],
                     Filters=[
                         {
                             'Name': 'status',
                             'Values': [
                                 'completed',
-                            ],
-                            'Name': 'owner-id',
-                            'Values': [
-                                CURRENT_ACCOUNT_ID,
-                            ],
+                            ]
+                        },
+                        {
                             'Name': 'storage-tier',
                             'Values': [
                                 'archive',
@@ -198,21 +663,22 @@ def main():
                         }
                     ]
                 )
+                for snap in aws_records.page_records(snapshot_pages, 'Snapshots', aws_records.snapshot_record):
+                    snaps_by_volume.setdefault(snap.volume_id, []).append(snap)
 
                 ## set up how we want our dates formatted
                 date_format_str = '%B %Y'
 
+                describe_span.end()
+                join_span = aws_trace.begin("join")
+                archive_candidates = []
+
                 ## loop over the list retrieved from ec2
                 for volume in vol_data:
 
-                    vol_name = "unnamed"
+                    vol_name = volume.name
 
-                    if volume.tags:
-                        for t in volume.tags:
-                            if t["Key"] == 'Name':
-                                vol_name = t["Value"]  
-
-                    vol_id = str(volume.id)
+                    vol_id = str(volume.volume_id)
                     vol_type = str(volume.volume_type)
                     vol_az = str(volume.availability_zone)
                     vol_size = str(volume.size)
@@ -222,10 +688,11 @@ def main():
                     
                     snaps_in_volume=0
                     snaps_in_volume_list=[]
-                    for snap in snap_data:
-                        if snap.volume_id == vol_id:
-                            snaps_in_volume=snaps_in_volume+1
-                            snaps_in_volume_list.append(snap.start_time)
+                    snaps_in_volume_gb=0
+                    for snap in snaps_by_volume.get(vol_id, []):
+                        snaps_in_volume=snaps_in_volume+1
+                        snaps_in_volume_list.append(snap.start_time)
+                        snaps_in_volume_gb=snaps_in_volume_gb+snap.volume_size
 
                     most_recent_snap_date = 'none'
 
@@ -234,7 +701,51 @@ def main():
 
                     vol_archived = most_recent_snap_date
 
-                    if (vol_state) == "available":
+                    listed = vol_state == "available"
+                    io_columns = ""
+                    if idle_days > 0:
+                        if volume_io[vol_id] is None:
+                            # no trustworthy metrics, so it's never listed for being idle
+                            io_columns = "," + vol_state + ",unknown,unknown,unknown"
+                        else:
+                            days_since_io, avg_iops, idle_pct = volume_io[vol_id]
+                            if days_since_io is None:
+                                days_since_io = ">" + str(idle_days)
+                            if idle_pct is None:
+                                idle_pct = "unknown"
+                            else:
+                                idle_pct = str(round(idle_pct, 1))
+                            io_columns = "," + vol_state + "," + str(days_since_io) + "," + str(round(avg_iops, 3)) + "," + idle_pct
+
+                            # attached volumes only make the list when they've been (close to) idle
+                            if vol_state == "in-use" and avg_iops <= max_iops:
+                                listed = True
+
+                    stopped_columns = ""
+                    if stopped_days > 0:
+                        instance_id, stopped_for = get_stopped_attachment(volume, stopped_instances)
+                        if stopped_for is not None:
+                            stopped_columns = "," + instance_id + "," + str(stopped_for)
+                            if vol_state == "in-use" and stopped_for > stopped_days:
+                                listed = True
+                        else:
+                            stopped_columns = "," + instance_id + ","
+
+                    cost_columns = ""
+                    if listed and cost_rollup:
+                        monthly_cost = ebs_pricing.volume_monthly_cost(prices, this_region, vol_type, volume.size, volume.iops, volume.throughput)
+                        archive_snap_cost = ebs_pricing.archive_monthly_cost(prices, this_region, snaps_in_volume_gb)
+                        archived_cost = ebs_pricing.archive_monthly_cost(prices, this_region, volume.size)
+                        cost_rollup.add(CURRENT_ACCOUNT_ID, this_region, vol_type, volume.size, monthly_cost, archive_snap_cost, archived_cost)
+                        if not ebs_pricing.has_region_prices(prices, this_region):
+                            default_priced_regions.add(this_region)
+                        if monthly_cost is None:
+                            monthly_cost = "unknown"
+                        else:
+                            monthly_cost = str(round(monthly_cost, 2))
+                        cost_columns = "," + monthly_cost + "," + str(round(archive_snap_cost, 2)) + "," + str(round(archived_cost, 2))
+
+                    if listed:
 
                         print(
                             this_profile + "," +
@@ -248,9 +759,51 @@ def main():
                             vol_size + "," + 
                             vol_created + "," + 
                             str(snaps_in_volume) + "," +
-                            vol_archived
+                            vol_archived +
+                            io_columns +
+                            stopped_columns +
+                            cost_columns
                         )
+
+                        if archive_engine and archive_selected(volume, archive_rules):
+                            archive_candidates.append((vol_id, vol_state))
+
+                join_span.end()
+
+                ## the listing above may have come from the cache, so the picks are checked again on the live client
+                if archive_engine and len(archive_candidates) > 0:
+                    with aws_trace.span("archive check", args={'volumes': len(archive_candidates)}):
+                        try:
+                            confirmed, skipped = ebs_archive.confirm_archive_candidates(archive_client, archive_candidates, archive_rules["archived_within"])
+                        except Exception as exc:
+                            confirmed, skipped = [], []
+                            error_list.append("ERROR: couldn't check the archive candidates in " + CURRENT_ACCOUNT_ID + " " + this_region + ", none of them were archived: " + str(exc))
+                    for this_skipped in skipped:
+                        print("not archiving " + this_skipped, file=sys.stderr)
+                    for vol_id in confirmed:
+                        archive_engine.submit(archive_client, CURRENT_ACCOUNT_ID, this_region, vol_id, archived_notes)
+                region_span.end()
+
+        profile_span.end()
     
+    if archive_engine:
+        with aws_trace.span("archive wait"):
+            archive_engine.close()
+        error_list.extend(archive_engine.error_list)
+
+        # the same four columns ebs-snapshot-to-archive.py takes, so the run can be audited or repeated
+        with open(actioned_file, 'w', encoding='utf-8') as f:
+            for snapshot_id, volume_id, account_id, volume_region, notes in archive_engine.archived.values():
+                f.write(volume_id + "," + account_id + "," + volume_region + ",\"" + notes + "\"\n")
+        print("Snapshotted and started archiving " + str(archive_engine.archive_count) + " volumes (" +
+              str(archive_engine.skipped_count + archive_engine.archive_skipped_count) + " failed), written to " + actioned_file, file=sys.stderr)
+
+    if cost_rollup:
+        rows = cost_rollup.write(str(args.costs))
+        print("Monthly cost of the volumes listed: $" + str(rows[-1]["Monthly Cost"]) + ", totals written to " + str(args.costs) if rows else "No volumes listed, nothing to total", file=sys.stderr)
+        for this_region in sorted(default_priced_regions):
+            print("NOTE: no prices for " + this_region + " in the bundled table, its volumes are priced at us-east-1 rates (see --prices)", file=sys.stderr)
+
     # print out any error messages we flagged along the way
     for this_error in error_list:
         print(this_error)
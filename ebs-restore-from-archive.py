@@ -0,0 +1,395 @@
+#!/usr/bin/python3
+
+"""
+The way back from ebs-snapshot-to-archive.py: restores archive tier snapshots in bulk, e.g. for an audit or a DR drill.
+Reads the snapshots from archived_snapshots_output.csv (or a plain list of snapshot ids), asks for each of them to be
+restored with restore_snapshot_tier, either temporarily for a number of days or permanently, then polls
+describe_snapshot_tier_status until every restore has completed or failed.
+
+The restore requests go out in parallel across account/regions, but never faster than --rate per second in any one
+account/region, backing off when EC2 throttles anyway (or has a passing InternalError/connection problem).  Every
+request and result is appended to a journal file, so a run that's interrupted can just be started again: snapshots
+already restored are left alone, ones already requested are only tracked, and everything else (including failed ones)
+is requested (again).  The journal only counts for the same kind of restore (the same --days, or --permanent), and
+before a snapshot is skipped or only tracked its live tier status is checked, so a temporary restore that has since
+expired back to the archive tier (e.g. the last DR drill) is requested again.
+
+arguments:
+
+    -f or --filename [full path to the file]
+        The output of ebs-snapshot-to-archive.py (default is archived_snapshots_output.csv)
+
+    -s or --snapshots [full path to the file, or a comma separated list]
+        Snapshot ids to restore instead of --filename, one per line in a file or comma separated on the command line
+        These are all looked for in the account of --profile (or the default credentials) and in --region
+        Can't be used with -a True, the ids alone don't say which account they're in
+
+    -r or --region [String]
+        AWS region of the --snapshots list (default is us-east-1)
+
+    -d or --days [days]
+        Restore temporarily for this many days, after which the snapshots go back to the archive tier on their own
+
+    --permanent [True/False]
+        Move the snapshots back to the standard tier for good instead (default is False)
+        One of --days or --permanent True is required
+
+    -p or --profile [String]
+        Specify the AWS client profile to use - found under ~/.aws/credentials
+        If you don't have multiple profiles, leave this alone
+
+    -a or --allprofilesallregions [True/False]
+        Use all configured AWS CLI profiles on this local machine, matching each account in the file to a profile
+        (default is False)
+
+    --rate [requests per second]
+        Most restore requests per second in each account/region (default is 5)
+
+    -w or --workers [number]
+        How many account/regions to send restore requests to at the same time (default is 8)
+
+    -j or --journal [full path to the file]
+        Where progress is recorded and resumed from (default is restore_journal.csv)
+        Entries from a different kind of restore are ignored, and journaled snapshots are checked against their live
+        tier status before being skipped
+
+    -i or --interval [seconds]
+        How long to wait between status polls (default is 60)
+
+    --trace [full path to the file]
+        Record a timeline of the run (profile, STS, the restore requests of each account/region, each status poll and every API call, per thread) as Chrome Trace Event JSON
+        that opens in https://ui.perfetto.dev or chrome://tracing.  See aws_trace.py
+
+prerequisites:
+
+    pip3 install boto3
+    pip3 install argparse
+
+examples:
+
+    python3 ebs-restore-from-archive.py -a True -d 7
+
+        Restores everything from the last ebs-snapshot-to-archive.py run in this directory for a week
+
+    python3 ebs-restore-from-archive.py -p myprofile -r eu-west-1 -s snap-0123456789abcdef0,snap-0fedcba9876543210 --permanent True
+"""
+
+import boto3
+import argparse
+import csv
+import os
+import sys
+import threading
+import time
+import aws_trace
+import ebs_archive
+from datetime import datetime, timezone
+from concurrent.futures import ThreadPoolExecutor
+
+## how many times a throttled restore request is retried, waiting twice as long each time
+max_throttle_retries = 5
+
+def setup_args():
+    parser = argparse.ArgumentParser(
+        description='Optional arguments')
+
+    parser.add_argument('-f', '--filename',
+                        required=False,
+                        action='store',
+                        help='Output file of ebs-snapshot-to-archive.py')
+
+    parser.add_argument('-s', '--snapshots',
+                        required=False,
+                        action='store',
+                        help='File with one snapshot id per line, or a comma separated list of snapshot ids')
+
+    parser.add_argument('-r', '--region',
+                        required=False,
+                        action='store',
+                        help='Region of the --snapshots list (default is us-east-1)')
+
+    parser.add_argument('-d', '--days',
+                        required=False,
+                        action='store',
+                        help='Restore temporarily for this many days')
+
+    parser.add_argument('--permanent',
+                        required=False,
+                        action='store',
+                        help='Restore permanently to the standard tier (default is False)')
+
+    parser.add_argument('-p', '--profile',
+                        required=False,
+                        action='store',
+                        help='If you want to use a non-default profile')
+
+    parser.add_argument('-a', '--allprofilesallregions',
+                        required=False,
+                        action='store',
+                        help='If you want to use all local profiles')
+
+    parser.add_argument('--rate',
+                        required=False,
+                        action='store',
+                        help='Restore requests per second per account/region (default is 5)')
+
+    parser.add_argument('-w', '--workers',
+                        required=False,
+                        action='store',
+                        help='Account/regions to work on at the same time (default is 8)')
+
+    parser.add_argument('-j', '--journal',
+                        required=False,
+                        action='store',
+                        help='Journal file to record and resume progress (default is restore_journal.csv)')
+
+    parser.add_argument('-i', '--interval',
+                        required=False,
+                        action='store',
+                        help='Seconds between status polls (default is 60)')
+
+    parser.add_argument('--trace',
+                        required=False,
+                        action='store',
+                        help='Write a Chrome trace of the run to this file')
+
+    return (parser.parse_args())
+
+## snapshot ids from a file (one per line) or a comma separated string
+def read_snapshot_list(snapshot_list):
+    if os.path.isfile(snapshot_list):
+        with open(snapshot_list, 'r', encoding='utf-8') as f:
+            return [line.strip() for line in f if line.strip()]
+    return [s.strip() for s in snapshot_list.split(",") if s.strip()]
+
+## "permanent" or "temporary-<days>d", journal entries only carry over between runs asking for the same thing
+def restore_mode(restore_args):
+    if restore_args.get('PermanentRestore'):
+        return "permanent"
+    return "temporary-" + str(restore_args['TemporaryRestoreDays']) + "d"
+
+## appends one line per event to the journal and remembers the last state of every snapshot for this restore mode
+## states: requested, restored, failed or stale (journaled as requested/restored, but back in the archive tier now)
+## lines from another restore mode, or from before the journal recorded the mode, are kept but not used
+class RestoreJournal:
+
+    def __init__(self, filename, mode):
+        self.filename = filename
+        self.mode = mode
+        self.lock = threading.Lock()
+        self.states = {}
+        if os.path.isfile(filename):
+            with open(filename, 'r', encoding='utf-8', newline='') as f:
+                for row in csv.reader(f):
+                    if len(row) >= 7 and row[0] != "timestamp" and row[6] == mode:
+                        self.states[row[1]] = row[4]
+        else:
+            with open(filename, 'w', encoding='utf-8', newline='') as f:
+                csv.writer(f).writerow(["timestamp", "snapshot_id", "account", "region", "state", "detail", "restore"])
+
+    def record(self, snapshot_id, account, region, state, detail=""):
+        with self.lock:
+            self.states[snapshot_id] = state
+            with open(self.filename, 'a', encoding='utf-8', newline='') as f:
+                csv.writer(f).writerow([datetime.now().strftime(ebs_archive.date_format_str), snapshot_id, account, region, state, detail, self.mode])
+
+## what a journaled snapshot looks like right now, from its describe_snapshot_tier_status entry
+## "restored" when it's in the standard tier for as long as this mode needs (a permanent restore has no expiry time,
+## a temporary one hasn't expired yet), "requested" while a restore is still running, None when it has to be asked for
+def live_restore_state(tier_status, mode, now):
+    if ebs_archive.tier_state(tier_status).endswith("restore-in-progress"):
+        return "requested"
+    if tier_status.get('StorageTier') == 'standard':
+        expiry = tier_status.get('RestoreExpiryTime')
+        if mode == "permanent" and expiry is None:
+            return "restored"
+        if mode != "permanent" and (expiry is None or expiry > now):
+            return "restored"
+    return None
+
+## send the restore requests for one account/region, one at a time and no faster than rate per second
+## throttling and transient service/connection errors are retried with a doubling wait before a snapshot is failed
+## returns the snapshot ids that were requested
+def restore_region(ec2_client, account, region, snapshot_ids, restore_args, rate, journal):
+    region_span = aws_trace.begin(region, "region", {'account': account, 'snapshots': len(snapshot_ids)})
+    requested = []
+    next_call = time.monotonic()
+    for snapshot_id in snapshot_ids:
+        for attempt in range(max_throttle_retries + 1):
+            wait = next_call - time.monotonic()
+            if wait > 0:
+                time.sleep(wait)
+            next_call = time.monotonic() + 1.0 / rate
+            try:
+                ec2_client.restore_snapshot_tier(SnapshotId=snapshot_id, **restore_args)
+            except Exception as exc:
+                code = ebs_archive.error_code(exc)
+                if code in ebs_archive.retriable_error_codes and attempt < max_throttle_retries:
+                    next_call = time.monotonic() + 2 ** attempt
+                    continue
+                if code in ebs_archive.retriable_error_codes:
+                    code = code + " (retriable, rerun to try it again)"
+                print("FAILED: restore of " + snapshot_id + " in " + account + " " + region + ": " + code)
+                journal.record(snapshot_id, account, region, "failed", code)
+                break
+            print("restore requested: " + snapshot_id + " " + account + " " + region)
+            journal.record(snapshot_id, account, region, "requested")
+            requested.append(snapshot_id)
+            break
+    region_span.end()
+    return requested
+
+def main():
+    args = setup_args()
+
+    if args.filename:
+        filename = str(args.filename)
+    else:
+        filename = "archived_snapshots_output.csv"
+
+    if args.region:
+        region = str(args.region)
+    else:
+        region = "us-east-1"
+
+    if args.profile:
+        profile = str(args.profile)
+    else:
+        profile = "noprofile"
+
+    if args.permanent == "True" or args.permanent == "true":
+        restore_args = {'PermanentRestore': True}
+    elif args.days:
+        restore_args = {'TemporaryRestoreDays': int(args.days)}
+    else:
+        sys.exit("Use -d [days] for a temporary restore or --permanent True")
+
+    if args.rate:
+        rate = float(args.rate)
+    else:
+        rate = 5.0
+
+    if args.workers:
+        workers = int(args.workers)
+    else:
+        workers = 8
+
+    if args.journal:
+        journal_file = str(args.journal)
+    else:
+        journal_file = "restore_journal.csv"
+
+    if args.interval:
+        interval = int(args.interval)
+    else:
+        interval = 60
+
+    ## everything from here on is timed when --trace is on, the file is written on the way out
+    if args.trace:
+        aws_trace.start(str(args.trace), "ebs-restore-from-archive.py")
+
+    if args.allprofilesallregions == "True" or args.allprofilesallregions == "true":
+        # a bare list of snapshot ids doesn't say which account they're in
+        if args.snapshots:
+            sys.exit("--snapshots can't be used with -a True, pick the account with -p [profile]")
+        profile_list = boto3.session.Session().available_profiles
+    else:
+        profile_list = profile.split()
+
+    # work out which profile gets us into each account
+    session_dict = ebs_archive.account_sessions(profile_list)
+
+    if args.snapshots:
+        if len(session_dict) == 0:
+            sys.exit("No working credentials for the --snapshots list")
+        snapshots = {(next(iter(session_dict)), region): read_snapshot_list(args.snapshots)}
+    else:
+        snapshots = ebs_archive.read_archived_snapshots(filename)
+    if sum(len(ids) for ids in snapshots.values()) == 0:
+        sys.exit("No snapshots to restore")
+
+    journal = RestoreJournal(journal_file, restore_mode(restore_args))
+    run_snapshot_ids = set(s for ids in snapshots.values() for s in ids)
+
+    # clients are made here rather than in the threads, boto3 sessions aren't thread safe
+    # anything the journal has as restored or requested is checked against its live tier status first, one batched
+    # describe per account/region, so only snapshots that really are restored (or restoring) are skipped (or tracked)
+    groups = {}
+    already_restored = 0
+    stale = 0
+    now = datetime.now(timezone.utc)
+    for (this_account, this_region), snapshot_ids in snapshots.items():
+        if this_account not in session_dict:
+            print("ERROR: account " + this_account + " has no matching local profile/credentials, skipping its " + str(len(snapshot_ids)) + " snapshots")
+            continue
+        ec2_client = session_dict[this_account].client('ec2', region_name=this_region)
+
+        journaled = [s for s in snapshot_ids if journal.states.get(s) in ["restored", "requested"]]
+        if len(journaled) > 0:
+            try:
+                statuses = ebs_archive.snapshot_tier_statuses(ec2_client, journaled)
+            except Exception as exc:
+                statuses = None
+                print("WARNING: couldn't check the tier status in " + this_account + " " + this_region + " (" + ebs_archive.error_code(exc) + "), going by the journal")
+            if statuses is not None:
+                for snapshot_id in journaled:
+                    live_state = live_restore_state(statuses.get(snapshot_id, {}), journal.mode, now)
+                    if live_state is None:
+                        journal.record(snapshot_id, this_account, this_region, "stale", ebs_archive.tier_state(statuses.get(snapshot_id, {})))
+                        stale += 1
+                    elif live_state != journal.states[snapshot_id]:
+                        journal.record(snapshot_id, this_account, this_region, live_state, "from the live tier status")
+
+        already_restored += len([s for s in snapshot_ids if journal.states.get(s) == "restored"])
+        snapshot_ids = [s for s in snapshot_ids if journal.states.get(s) != "restored"]
+        if len(snapshot_ids) > 0:
+            groups[(this_account, this_region)] = (ec2_client, snapshot_ids)
+
+    if already_restored > 0:
+        print("Skipping " + str(already_restored) + " snapshots that are already restored")
+    if stale > 0:
+        print("Requesting " + str(stale) + " snapshots again, the journal had them restored or requested but they're back in the archive tier")
+
+    # requests already in the journal are only tracked, the rest go out in parallel per account/region
+    futures = {}
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        for (this_account, this_region), (ec2_client, snapshot_ids) in groups.items():
+            to_request = [s for s in snapshot_ids if journal.states.get(s) != "requested"]
+            futures[(this_account, this_region)] = executor.submit(restore_region, ec2_client, this_account, this_region, to_request, restore_args, rate, journal)
+
+    track_groups = {}
+    for this_key, (ec2_client, snapshot_ids) in groups.items():
+        futures[this_key].result()
+        requested = [s for s in snapshot_ids if journal.states.get(s) == "requested"]
+        if len(requested) > 0:
+            track_groups[this_key] = (ec2_client, requested)
+
+    print("Tracking " + str(sum(len(ids) for _, ids in track_groups.values())) + " restores in " + str(len(track_groups)) + " account/regions, polling every " + str(interval) + "s")
+    with aws_trace.span("track"):
+        final = ebs_archive.track_tiering(track_groups, interval, finished=ebs_archive.restore_finished)
+
+    snapshot_keys = {s: this_key for this_key, (_, ids) in track_groups.items() for s in ids}
+    unknown = []
+    for snapshot_id, status in final.items():
+        if status.endswith("-completed"):
+            journal.record(snapshot_id, snapshot_keys[snapshot_id][0], snapshot_keys[snapshot_id][1], "restored", status)
+        elif status == "unknown":
+            # left as requested, a rerun picks up tracking it without asking for the restore again
+            unknown.append(snapshot_id)
+        else:
+            journal.record(snapshot_id, snapshot_keys[snapshot_id][0], snapshot_keys[snapshot_id][1], "failed", status)
+
+    failed = sorted(s for s in run_snapshot_ids if journal.states.get(s) == "failed")
+    restored = len([s for s in run_snapshot_ids if journal.states.get(s) == "restored"])
+    print(" ")
+    print("Done: " + str(restored) + " restored, " + str(len(failed)) + " failed, " + str(len(unknown)) + " unknown (see " + journal_file + ")")
+    for snapshot_id in unknown:
+        print("UNKNOWN: couldn't get the restore status of " + snapshot_id + ", rerun to keep tracking it")
+    for snapshot_id in failed:
+        print("FAILED: " + snapshot_id + " was not restored, rerun to try it again")
+
+    if len(failed) > 0:
+        return 1
+
+if __name__ == "__main__":
+    exit(main())
@@ -34,6 +34,51 @@ arguments:
         
         You do not need to specify the region or profile if you use this option
 
+    -s or --skip-recent [days]
+        Skip volumes that already have a completed archive snapshot from the last [days] days, e.g. because an earlier
+        run already archived them (default is 0, snapshot everything in the CSV)
+        Only archive tier snapshots and the standard tier ones an archive run took (still on their way down) count, so
+        DLM and AWS Backup snapshots don't skip anything.  The skipped volumes are counted and listed in the summary
+        The snapshots are looked up in batches per account and region before anything is snapshotted
+
+    -t or --track [True/False]
+        Once everything is snapshotted, keep polling the archive tier status of the new snapshots and show the counts per
+        state with an ETA until they're all archival-completed or archival-failed (default is False)
+        You can also do this later, or from another box, with ebs-archive-status.py and archived_snapshots_output.csv
+
+    -i or --interval [seconds]
+        How often --track polls (default is 60)
+
+    --preflight [True/False/only]
+        Before any snapshot is taken, check every account/region in the CSV at the same time: one batched lookup of the
+        volume ids, create_snapshot with DryRun on one volume of each distinct AZ/KMS key/tags combination (all at
+        once), modify_snapshot_tier with DryRun on a completed standard tier snapshot, and the state of the KMS keys of
+        encrypted volumes.  Prints a go/no-go table and stops if anything is NO-GO (default is True).  Only a denied
+        DryRun or a key that's Disabled or PendingDeletion is NO-GO.  Volumes that don't exist, throttled or transient
+        errors, and keys we can't describe make it WARN ("unverified"), the rest still goes ahead
+        "only" prints the table and exits, False skips the checks
+
+    -m or --multivolume [True/False]
+        Snapshot the CSV volumes that are attached to the same instance together, with one create_snapshots call per
+        instance, so they're crash-consistent with each other (e.g. a database spread over several volumes) (default is False)
+        Volumes on the instance that aren't in the CSV are excluded, and every snapshot gets the same tags and notes as a
+        single volume snapshot would.  Unattached and multi-attach volumes are still snapshotted one at a time
+
+    -w or --workers [number]
+        How many volumes (or with --multivolume, instances) are snapshotted at the same time in each account/region,
+        as threads of its archive engine (default is 4, the same as --workers in ebs-discover-stale-volumes.py)
+
+    --processes [number]
+        Spread the account/regions in the CSV over this many worker processes (default is 1, everything in this process)
+        Each process opens its own sessions and clients and runs --workers threads per account/region, and the results,
+        errors and counts from all of them end up in the usual summary and archived_snapshots_output.csv.  Output lines
+        from different processes can interleave
+
+    --trace [full path to the file]
+        Record a timeline of the run (profile, preflight, each account/region with its snapshot waits and tiering, and
+        every API call, per thread and per worker process) as Chrome Trace Event JSON that opens in
+        https://ui.perfetto.dev or chrome://tracing.  See aws_trace.py
+
 prerequisites:
 
     pip3 install boto3
@@ -65,7 +110,11 @@ import boto3
 import argparse
 import sys
 import csv
-from datetime import datetime
+import aws_records
+import aws_session
+import aws_trace
+import ebs_archive
+from concurrent.futures import ThreadPoolExecutor
 
 def setup_args():
     parser = argparse.ArgumentParser(
@@ -91,8 +140,122 @@ def setup_args():
                         action='store',
                         help='If you want to loop over all local profiles and pull from all regions')
 
+    parser.add_argument('-s', '--skip-recent',
+                        required=False,
+                        action='store',
+                        help='Skip volumes with a completed archive snapshot from the last this many days (default is 0, skip nothing)')
+
+    parser.add_argument('-t', '--track',
+                        required=False,
+                        action='store',
+                        help='Wait and report until the snapshots are in the archive tier (default is False)')
+
+    parser.add_argument('-i', '--interval',
+                        required=False,
+                        action='store',
+                        help='Seconds between --track polls (default is 60)')
+
+    parser.add_argument('--preflight',
+                        required=False,
+                        action='store',
+                        help='Check permissions and volumes everywhere before starting, True/False/only (default is True)')
+
+    parser.add_argument('-m', '--multivolume',
+                        required=False,
+                        action='store',
+                        help='Snapshot the listed volumes of each instance together with create_snapshots (default is False)')
+
+    parser.add_argument('-w', '--workers',
+                        required=False,
+                        action='store',
+                        help='Volumes to snapshot at the same time in each account/region (default is 4)')
+
+    parser.add_argument('--processes',
+                        required=False,
+                        action='store',
+                        help='Worker processes to spread the account/regions over (default is 1)')
+
+    parser.add_argument('--trace',
+                        required=False,
+                        action='store',
+                        help='Write a Chrome trace of the run to this file')
+
     return (parser.parse_args())
 
+## snapshot and archive the volumes of one account/region, on its own session, clients and archive engine
+## runs in a worker process with --processes, so it only takes and returns plain data
+def archive_shard(this_account, this_profile, this_region, shard_volumes, skip_recent_days, multivolume, workers=4, trace=False):
+
+    error_list = []
+    recent_list = []
+
+    # in a worker process only the spans from here on go back to the main process
+    if trace:
+        aws_trace.start_worker()
+    trace_mark = aws_trace.mark()
+    shard_span = aws_trace.begin(this_region, "region", {'account': this_account, 'volumes': len(shard_volumes)})
+
+    # snapshots are taken and tiered down by the archive engine, --workers volumes (or instances) at the same time
+    archive_engine = ebs_archive.ArchiveEngine(workers)
+
+    this_session = aws_session.new_session(this_profile)
+    aws_trace.enable_tracing(this_session, this_account)
+
+    # open an ec2 client for this specific profile and region within it
+    this_ec2_client = this_session.client('ec2',region_name=this_region)
+
+    # find the volumes in this account and region that already have a recent snapshot, in a few batched calls
+    recent_snapshots = {}
+    if skip_recent_days > 0:
+        try:
+            with aws_trace.span("describe"):
+                recent_snapshots = ebs_archive.recent_snapshots(this_ec2_client, list(shard_volumes.keys()), skip_recent_days, archive_runs_only=True)
+        except Exception as exc:
+            error_list.append("ERROR: couldn't look up the existing snapshots in " + this_account + " " + this_region + ", snapshotting everything there: " + str(exc))
+
+    region_submit_list = []
+
+    # remember shard_volumes looks like this
+    # volume_id : VolumeRequest(account, region, notes)
+    for this_volumes_id in shard_volumes:
+        this_volumes_id = str(this_volumes_id)
+        if this_volumes_id in recent_snapshots:
+            snapshot_id, start_time, storage_tier = recent_snapshots[this_volumes_id]
+            recent_list.append(this_volumes_id + " already has " + storage_tier + " snapshot " + snapshot_id + " from " + start_time.strftime('%Y-%m-%d %H:%M:%S'))
+            continue
+        region_submit_list.append(this_volumes_id)
+
+    # group the volumes by the instance they're attached to, everything else stays one at a time
+    instance_volumes = {}
+    single_volumes = region_submit_list
+    if multivolume and len(region_submit_list) > 0:
+        try:
+            with aws_trace.span("group"):
+                instance_volumes, single_volumes = ebs_archive.group_by_instance(this_ec2_client, region_submit_list)
+        except Exception as exc:
+            error_list.append("ERROR: couldn't group the volumes in " + this_account + " " + this_region + " by instance, snapshotting them one at a time: " + str(exc))
+
+    for this_instance_id, this_instance_volume_ids in instance_volumes.items():
+        archive_engine.submit_instance(this_ec2_client, this_account, this_region, this_instance_id, [(v, shard_volumes[v].notes) for v in this_instance_volume_ids])
+
+    for this_volumes_id in single_volumes:
+        archive_engine.submit(this_ec2_client, this_account, this_region, this_volumes_id, shard_volumes[this_volumes_id].notes)
+
+    with aws_trace.span("archive wait"):
+        archive_engine.close()
+    error_list.extend(archive_engine.error_list)
+    shard_span.end()
+
+    return {
+        "archived": archive_engine.archived,
+        "error_list": error_list,
+        "recent_list": recent_list,
+        "skipped_count": archive_engine.skipped_count,
+        "archive_skipped_count": archive_engine.archive_skipped_count,
+        "archive_count": archive_engine.archive_count,
+        "trace": aws_trace.collect(trace_mark),
+    }
+
 def main():
 
     if boto3.__version__[:3] == "1.1":
@@ -101,6 +264,10 @@ def main():
         
     args = setup_args()
 
+    ## everything from here on is timed when --trace is on, the file is written on the way out
+    if args.trace:
+        aws_trace.start(str(args.trace), "ebs-snapshot-to-archive.py")
+
     if args.region:
         region = str(args.region)
     else:
@@ -122,11 +289,46 @@ def main():
     else:
         allprofilesallregions = False
 
+    if args.skip_recent:
+        skip_recent_days = int(args.skip_recent)
+    else:
+        skip_recent_days = 0
+
+    if args.track == "True" or args.track == "true":
+        track = True
+    else:
+        track = False
+
+    if args.interval:
+        interval = int(args.interval)
+    else:
+        interval = 60
+
+    if args.preflight:
+        preflight = str(args.preflight).lower()
+    else:
+        preflight = "true"
+
+    if args.multivolume == "True" or args.multivolume == "true":
+        multivolume = True
+    else:
+        multivolume = False
+
+    if args.workers:
+        workers = int(args.workers)
+    else:
+        workers = 4
+
+    if args.processes:
+        processes = int(args.processes)
+    else:
+        processes = 1
+
     ## Addresses the case where user just wants to use environment variables or default profile
     if (profile == "noprofile"):
-        session = boto3.Session()
+        session = aws_session.new_session()
     else:
-        session = boto3.Session(profile_name=profile)
+        session = aws_session.new_session(profile)
 
     ## If profile is set to "all", get a list of available local profiles on this box
     if allprofilesallregions == "True" or allprofilesallregions == "true":
@@ -144,15 +346,7 @@ def main():
     error_list = []
     volume_dict = {}
     csv_region_list = []
-    snapshot_dict = {}
-    archived_dict = {}
-    skipped_count = 0
-    archive_skipped_count = 0
-    archive_count = 0
-
-    # set up constants
-    utc_date_time = datetime.utcnow().strftime('%Y-%m-%d %H:%M:%S')
-    date_format_str = '%Y-%m-%d %H:%M:%S'
+    recent_list = []
 
     # get info out of the CSV
     for row in csvReader:
@@ -167,7 +361,7 @@ def main():
                 new_region = row[2]
                 new_notes = row[3]
 
-                volume_dict[new_volume] = [new_account, new_region, new_notes]
+                volume_dict[new_volume] = aws_records.VolumeRequest(new_account, new_region, new_notes)
             
             if (row[2] not in csv_region_list):
                 csv_region_list.append(row[2])
@@ -180,165 +374,109 @@ def main():
 
     # get the unique account ids from the local profiles, i.e. what they actually have access to
     for this_profile in profile_list:
+        profile_span = aws_trace.begin(this_profile, "profile")
 
         # Open a session and get the info for list particular profile
         # UNLESS they didn't specify a profile at all in which case just use env vars or whatever they're doing
         if this_profile == "noprofile":
-            session = boto3.Session()
+            session = aws_session.new_session()
         else:
-            session = boto3.Session(profile_name=this_profile)
+            session = aws_session.new_session(this_profile)
 
         try:
-            STS_CLIENT = session.client('sts')
-            CURRENT_ACCOUNT_ID = STS_CLIENT.get_caller_identity()['Account']
+            with aws_trace.span("sts"):
+                STS_CLIENT = session.client('sts')
+                CURRENT_ACCOUNT_ID = STS_CLIENT.get_caller_identity()['Account']
             
             if CURRENT_ACCOUNT_ID not in profile_dict:
                 profile_dict[CURRENT_ACCOUNT_ID] = this_profile
 
         except:
             error_list.append("ERROR: cannot get the current Account ID from the STS service for profile " + this_profile + ".  This can be caused by a profile meant for a snow family device or insufficient permissions")
+        profile_span.end()
 
     # validate that they do, in fact, have a local profile with credentials for every account id in their CSV
     for this_account in csv_account_id_list:
         if (this_account not in profile_dict):
             error_list.append("ERROR: account " + this_account + " which is listed in your CSV does not have a matching local profile/credentials in your AWS CLI configuration")
 
-    # loop over each profile again, this time from the known good dictionary
+    # check every account/region at once with DryRun calls before a single real snapshot is started
+    if preflight != "false":
+        preflight_span = aws_trace.begin("preflight")
+        preflight_groups = {}
+        for this_account,this_profile in profile_dict.items():
+            this_session = aws_session.new_session(this_profile)
+            aws_trace.enable_tracing(this_session, this_account)
+            for this_region in csv_region_list:
+                region_volume_ids = [v for v, l in volume_dict.items() if l.account == this_account and l.region == this_region]
+                if len(region_volume_ids) > 0:
+                    # clients are made here, boto3 sessions aren't safe to share between threads
+                    preflight_groups[(this_account, this_region)] = (this_session.client('ec2',region_name=this_region), this_session.client('kms',region_name=this_region), region_volume_ids)
+
+        with ThreadPoolExecutor(max_workers=16) as executor:
+            futures = {key: executor.submit(ebs_archive.preflight_region, *group) for key, group in preflight_groups.items()}
+            preflight_results = {key: future.result() for key, future in futures.items()}
+        preflight_span.end()
+
+        print ("Pre-flight check:")
+        print ("account,region,volumes,found,create_snapshot,modify_snapshot_tier,kms,verdict")
+        no_go = False
+        for (this_account, this_region), this_result in sorted(preflight_results.items()):
+            print (this_account + "," + this_region + "," + str(this_result["volumes"]) + "," + str(this_result["found"]) + "," +
+                   this_result["create_snapshot"] + "," + this_result["modify_snapshot_tier"] + "," + this_result["kms"] + "," + this_result["verdict"])
+            for this_missing in this_result["missing"]:
+                print ("    missing: " + this_missing)
+            for this_denied in this_result["denied"]:
+                print ("    create_snapshot: " + this_denied)
+            for this_unverified in this_result["unverified"]:
+                print ("    unverified: " + this_unverified)
+            if this_result["verdict"] == "NO-GO":
+                no_go = True
+        for this_error in error_list:
+            print (this_error)
+        print (" ")
+
+        if preflight == "only":
+            return
+        if no_go:
+            print ("Stopping before any snapshots were taken.  Fix the NO-GO lines above, or rerun with --preflight False to go ahead anyway")
+            return 1
+
+    # one shard per account/region, each archived with its own session, clients and archive engine
+    shards = []
     for this_account,this_profile in profile_dict.items():
-
-        this_session = boto3.Session(profile_name=this_profile)
-
-        # ok, so let's loop over the csv_region_list which should be much narrower than all possible regions
         for this_region in csv_region_list:
+            shard_volumes = {v: l for v, l in volume_dict.items() if l.account == this_account and l.region == this_region}
+            if len(shard_volumes) > 0:
+                shards.append((this_account, this_profile, this_region, shard_volumes, skip_recent_days, multivolume, workers, bool(args.trace)))
+
+    # with --processes the shards are spread over a pool of processes, otherwise they run here one after the other
+    if processes > 1 and len(shards) > 1:
+        # multiprocessing is only loaded when there are processes to start
+        from concurrent.futures import ProcessPoolExecutor
+        with ProcessPoolExecutor(max_workers=min(processes, len(shards))) as executor:
+            shard_results = list(executor.map(archive_shard, *zip(*shards)))
+    else:
+        shard_results = [archive_shard(*shard) for shard in shards]
 
-            # open an ec2 resource and ec2 client for this specific profile and region within it
-            this_ec2_resource = this_session.resource('ec2',region_name=this_region)
-            this_ec2_client = this_session.client('ec2',region_name=this_region)
-
-            # loop over the volume_dict and only snapshot ones in this account and region
-            # remember volume_dict looks like this
-            # volume_id : ['account_id', 'region', 'notes'] 
-
-            for this_volumes_id,this_volumes_list in volume_dict.items():
-                
-                this_volumes_id = str(this_volumes_id)
-
-                this_volumes_account = this_volumes_list[0]
-                this_volumes_region = this_volumes_list[1]
-                this_volumes_notes = this_volumes_list[2]
-                # first off, only bother with volumes tied to the account we're in
-                if this_volumes_account == this_account:
-
-                    # now, only bother if the volume is in the region we're in
-                    if this_volumes_region == this_region:
-                        print("creating snapshot for: ",this_volumes_id,this_volumes_account,this_volumes_region,this_volumes_notes + "...(waiting)...")
-
-                        # by default we'll assume a volume has no name
-                        this_volume_name = "unnamed"
-
-                        try:
-                            this_volumes_data = this_ec2_resource.Volume(this_volumes_id)
-                        except:
-                            error_list.append("ERROR: Something is wrong with " + this_volumes_id + " it failed here: this_volumes_data = this_ec2_resource.Volume(this_volumes_id)")
-                        try:
-                            if this_volumes_data.tags:
-                                for t in this_volumes_data.tags:
-                                    if t["Key"] == 'Name':
-                                        this_volume_name = t["Value"]  
-                        except:
-                            error_list.append("ERROR: Something is wrong with " + this_volumes_id + " it failed when looking for its name in the tags")
-
-                        try:
-                            this_volume_type = str(this_volumes_data.volume_type)
-                            this_volume_az = str(this_volumes_data.availability_zone)
-                            this_volume_size = str(this_volumes_data.size)
-                            this_volume_encrypted = str(this_volumes_data.encrypted)
-                            this_volume_created = str(this_volumes_data.create_time.strftime(date_format_str))
-                        except:
-                            error_list.append("ERROR: Something is wrong with " + this_volumes_id + " it failed when trying to obtain attributes like volume_type")
-
-
-                        snapshot_name = ("archive of " + this_volume_name + " created " + utc_date_time)
-
-                        try:
-                            this_snapshot = this_ec2_resource.create_snapshot(
-                                VolumeId=this_volumes_id,
-                                TagSpecifications=[
-                                    {
-                                        'ResourceType': 'snapshot',
-                                        'Tags': [
-                                            {
-                                                'Key': 'Name',
-                                                'Value': snapshot_name
-                                            },
-                                            {
-                                                'Key': 'Volume Name',
-                                                'Value': this_volume_name
-                                            },                                            
-                                            {
-                                                'Key': 'Volume Type',
-                                                'Value': this_volume_type
-                                            },
-                                            {
-                                                'Key': 'Volume AZ',
-                                                'Value': this_volume_az
-                                            },
-                                            {
-                                                'Key': 'Volume Size',
-                                                'Value': this_volume_size
-                                            },
-                                            {
-                                                'Key': 'Volume Encrypted',
-                                                'Value': this_volume_encrypted
-                                            },
-                                            {
-                                                'Key': 'Volume Created',
-                                                'Value': this_volume_created
-                                            },
-                                            {
-                                                'Key': 'Notes',
-                                                'Value': this_volumes_notes
-                                            },
-                                        ]
-                                    },
-                                ]
-                            )
-                            this_snapshot.wait_until_completed()
-                            print ("snapshot " + this_snapshot.snapshot_id + " complete.")
-                            # this is where we will store information about snapshots that were successful
-                            snapshot_dict[this_snapshot.snapshot_id] = [this_volumes_id, this_volumes_account, this_volumes_region, this_volumes_notes]
-                        except:
-                            error_list.append("SKIPPED: " + this_volumes_id + " had errors so we skipped this one entirely.  The vol-id is probably bad.")
-                            skipped_count=skipped_count+1
-
-
-            # loop over snapshots in this account and region to try and tier them down to archive
-            for this_snapshots_id,this_snapshots_list in snapshot_dict.items():
-                
-                #print("trying to archive: ",snapshot_dict.items())
+    skipped_count = 0
+    archive_skipped_count = 0
+    archive_count = 0
+    archived_dict = {}
+    for this_result in shard_results:
+        error_list.extend(this_result["error_list"])
+        recent_list.extend(this_result["recent_list"])
+        skipped_count += this_result["skipped_count"]
+        archive_skipped_count += this_result["archive_skipped_count"]
+        archive_count += this_result["archive_count"]
+        archived_dict.update(this_result["archived"])
+        aws_trace.merge(this_result["trace"])
 
-                this_snapshots_id_str = str(this_snapshots_id)
-                this_snapshots_volume_id = str(this_snapshots_list[0])                  
-                this_snapshots_account = str(this_snapshots_list[1])
-                this_snapshots_region = str(this_snapshots_list[2])
-                this_snapshots_notes = str(this_snapshots_list[3])
-                
-                try:
-                    this_ec2_client.modify_snapshot_tier(
-                        SnapshotId=this_snapshots_id_str,
-                        StorageTier='archive'
-                    )
-                    print ("initiating archive of: ",this_snapshots_id,this_snapshots_volume_id,this_snapshots_account,this_snapshots_region,this_snapshots_notes)
-                    archived_dict[this_snapshots_id] = [this_snapshots_id,this_snapshots_volume_id,this_snapshots_account,this_snapshots_region,this_snapshots_notes]
-                except Exception as exc:
-                    print(exc)
-                    error_list.append("SKIPPED: Archival of snapshot " + this_snapshots_id + " failed. You will need to manually tier this one down")
-                    archive_skipped_count=archive_skipped_count+1
-                else:
-                    archive_count=archive_count+1
     print (" ")
     print ("Note: the snapshots are still being tiered down to archive.  How long this takes can vary a lot.")
-    print ("Double check the tiering status in the console under EC2 > Snapshots > [snapshot] > Storage Tier tab")
+    if not track:
+        print ("Double check the tiering status in the console under EC2 > Snapshots > [snapshot] > Storage Tier tab")
+        print ("or run ebs-archive-status.py to follow them until they're done")
     print (" ")
 
     if skipped_count == 0:
@@ -351,6 +489,11 @@ def main():
     else:
         print ("Number of tiering operations skipped due to errors while archiving " + str(archive_skipped_count))
 
+    if len(recent_list) > 0:
+        print ("Number of volumes skipped because of --skip-recent " + str(skip_recent_days) + ", they already have a completed archive snapshot from the last " + str(skip_recent_days) + " days: " + str(len(recent_list)))
+        for this_recent in recent_list:
+            print ("    " + this_recent)
+
     if len(error_list) > 0:
         print ("Error Details:")
         for thiserror in error_list:
@@ -368,7 +511,29 @@ def main():
 
     for this_snapshots_id,this_snapshots_list in archived_dict.items():
         with open(archive_file,'a',encoding='utf-8') as f:
-            f.write( f"{this_snapshots_list}\n")
+            f.write( f"{list(this_snapshots_list)}\n")
+
+    # follow the snapshots until they've all landed in the archive tier (or failed to)
+    if track and len(archived_dict) > 0:
+        groups = {}
+        for this_snapshots_id,this_snapshots_list in archived_dict.items():
+            this_key = (this_snapshots_list.account, this_snapshots_list.region)
+            if this_key not in groups:
+                this_session = aws_session.new_session(profile_dict[this_key[0]])
+                aws_trace.enable_tracing(this_session, this_key[0])
+                groups[this_key] = (this_session.client('ec2',region_name=this_key[1]), [])
+            groups[this_key][1].append(this_snapshots_id)
+
+        print (" ")
+        print ("Tracking the archive tier status of " + str(len(archived_dict)) + " snapshots, polling every " + str(interval) + "s")
+        with aws_trace.span("track"):
+            final = ebs_archive.track_tiering(groups, interval)
+        failed = [this_snapshots_id for this_snapshots_id, this_status in final.items() if this_status.endswith("-failed")]
+        print ("Number of snapshots that made it to the archive tier: " + str(len([s for s in final.values() if s.endswith("-completed")])))
+        for this_snapshots_id in failed:
+            print ("FAILED: " + this_snapshots_id + " did not make it to the archive tier, you will need to manually tier this one down")
+        for this_snapshots_id in [s for s, this_status in final.items() if this_status == "unknown"]:
+            print ("UNKNOWN: couldn't get the tier status of " + this_snapshots_id + ", check on it with ebs-archive-status.py")
 
 if __name__ == "__main__":
     exit(main())                        
@@ -0,0 +1,629 @@
+#!/usr/bin/python3
+
+"""
+The snapshot-and-archive engine behind ebs-snapshot-to-archive.py and ebs-discover-stale-volumes.py --archive.
+
+Volumes are put on a queue and worker threads take them off one at a time: look the volume up, create a snapshot
+tagged with the volume's details and your notes, wait for it to complete, then ask for it to be moved to the
+archive tier.  Since the queue can be fed while the caller is still working (e.g. discovery paging through other
+regions), snapshots start as soon as the first volume turns up instead of after the whole list is known.
+
+usage from a script:
+
+    import ebs_archive
+
+    archive_engine = ebs_archive.ArchiveEngine(workers=4)
+    archive_engine.submit(ec2_client, account_id, region, volume_id, notes)
+    archive_engine.submit_instance(ec2_client, account_id, region, instance_id, [(volume_id, notes), ...])
+    ...
+    archive_engine.close()
+
+    -> archive_engine.archived, .error_list and the counts are ready once close() returns
+
+notes:
+
+    Each worker only uses the ec2 client handed to submit(), and boto3 clients are safe to share between threads
+    Don't hand it a client with the inventory cache enabled, the snapshot waiter needs to see fresh DescribeSnapshots
+"""
+
+import ast
+import aws_records
+import aws_session
+import aws_trace
+import queue
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta, timezone
+
+date_format_str = '%Y-%m-%d %H:%M:%S'
+
+## how many volume ids go into one describe_snapshots volume-id filter
+snapshot_filter_batch = 200
+
+## the volume's Name tag, or "unnamed"
+def volume_name(tags):
+    for t in tags or []:
+        if t["Key"] == 'Name':
+            return t["Value"]
+    return "unnamed"
+
+## the tags every archive snapshot gets, so you can tell what it was a snapshot of after the volume is gone
+def snapshot_tags(volume, notes, utc_date_time):
+    this_volume_name = volume_name(volume.get('Tags'))
+    return [
+        {'Key': 'Name', 'Value': "archive of " + this_volume_name + " created " + utc_date_time},
+        {'Key': 'Volume Name', 'Value': this_volume_name},
+        {'Key': 'Volume Type', 'Value': str(volume['VolumeType'])},
+        {'Key': 'Volume AZ', 'Value': str(volume['AvailabilityZone'])},
+        {'Key': 'Volume Size', 'Value': str(volume['Size'])},
+        {'Key': 'Volume Encrypted', 'Value': str(volume['Encrypted'])},
+        {'Key': 'Volume Created', 'Value': volume['CreateTime'].strftime(date_format_str)},
+        {'Key': 'Notes', 'Value': notes},
+    ]
+
+## the newest completed snapshot (standard or archive tier) we own for each of the volumes, if it's newer than max_age_days
+## one paginated describe_snapshots per batch of volume ids rather than a lookup per volume
+## with archive_runs_only a standard tier snapshot only counts if an archive run took it (our Name tag), i.e. it's still
+## on its way down to the archive tier, so DLM and AWS Backup snapshots don't
+## returns {volume_id: (snapshot_id, start_time, storage_tier)}
+def recent_snapshots(ec2_client, volume_ids, max_age_days, archive_runs_only=False):
+    cutoff = datetime.now(timezone.utc) - timedelta(days=max_age_days)
+    volume_ids = list(volume_ids)
+    recent = {}
+
+    paginator = ec2_client.get_paginator('describe_snapshots')
+    for start in range(0, len(volume_ids), snapshot_filter_batch):
+        pages = paginator.paginate(
+            OwnerIds=['self'],
+            Filters=[
+                {'Name': 'volume-id', 'Values': volume_ids[start:start + snapshot_filter_batch]},
+                {'Name': 'storage-tier', 'Values': ['standard', 'archive']},
+                {'Name': 'status', 'Values': ['completed']},
+            ]
+        )
+        for page in pages:
+            for snapshot in page['Snapshots']:
+                if snapshot['StartTime'] < cutoff:
+                    continue
+                if archive_runs_only and snapshot.get('StorageTier', 'standard') == 'standard' and not aws_records.tag_value(snapshot.get('Tags'), 'Name', "").startswith("archive of "):
+                    continue
+                newest = recent.get(snapshot['VolumeId'])
+                if newest is None or snapshot['StartTime'] > newest[1]:
+                    recent[snapshot['VolumeId']] = (snapshot['SnapshotId'], snapshot['StartTime'], snapshot.get('StorageTier', 'standard'))
+
+    return recent
+
+## read archived_snapshots_output.csv, one [snapshot id, volume id, account, region, notes] list per line
+## returns {(account, region): [snapshot ids]}
+def read_archived_snapshots(filename):
+    snapshots = {}
+    with open(filename, 'r', encoding='utf-8') as f:
+        for line in f:
+            line = line.strip()
+            if not line:
+                continue
+            try:
+                this_snapshot = ast.literal_eval(line)
+            except (ValueError, SyntaxError):
+                this_snapshot = line.split(",")
+            snapshots.setdefault((str(this_snapshot[2]), str(this_snapshot[3])), []).append(str(this_snapshot[0]))
+    return snapshots
+
+## work out which profile gets us into each account, the first profile found for an account wins
+## "noprofile" means the default credentials
+## with --trace on, every session that's kept has its API calls traced under its account id
+## returns {account id: session}
+def account_sessions(profile_list, log=print):
+    session_dict = {}
+    for this_profile in profile_list:
+        with aws_trace.span(this_profile, "profile"):
+            if this_profile == "noprofile":
+                session = aws_session.new_session()
+            else:
+                session = aws_session.new_session(this_profile)
+
+            try:
+                with aws_trace.span("sts"):
+                    CURRENT_ACCOUNT_ID = session.client('sts').get_caller_identity()['Account']
+            except:
+                log("ERROR: cannot get the current Account ID from the STS service for profile " + this_profile)
+                continue
+
+            if CURRENT_ACCOUNT_ID not in session_dict:
+                aws_trace.enable_tracing(session, CURRENT_ACCOUNT_ID)
+                session_dict[CURRENT_ACCOUNT_ID] = session
+    return session_dict
+
+## every tiering operation (archival, temporary-restore, permanent-restore) ends up as <operation>-completed or -failed
+def tiering_finished(status):
+    return status.endswith("-completed") or status.endswith("-failed")
+
+## a restore is only done once the status says so, an archival-completed left over from before the request isn't it
+def restore_finished(status):
+    return "restore" in status and tiering_finished(status)
+
+## describe_snapshot_tier_status for a list of snapshots in one account/region, filtered by snapshot id in batches
+## returns {snapshot_id: tier status dict}, snapshots that no longer exist are just missing
+def snapshot_tier_statuses(ec2_client, snapshot_ids):
+    snapshot_ids = list(snapshot_ids)
+    statuses = {}
+
+    paginator = ec2_client.get_paginator('describe_snapshot_tier_status')
+    for start in range(0, len(snapshot_ids), snapshot_filter_batch):
+        pages = paginator.paginate(
+            Filters=[{'Name': 'snapshot-id', 'Values': snapshot_ids[start:start + snapshot_filter_batch]}]
+        )
+        for page in pages:
+            for tier_status in page['SnapshotTierStatuses']:
+                statuses[tier_status['SnapshotId']] = tier_status
+
+    return statuses
+
+def format_duration(seconds):
+    seconds = int(seconds)
+    if seconds >= 3600:
+        return str(seconds // 3600) + "h" + str((seconds % 3600) // 60).zfill(2) + "m"
+    return str(seconds // 60) + "m" + str(seconds % 60).zfill(2) + "s"
+
+## the last tiering operation status of a tier status dict, "unknown" when it has none (never tiered, or not described yet)
+def tier_state(tier_status):
+    return tier_status.get('LastTieringOperationStatus') or 'unknown'
+
+## rough time until the slowest snapshot still in progress is done, assuming each keeps going at the rate it has so far
+## None until every one of them has reported some progress
+def tiering_eta(statuses, finished=tiering_finished):
+    now = datetime.now(timezone.utc)
+    remaining = []
+    for tier_status in statuses.values():
+        if finished(tier_state(tier_status)):
+            continue
+        progress = tier_status.get('LastTieringProgress', 0)
+        started = tier_status.get('LastTieringStartTime')
+        if not progress or started is None:
+            return None
+        elapsed = (now - started).total_seconds()
+        remaining.append(elapsed * (100 - progress) / progress)
+    return max(remaining, default=0)
+
+## poll the tier status of a batch of snapshots until every one has finished, printing the counts per state as it goes
+## groups is {(account, region): (ec2_client, [snapshot ids])}, so it's one set of calls per account/region per poll
+## returns {snapshot_id: last tiering operation status}, "not-found" for snapshots that have disappeared
+## finished decides when a status counts as done, e.g. restore_finished when following restores rather than archiving
+## an account/region that still can't be described after max_failures polls in a row stops holding up the others,
+## once they're done its unfinished snapshots are returned as "unknown" rather than left out
+def track_tiering(groups, interval=60, log=print, finished=tiering_finished, max_failures=5):
+    latest = {}
+    if len(groups) == 0:
+        return latest
+    for ec2_client, snapshot_ids in groups.values():
+        for snapshot_id in snapshot_ids:
+            latest[snapshot_id] = {}
+    failures = {this_key: 0 for this_key in groups}
+    while True:
+        poll_span = aws_trace.begin("poll")
+        for (account, region), (ec2_client, snapshot_ids) in groups.items():
+            try:
+                statuses = snapshot_tier_statuses(ec2_client, snapshot_ids)
+            except Exception as exc:
+                # keep what we had for this account/region and try again next time round
+                failures[(account, region)] += 1
+                log("couldn't get the tier status in " + account + " " + region + " (" + str(failures[(account, region)]) + " in a row): " + str(exc))
+                continue
+            failures[(account, region)] = 0
+            for snapshot_id in snapshot_ids:
+                latest[snapshot_id] = statuses.get(snapshot_id, {'LastTieringOperationStatus': 'not-found'})
+        poll_span.end()
+
+        counts = {}
+        for tier_status in latest.values():
+            state = tier_state(tier_status)
+            counts[state] = counts.get(state, 0) + 1
+
+        eta = tiering_eta(latest, finished)
+        log(datetime.now().strftime('%H:%M:%S') + "  " +
+            ", ".join(state + " " + str(count) for state, count in sorted(counts.items())) +
+            ("  (ETA " + format_duration(eta) + ")" if eta else ""))
+
+        pending = []
+        given_up = []
+        for this_key, (ec2_client, snapshot_ids) in groups.items():
+            unfinished = [s for s in snapshot_ids if tier_state(latest[s]) != 'not-found' and not finished(tier_state(latest[s]))]
+            if failures[this_key] >= max_failures:
+                given_up.extend(unfinished)
+            else:
+                pending.extend(unfinished)
+        if len(pending) == 0:
+            for this_key in groups:
+                if failures[this_key] >= max_failures:
+                    log("giving up on " + this_key[0] + " " + this_key[1] + " after " + str(failures[this_key]) + " failed polls in a row, its unfinished snapshots are reported as unknown")
+            final = {snapshot_id: tier_state(s) for snapshot_id, s in latest.items()}
+            for snapshot_id in given_up:
+                final[snapshot_id] = 'unknown'
+            return final
+        time.sleep(interval)
+
+## error codes that say nothing about the request itself, only that AWS was busy or couldn't be reached this time
+## (the last three are the exception names error_code() gives when the endpoint couldn't be reached at all)
+retriable_error_codes = ['RequestLimitExceeded', 'Throttling', 'ThrottlingException', 'InternalError', 'InternalFailure',
+                         'ServiceUnavailable', 'Unavailable', 'EndpointConnectionError', 'ConnectTimeoutError', 'ReadTimeoutError']
+
+## key states that make every snapshot of a volume encrypted with the key fail
+unusable_key_states = ['Disabled', 'PendingDeletion']
+
+## how many create_snapshot DryRun probes run at the same time in one account/region
+preflight_probe_threads = 8
+
+## the error code of a botocore ClientError, or the exception's name for anything else (e.g. endpoint not reachable)
+def error_code(exc):
+    if hasattr(exc, 'response'):
+        return exc.response.get('Error', {}).get('Code', type(exc).__name__)
+    return type(exc).__name__
+
+## run a DryRun call and turn the answer into "ok" or the reason it would fail
+def dry_run(call, **kwargs):
+    try:
+        call(DryRun=True, **kwargs)
+    except Exception as exc:
+        code = error_code(exc)
+        if code == 'DryRunOperation':
+            return "ok"
+        return code
+    return "ok"
+
+## describe a list of volumes a batch of ids at a time, returns {volume_id: volume} for the ones that exist
+## filters (unlike VolumeIds) don't fail the whole call when one of the ids doesn't exist
+def describe_volumes_batched(ec2_client, volume_ids):
+    volume_ids = list(volume_ids)
+    volumes = {}
+    paginator = ec2_client.get_paginator('describe_volumes')
+    for start in range(0, len(volume_ids), snapshot_filter_batch):
+        for page in paginator.paginate(Filters=[{'Name': 'volume-id', 'Values': volume_ids[start:start + snapshot_filter_batch]}]):
+            for volume in page['Volumes']:
+                volumes[volume['VolumeId']] = volume
+    return volumes
+
+## recheck the volumes a discovery run picked for archiving against a live client right before they're queued
+## the listing may be minutes old (inventory cache), and a snapshot from an earlier run that is still tiering down is
+## still in the standard tier, so volumes are dropped when they're gone, no longer in the state they were listed in,
+## or have a snapshot from an archive run (either tier) or an archive tier snapshot from the last archived_within days
+## volume_states is [(volume_id, state when listed)], returns ([volume ids to archive], [why the others were skipped])
+def confirm_archive_candidates(ec2_client, volume_states, archived_within):
+    volume_ids = [volume_id for volume_id, state in volume_states]
+    live_volumes = describe_volumes_batched(ec2_client, volume_ids)
+    recent = {}
+    if archived_within > 0:
+        recent = recent_snapshots(ec2_client, volume_ids, archived_within, archive_runs_only=True)
+
+    confirmed = []
+    skipped = []
+    for volume_id, state in volume_states:
+        if volume_id not in live_volumes:
+            skipped.append(volume_id + " no longer exists")
+        elif live_volumes[volume_id]['State'] != state:
+            skipped.append(volume_id + " is now " + live_volumes[volume_id]['State'] + ", it was listed as " + state)
+        elif volume_id in recent:
+            snapshot_id, start_time, storage_tier = recent[volume_id]
+            skipped.append(volume_id + " already has " + storage_tier + " tier snapshot " + snapshot_id + " from " + start_time.strftime(date_format_str))
+        else:
+            confirmed.append(volume_id)
+    return confirmed, skipped
+
+## split volumes into the ones attached to a single instance, grouped by that instance, and everything else
+## (unattached, multi-attach or not found) which goes through the one volume at a time path
+## returns ({instance_id: [volume ids]}, [volume ids])
+def group_by_instance(ec2_client, volume_ids):
+    volumes = describe_volumes_batched(ec2_client, volume_ids)
+    instances = {}
+    singles = []
+    for volume_id in volume_ids:
+        attachments = [a for a in volumes.get(volume_id, {}).get('Attachments', []) if a.get('State') in ['attached', 'attaching']]
+        if len(attachments) == 1:
+            instances.setdefault(attachments[0]['InstanceId'], []).append(volume_id)
+        else:
+            singles.append(volume_id)
+    return instances, singles
+
+## check everything a run needs in one account/region before any snapshot is taken:
+## which of the volumes exist (one describe_volumes per batch of ids), whether create_snapshot would be allowed on
+## them and modify_snapshot_tier on a snapshot that could still be archived (DryRun), and whether the KMS keys of any
+## encrypted volumes are usable
+## IAM conditions on create_snapshot can depend on the volume's AZ, KMS key and tags, so one volume of each distinct
+## AZ/key/tags combination is tried, all at the same time, and stands for the rest of its group
+## throttling and other transient errors, and KMS keys we aren't allowed to describe, leave a check "unverified"
+## rather than failed
+## returns a dict of the findings with a "verdict" of GO, WARN (some volumes are missing or a check is unverified, the
+## rest can go ahead) or NO-GO
+def preflight_region(ec2_client, kms_client, volume_ids):
+    volume_ids = list(volume_ids)
+    result = {
+        "volumes": len(volume_ids),
+        "found": 0,
+        "missing": [],
+        "denied": [],
+        "unverified": [],
+        "create_snapshot": "not checked",
+        "modify_snapshot_tier": "not checked",
+        "kms": "ok",
+        "verdict": "GO",
+    }
+    no_go = False
+
+    try:
+        volumes = describe_volumes_batched(ec2_client, volume_ids)
+    except Exception as exc:
+        code = error_code(exc)
+        if code in retriable_error_codes:
+            result["create_snapshot"] = "unverified (" + code + ")"
+            result["verdict"] = "WARN"
+        else:
+            result["create_snapshot"] = code
+            result["verdict"] = "NO-GO"
+        return result
+
+    result["found"] = len(volumes)
+    result["missing"] = [v for v in volume_ids if v not in volumes]
+
+    if len(volumes) > 0:
+        groups = {}
+        for volume_id, volume in volumes.items():
+            key_id = volume.get('KmsKeyId') if volume.get('Encrypted') else None
+            tags = frozenset((t['Key'], t['Value']) for t in volume.get('Tags', []))
+            groups.setdefault((volume['AvailabilityZone'], key_id, tags), []).append(volume_id)
+
+        with ThreadPoolExecutor(max_workers=preflight_probe_threads) as executor:
+            probes = {executor.submit(dry_run, ec2_client.create_snapshot, VolumeId=group[0]): group for group in groups.values()}
+            probe_results = [(probes[future], future.result()) for future in probes]
+
+        codes = {}
+        for group, code in probe_results:
+            if code == "ok":
+                continue
+            finding = group[0] + " " + code
+            if len(group) > 1:
+                # the rest of the group has the same AZ, key and tags, so it gets the same answer
+                finding += " (and " + str(len(group) - 1) + " more like it)"
+            if code in retriable_error_codes:
+                code = "unverified (" + code + ")"
+                result["unverified"].append(finding)
+            else:
+                no_go = True
+                result["denied"].append(finding)
+            codes[code] = codes.get(code, 0) + len(group)
+        if len(codes) == 0:
+            result["create_snapshot"] = "ok"
+        else:
+            result["create_snapshot"] = "; ".join(code + " on " + str(count) + " of " + str(len(volumes)) for code, count in sorted(codes.items()))
+    else:
+        result["create_snapshot"] = "no volumes"
+
+    # modify_snapshot_tier needs a real snapshot id to be meaningful, one of ours that's completed and still in the
+    # standard tier, an archived or pending one fails the DryRun for its state rather than for permissions
+    try:
+        snapshots = ec2_client.describe_snapshots(
+            OwnerIds=['self'],
+            Filters=[{'Name': 'storage-tier', 'Values': ['standard']}, {'Name': 'status', 'Values': ['completed']}],
+            MaxResults=5
+        )['Snapshots']
+        if len(snapshots) > 0:
+            result["modify_snapshot_tier"] = dry_run(ec2_client.modify_snapshot_tier, SnapshotId=snapshots[0]['SnapshotId'], StorageTier='archive')
+        else:
+            result["modify_snapshot_tier"] = "unverified (no snapshots)"
+    except Exception as exc:
+        result["modify_snapshot_tier"] = error_code(exc)
+    if result["modify_snapshot_tier"] in retriable_error_codes:
+        result["unverified"].append("modify_snapshot_tier " + result["modify_snapshot_tier"])
+        result["modify_snapshot_tier"] = "unverified (" + result["modify_snapshot_tier"] + ")"
+    elif result["modify_snapshot_tier"] != "ok" and not result["modify_snapshot_tier"].startswith("unverified"):
+        no_go = True
+
+    # only a disabled key or one pending deletion is known to fail the snapshot, a key we can't describe (no
+    # kms:DescribeKey, throttled) or that's in some other state may well still work for EBS
+    key_findings = []
+    for key_id in set(v['KmsKeyId'] for v in volumes.values() if v.get('Encrypted') and v.get('KmsKeyId')):
+        try:
+            key_state = kms_client.describe_key(KeyId=key_id)['KeyMetadata'].get('KeyState', 'unknown')
+        except Exception as exc:
+            key_state = error_code(exc)
+        if key_state == 'Enabled':
+            continue
+        if key_state in unusable_key_states:
+            no_go = True
+            key_findings.append(key_id.split('/')[-1] + " " + key_state)
+        else:
+            key_findings.append(key_id.split('/')[-1] + " unverified (" + key_state + ")")
+            result["unverified"].append("kms key " + key_id + " " + key_state)
+    if len(key_findings) > 0:
+        result["kms"] = "; ".join(sorted(key_findings))
+
+    if no_go:
+        result["verdict"] = "NO-GO"
+    elif len(result["missing"]) > 0 or len(result["unverified"]) > 0:
+        result["verdict"] = "WARN"
+    return result
+
+class ArchiveEngine:
+
+    def __init__(self, workers=1, log=print):
+        self.log_to = log
+        self.log_lock = threading.Lock()
+        self.utc_date_time = datetime.utcnow().strftime(date_format_str)
+        self.jobs = queue.Queue()
+        self.lock = threading.Lock()
+
+        # snapshot id -> [volume id, account, region, notes] for every snapshot that completed
+        self.snapshots = {}
+        # snapshot id -> ArchivedSnapshot(snapshot id, volume id, account, region, notes) for every one that's being tiered down
+        self.archived = {}
+        self.error_list = []
+        self.skipped_count = 0
+        self.archive_skipped_count = 0
+        self.archive_count = 0
+
+        self.threads = []
+        for _ in range(max(workers, 1)):
+            thread = threading.Thread(target=self.worker, daemon=True)
+            thread.start()
+            self.threads.append(thread)
+
+    ## one worker's message at a time, so lines from different workers don't run into each other
+    def log(self, *parts):
+        with self.log_lock:
+            self.log_to(*parts)
+
+    def submit(self, ec2_client, account, region, volume_id, notes):
+        self.jobs.put((self.archive_volume, (ec2_client, account, region, volume_id, notes)))
+
+    ## volumes is a list of (volume id, notes) for volumes attached to instance_id, snapshotted together
+    def submit_instance(self, ec2_client, account, region, instance_id, volumes):
+        self.jobs.put((self.archive_instance, (ec2_client, account, region, instance_id, volumes)))
+
+    def worker(self):
+        while True:
+            job = self.jobs.get()
+            if job is None:
+                return
+            action, job_args = job
+            try:
+                action(*job_args)
+            except Exception as exc:
+                with self.lock:
+                    self.error_list.append("SKIPPED: " + job_args[3] + " failed unexpectedly: " + str(exc))
+                    self.skipped_count += 1
+
+    ## snapshot one volume, wait for it, then start moving the snapshot to the archive tier
+    def archive_volume(self, ec2_client, account, region, volume_id, notes):
+        self.log("creating snapshot for: ", volume_id, account, region, notes + "...(waiting)...")
+
+        try:
+            volume = ec2_client.describe_volumes(VolumeIds=[volume_id])['Volumes'][0]
+        except Exception:
+            with self.lock:
+                self.error_list.append("SKIPPED: " + volume_id + " had errors so we skipped this one entirely.  The vol-id is probably bad.")
+                self.skipped_count += 1
+            return
+
+        try:
+            snapshot_id = ec2_client.create_snapshot(
+                VolumeId=volume_id,
+                TagSpecifications=[
+                    {
+                        'ResourceType': 'snapshot',
+                        'Tags': snapshot_tags(volume, notes, self.utc_date_time)
+                    },
+                ]
+            )['SnapshotId']
+            with aws_trace.span("snapshot wait", args={'volume': volume_id, 'snapshot': snapshot_id}):
+                ec2_client.get_waiter('snapshot_completed').wait(SnapshotIds=[snapshot_id])
+        except Exception:
+            with self.lock:
+                self.error_list.append("SKIPPED: " + volume_id + " had errors so we skipped this one entirely.  The vol-id is probably bad.")
+                self.skipped_count += 1
+            return
+
+        self.log("snapshot " + snapshot_id + " complete.")
+        self.tier_down(ec2_client, snapshot_id, volume_id, account, region, notes)
+
+    ## snapshot all the listed volumes of one instance with a single create_snapshots call, so they share one
+    ## crash-consistent point in time, then tag and tier each snapshot down like archive_volume does
+    ## if the multi-volume snapshot can't be made, the volumes go through archive_volume one at a time instead
+    def archive_instance(self, ec2_client, account, region, instance_id, volumes):
+        notes_by_volume = dict(volumes)
+        self.log("creating snapshots of " + str(len(volumes)) + " volumes on " + instance_id + ": ", " ".join(notes_by_volume.keys()), account, region, "...(waiting)...")
+
+        try:
+            volume_data = describe_volumes_batched(ec2_client, notes_by_volume.keys())
+            instance = ec2_client.describe_instances(InstanceIds=[instance_id])['Reservations'][0]['Instances'][0]
+
+            # leave out every volume on the instance that isn't in the list, boot volume included
+            boot_volume_id = None
+            attached_ids = []
+            for mapping in instance.get('BlockDeviceMappings', []):
+                if 'Ebs' not in mapping:
+                    continue
+                attached_ids.append(mapping['Ebs']['VolumeId'])
+                if mapping['DeviceName'] == instance.get('RootDeviceName'):
+                    boot_volume_id = mapping['Ebs']['VolumeId']
+
+            instance_specification = {
+                'InstanceId': instance_id,
+                'ExcludeBootVolume': boot_volume_id is not None and boot_volume_id not in notes_by_volume,
+            }
+            excluded = [v for v in attached_ids if v not in notes_by_volume and v != boot_volume_id]
+            if len(excluded) > 0:
+                instance_specification['ExcludeDataVolumeIds'] = excluded
+
+            snapshots = ec2_client.create_snapshots(
+                InstanceSpecification=instance_specification,
+                Description="archive of " + instance_id + " volumes created " + self.utc_date_time
+            )['Snapshots']
+        except Exception as exc:
+            self.log("couldn't snapshot " + instance_id + "'s volumes together (" + str(exc) + "), doing them one at a time")
+            for volume_id, notes in volumes:
+                self.archive_volume(ec2_client, account, region, volume_id, notes)
+            return
+
+        snapshot_volumes = {}
+        for snapshot in snapshots:
+            if snapshot['VolumeId'] not in notes_by_volume:
+                with self.lock:
+                    self.error_list.append("WARNING: create_snapshots on " + instance_id + " also made " + snapshot['SnapshotId'] + " of " + snapshot['VolumeId'] + ", which isn't in the list, so it was left as it is")
+                continue
+            snapshot_volumes[snapshot['SnapshotId']] = snapshot['VolumeId']
+
+        # every snapshot gets the same tags it would have had from archive_volume
+        for snapshot_id, volume_id in snapshot_volumes.items():
+            try:
+                ec2_client.create_tags(Resources=[snapshot_id], Tags=snapshot_tags(volume_data[volume_id], notes_by_volume[volume_id], self.utc_date_time))
+            except Exception:
+                with self.lock:
+                    self.error_list.append("ERROR: couldn't tag snapshot " + snapshot_id + " of " + volume_id)
+
+        try:
+            with aws_trace.span("snapshot wait", args={'instance': instance_id, 'snapshots': len(snapshot_volumes)}):
+                ec2_client.get_waiter('snapshot_completed').wait(SnapshotIds=list(snapshot_volumes.keys()))
+        except Exception:
+            with self.lock:
+                self.error_list.append("SKIPPED: the snapshots of " + instance_id + " (" + " ".join(snapshot_volumes.values()) + ") didn't complete")
+                self.skipped_count += len(snapshot_volumes)
+            return
+
+        for snapshot_id, volume_id in snapshot_volumes.items():
+            self.log("snapshot " + snapshot_id + " complete.")
+            self.tier_down(ec2_client, snapshot_id, volume_id, account, region, notes_by_volume[volume_id])
+
+        missing = [v for v in notes_by_volume if v not in snapshot_volumes.values()]
+        if len(missing) > 0:
+            with self.lock:
+                self.error_list.append("SKIPPED: create_snapshots on " + instance_id + " didn't return a snapshot of " + " ".join(missing))
+                self.skipped_count += len(missing)
+
+    ## ask for a completed snapshot to be moved to the archive tier and record how it went
+    def tier_down(self, ec2_client, snapshot_id, volume_id, account, region, notes):
+        with self.lock:
+            self.snapshots[snapshot_id] = [volume_id, account, region, notes]
+
+        try:
+            with aws_trace.span("tier", args={'snapshot': snapshot_id}):
+                ec2_client.modify_snapshot_tier(
+                    SnapshotId=snapshot_id,
+                    StorageTier='archive'
+                )
+            self.log("initiating archive of: ", snapshot_id, volume_id, account, region, notes)
+        except Exception as exc:
+            self.log(exc)
+            with self.lock:
+                self.error_list.append("SKIPPED: Archival of snapshot " + snapshot_id + " failed. You will need to manually tier this one down")
+                self.archive_skipped_count += 1
+            return
+
+        with self.lock:
+            self.archived[snapshot_id] = aws_records.ArchivedSnapshot(snapshot_id, volume_id, account, region, notes)
+            self.archive_count += 1
+
+    ## wait for everything queued so far to finish and stop the workers
+    def close(self):
+        for _ in self.threads:
+            self.jobs.put(None)
+        for thread in self.threads:
+            thread.join()
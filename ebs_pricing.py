@@ -0,0 +1,171 @@
+#!/usr/bin/python3
+
+"""
+EBS price table and monthly cost rollups for the stale volume report (ebs-discover-stale-volumes.py --costs).
+
+The bundled table has on-demand list prices (USD per month) for gp2/gp3/io1/io2/st1/sc1/standard volumes, the
+provisioned IOPS and throughput charges on top of the GB price, and standard/archive tier snapshot storage.
+Regions that aren't in the table use the "default" entry (us-east-1), and has_region_prices() tells you when that
+happened so the caller can say so.  Prices change and vary by region, so check them against
+https://aws.amazon.com/ebs/pricing/ and override whatever differs with a JSON file:
+
+    {
+        "eu-west-1": {"gp3": {"gb": 0.088}, "snapshot-archive": {"gb": 0.0125}},
+        "default": {"gp2": {"gb": 0.095}}
+    }
+
+Only the values you list are replaced, everything else keeps the bundled price.
+
+usage from a script:
+
+    import ebs_pricing
+
+    prices = ebs_pricing.load_prices(args.prices)
+    cost_rollup = ebs_pricing.CostRollup()
+    ...
+    monthly_cost = ebs_pricing.volume_monthly_cost(prices, region, "gp3", 500, 6000, 250)
+    cost_rollup.add(account, region, "gp3", 500, monthly_cost, 0.0, ebs_pricing.archive_monthly_cost(prices, region, 500))
+    ...
+    cost_rollup.write("costs.csv")
+
+price keys per volume type:
+
+    gb                  per GB-month
+    iops                per provisioned IOPS-month above iops_free
+    iops_tiers          [[up to IOPS, price], ..., [null, price]] for tiered IOPS pricing (io2)
+    throughput          per MiB/s-month above throughput_free (gp3)
+"""
+
+import copy
+import csv
+import json
+
+## us-east-1 on-demand list prices, USD per month
+us_east_1_prices = {
+    "gp2": {"gb": 0.10},
+    "gp3": {"gb": 0.08, "iops": 0.005, "iops_free": 3000, "throughput": 0.04, "throughput_free": 125},
+    "io1": {"gb": 0.125, "iops": 0.065},
+    "io2": {"gb": 0.125, "iops_tiers": [[32000, 0.065], [64000, 0.0455], [None, 0.03185]]},
+    "st1": {"gb": 0.045},
+    "sc1": {"gb": 0.015},
+    "standard": {"gb": 0.05},
+    "snapshot": {"gb": 0.05},
+    "snapshot-archive": {"gb": 0.0125},
+}
+
+default_prices = {
+    "default": us_east_1_prices,
+    "us-east-1": us_east_1_prices,
+    "us-east-2": us_east_1_prices,
+    "us-west-2": us_east_1_prices,
+    "eu-west-1": {
+        "gp2": {"gb": 0.11},
+        "gp3": {"gb": 0.088, "iops": 0.0055, "iops_free": 3000, "throughput": 0.044, "throughput_free": 125},
+        "io1": {"gb": 0.138, "iops": 0.072},
+        "io2": {"gb": 0.138, "iops_tiers": [[32000, 0.072], [64000, 0.050], [None, 0.035]]},
+        "st1": {"gb": 0.05},
+        "sc1": {"gb": 0.0168},
+        "standard": {"gb": 0.055},
+        "snapshot": {"gb": 0.05},
+        "snapshot-archive": {"gb": 0.0125},
+    },
+}
+
+## the bundled table with the overrides from a JSON file (if any) merged over it
+def load_prices(override_file=None):
+    prices = copy.deepcopy(default_prices)
+    if override_file is None:
+        return prices
+
+    with open(override_file, 'r', encoding='utf-8') as f:
+        overrides = json.load(f)
+
+    for region, region_overrides in overrides.items():
+        region_prices = prices.setdefault(region, copy.deepcopy(prices["default"]))
+        for price_type, values in region_overrides.items():
+            region_prices.setdefault(price_type, {}).update(values)
+    return prices
+
+def region_prices(prices, region):
+    return prices.get(region, prices["default"])
+
+## False for a region that falls back to the "default" entry, i.e. whose costs are really us-east-1 prices
+def has_region_prices(prices, region):
+    return region in prices
+
+## cost of provisioned IOPS, either a flat price above the free allowance or tiered
+def iops_monthly_cost(type_prices, iops):
+    if "iops_tiers" in type_prices:
+        cost = 0.0
+        lower = 0
+        for upper, price in type_prices["iops_tiers"]:
+            if upper is None or iops <= upper:
+                return cost + (iops - lower) * price
+            cost += (upper - lower) * price
+            lower = upper
+        return cost
+    return max(iops - type_prices.get("iops_free", 0), 0) * type_prices.get("iops", 0.0)
+
+## what a volume costs per month: storage, plus provisioned IOPS and throughput where the type charges for them
+def volume_monthly_cost(prices, region, vol_type, size_gb, iops=None, throughput=None):
+    type_prices = region_prices(prices, region).get(vol_type)
+    if type_prices is None:
+        return None
+
+    cost = size_gb * type_prices.get("gb", 0.0)
+    if iops and ("iops" in type_prices or "iops_tiers" in type_prices):
+        cost += iops_monthly_cost(type_prices, iops)
+    if throughput and "throughput" in type_prices:
+        cost += max(throughput - type_prices.get("throughput_free", 0), 0) * type_prices["throughput"]
+    return cost
+
+## what the same data costs per month as an archive tier snapshot (billed on the full snapshot size)
+def archive_monthly_cost(prices, region, size_gb):
+    return size_gb * region_prices(prices, region)["snapshot-archive"]["gb"]
+
+## running totals per account/region/volume type, added to one row at a time as the report streams out
+class CostRollup:
+
+    def __init__(self):
+        self.totals = {}
+
+    def add(self, account, region, vol_type, size_gb, monthly_cost, archive_snap_cost, archived_cost):
+        for key in [(account, region, vol_type), (account, "ALL", "ALL"), ("ALL", "ALL", "ALL")]:
+            total = self.totals.setdefault(key, [0, 0, 0.0, 0.0, 0.0])
+            total[0] += 1
+            total[1] += size_gb
+            total[2] += monthly_cost or 0.0
+            total[3] += archive_snap_cost
+            total[4] += archived_cost
+
+    ## one row per account/region/type, then a subtotal per account and the grand total
+    def rows(self):
+        detail = sorted(k for k in self.totals if k[1] != "ALL")
+        accounts = sorted(k for k in self.totals if k[1] == "ALL" and k[0] != "ALL")
+        rows = []
+        for key in detail + accounts + [("ALL", "ALL", "ALL")]:
+            if key not in self.totals:
+                continue
+            volumes, size_gb, monthly_cost, archive_snap_cost, archived_cost = self.totals[key]
+            rows.append({
+                "Account": key[0],
+                "Region": key[1],
+                "Vol Type": key[2],
+                "Volumes": volumes,
+                "GB": size_gb,
+                "Monthly Cost": round(monthly_cost, 2),
+                "Archive Snap Monthly Cost": round(archive_snap_cost, 2),
+                "Monthly Cost If Archived": round(archived_cost, 2),
+                "Monthly Savings If Archived": round(monthly_cost - archived_cost, 2),
+            })
+        return rows
+
+    def write(self, filename):
+        rows = self.rows()
+        with open(filename, 'w', encoding='utf-8', newline='') as f:
+            writer = csv.DictWriter(f, fieldnames=["Account", "Region", "Vol Type", "Volumes", "GB", "Monthly Cost",
+                                                   "Archive Snap Monthly Cost", "Monthly Cost If Archived",
+                                                   "Monthly Savings If Archived"])
+            writer.writeheader()
+            writer.writerows(rows)
+        return rows
@@ -15,6 +15,43 @@ arguments:
         Note: The script looks for profiles that point to the same account ID and will ignore all duplicates after the first
               This is common when one has a default profile AND an explicit profile pointing to the same account
 
+    --publish-metrics [True/False]
+        Also publish SSM health counts to CloudWatch (default is False).  Two metrics are sent, both with Account and Region dimensions:
+            InstanceCount       with a Status dimension of Working, PingLost or NoSSMRecord
+            AgentVersionCount   with an AgentVersion dimension bucketed to major.minor (e.g. 3.2)
+        Everything is sent at the end of the run, 1000 datums per put_metric_data call, from the account of the
+        session the script starts with.  The CSV still prints as normal.
+
+    --metrics-namespace [String]
+        CloudWatch namespace for --publish-metrics (default is AWSAdminScripts/SSM)
+
+    --metrics-region [String]
+        Region to publish the metrics in (default is the region of your profile, or us-east-1)
+
+    --metrics-endpoint [URL]
+        Send the metrics somewhere other than the real CloudWatch endpoint, e.g. http://127.0.0.1:5000 for a local stub
+
+    --cache [True/False]
+        Serve repeat describe calls from the local inventory cache in ~/.cache/aws-admin-scripts (default is False)
+        Cached answers can be minutes old, see aws_inventory_cache.py for the per-call TTLs
+        Ignored with --publish-metrics, which always reports live data
+
+    --max-age [seconds]
+        Override every inventory cache TTL.  0 means always go to the API (the cache is still refreshed)
+
+    --rate-limit [True/False/shared]
+        Keep the API calls under a per account/region/service budget with a client side token bucket (default is False)
+        Retries count against the budget too, every attempt waits for its own token
+        "shared" shares the budget with every other script running with "shared" at the same time, through a locked
+        file in ~/.cache/aws-admin-scripts, so overlapping jobs don't throttle each other.  See aws_rate_limit.py
+
+    --rate-limit-file [full path to the file]
+        Share the budget through this file instead (implies --rate-limit shared)
+
+    --trace [full path to the file]
+        Record a timeline of the run (profile, region, phase and every API call, per thread) as Chrome Trace Event JSON
+        that opens in https://ui.perfetto.dev or chrome://tracing.  See aws_trace.py
+
 prerequisites:
 
     pip install boto3
@@ -30,13 +67,19 @@ examples:
 
         Lists only instances for a profile named "seahow1"
 
+    python3 ec2-ssm.py -a True --publish-metrics True > /dev/null
+
+        Publishes SSM health counts for every profile and region to CloudWatch, e.g. from cron, without keeping the CSV
+
 notes:
     For an instance to be considered working by this script, the following must be ALL true:
 
     1. AWS Systems Manager Agent (SSM Agent) installed and running within the OS
 
     2. Instance has connectivity with Systems Manager endpoints
-        ! test with these commands:
+        ! the "SSM Network Path" column works this out from the VPC configuration (interface endpoints, then the
+          subnet's default route to a NAT or internet gateway).  It can't see security groups, NACLs or DNS, so if it
+          says REACHABLE and the agent is still lost, test from the box itself with these commands:
             Linux:
                 nc -vz ssm.<insert region>.amazonaws.com 443
                 nc -vz ec2messages.<insert region>.amazonaws.com 443
@@ -61,6 +104,22 @@ notes:
 
 import boto3
 import argparse
+import aws_inventory_cache
+import aws_rate_limit
+import aws_records
+import aws_session
+import aws_trace
+import sys
+from datetime import datetime
+
+## the three endpoints the SSM agent has to reach, see the notes in the docstring above
+ssm_endpoint_services = ["ssm", "ec2messages", "ssmmessages"]
+
+## ping statuses we count as broken
+ssm_broken_ping_statuses = ["Inactive", "ConnectionLost", "Lost Connection"]
+
+## put_metric_data takes at most 1000 datums per call
+max_metric_data_per_call = 1000
 
 def setup_args():
     parser = argparse.ArgumentParser(
@@ -80,11 +139,278 @@ def setup_args():
                         action='store',
                         help='If you want to loop over all local profiles and pull from all regions')
 
+    parser.add_argument('--publish-metrics',
+                        required=False,
+                        action='store',
+                        help='Publish SSM health counts to CloudWatch (True/False)')
+
+    parser.add_argument('--metrics-namespace',
+                        required=False,
+                        action='store',
+                        help='CloudWatch namespace to publish to (default is AWSAdminScripts/SSM)')
+
+    parser.add_argument('--metrics-region',
+                        required=False,
+                        action='store',
+                        help='Region to publish the CloudWatch metrics in (default is the session region or us-east-1)')
+
+    parser.add_argument('--metrics-endpoint',
+                        required=False,
+                        action='store',
+                        help='Override the CloudWatch endpoint URL, e.g. a local stub for testing')
+
+    parser.add_argument('--cache',
+                        required=False,
+                        action='store',
+                        help='Serve repeat describe calls from the local inventory cache (default is False)')
+
+    parser.add_argument('--max-age',
+                        required=False,
+                        action='store',
+                        help='Override the inventory cache TTLs, in seconds (0 forces fresh data)')
+
+    parser.add_argument('--rate-limit',
+                        required=False,
+                        action='store',
+                        help='Client side API rate limiting, True/False/shared (default is False)')
+
+    parser.add_argument('--rate-limit-file',
+                        required=False,
+                        action='store',
+                        help='File to share the API budget with other scripts through')
+
+    parser.add_argument('--trace',
+                        required=False,
+                        action='store',
+                        help='Write a Chrome trace of the run to this file')
+
     return (parser.parse_args()) 
- 
+
+## pull the vpc endpoints, route tables and subnets for a region in one sweep
+## this is 3 paginated calls per region no matter how many instances there are
+def get_network_inventory(ec2_client, region):
+    network_inventory = {
+        "region": region,
+        "endpoints": {},
+        "main_route_table": {},
+        "subnet_route_table": {},
+        "subnet_vpc": {},
+        "subnet_paths": {}
+    }
+
+    for page in ec2_client.get_paginator('describe_vpc_endpoints').paginate(
+        Filters=[
+            {
+                'Name': 'vpc-endpoint-type',
+                'Values': [
+                    'Interface',
+                ]
+            },
+        ]
+    ):
+        for endpoint in page["VpcEndpoints"]:
+            if endpoint.get("State", "").lower() != "available":
+                continue
+            this_service = endpoint["ServiceName"].split(".")[-1]
+            if this_service in ssm_endpoint_services:
+                # without private dns the default hostnames the agent uses still resolve to the public endpoint
+                if endpoint.get("PrivateDnsEnabled"):
+                    network_inventory["endpoints"][(endpoint["VpcId"], this_service)] = "VPCE"
+                elif (endpoint["VpcId"], this_service) not in network_inventory["endpoints"]:
+                    network_inventory["endpoints"][(endpoint["VpcId"], this_service)] = "VPCE NO PRIVATE DNS"
+
+    for page in ec2_client.get_paginator('describe_route_tables').paginate():
+        for route_table in page["RouteTables"]:
+            for association in route_table.get("Associations", []):
+                if association.get("Main"):
+                    network_inventory["main_route_table"][route_table["VpcId"]] = route_table
+                elif "SubnetId" in association:
+                    network_inventory["subnet_route_table"][association["SubnetId"]] = route_table
+
+    for page in ec2_client.get_paginator('describe_subnets').paginate():
+        for subnet in page["Subnets"]:
+            network_inventory["subnet_vpc"][subnet["SubnetId"]] = subnet["VpcId"]
+
+    return network_inventory
+
+## work out where the default route of a route table goes
+def get_default_route_target(route_table):
+    if route_table is None:
+        return "NO ROUTE TABLE"
+
+    for route in route_table.get("Routes", []):
+        if route.get("DestinationCidrBlock") != "0.0.0.0/0":
+            continue
+        if route.get("State") == "blackhole":
+            return "BLACKHOLE"
+        if route.get("NatGatewayId"):
+            return "NAT"
+        if str(route.get("GatewayId", "")).startswith("igw-"):
+            return "IGW"
+        if route.get("TransitGatewayId"):
+            return "TGW"
+        if route.get("VpcPeeringConnectionId"):
+            return "PEERING"
+        if route.get("NetworkInterfaceId") or route.get("InstanceId"):
+            return "APPLIANCE"
+        return "OTHER"
+
+    return "NO DEFAULT ROUTE"
+
+## figure out (once per subnet) how each ssm endpoint would be reached from it
+## the results are cached in the network inventory so every other instance in the subnet is free
+def get_subnet_paths(network_inventory, subnet_id):
+    if subnet_id in network_inventory["subnet_paths"]:
+        return network_inventory["subnet_paths"][subnet_id]
+
+    vpc_id = network_inventory["subnet_vpc"].get(subnet_id)
+    route_table = network_inventory["subnet_route_table"].get(subnet_id)
+    if route_table is None:
+        route_table = network_inventory["main_route_table"].get(vpc_id)
+    default_route = get_default_route_target(route_table)
+
+    subnet_paths = {}
+    for this_service in ssm_endpoint_services:
+        endpoint_path = network_inventory["endpoints"].get((vpc_id, this_service))
+        if endpoint_path == "VPCE":
+            subnet_paths[this_service] = endpoint_path
+        else:
+            subnet_paths[this_service] = default_route
+
+    network_inventory["subnet_paths"][subnet_id] = subnet_paths
+    return subnet_paths
+
+## pull the ec2 status checks and scheduled events, keyed by instance id so they can be joined onto each row
+## with no instance ids we sweep the whole region 1000 at a time, otherwise we only ask about the ids given
+## (describe_instance_status won't take more than 100 ids per call or MaxResults alongside ids)
+def get_instance_status(ec2_client, instance_ids=None):
+    status_by_id = {}
+    paginator = ec2_client.get_paginator('describe_instance_status')
+
+    if instance_ids is None:
+        page_list = [paginator.paginate(IncludeAllInstances=True, PaginationConfig={'PageSize': 1000})]
+    else:
+        instance_ids = list(instance_ids)
+        page_list = []
+        for i in range(0, len(instance_ids), 100):
+            page_list.append(paginator.paginate(IncludeAllInstances=True, InstanceIds=instance_ids[i:i + 100]))
+
+    for pages in page_list:
+        for page in pages:
+            for status in page["InstanceStatuses"]:
+                event_list = []
+                for event in status.get("Events", []):
+                    # completed/cancelled events stick around with a [Completed] or [Canceled] description prefix
+                    if str(event.get("Description", "")).startswith("["):
+                        continue
+                    if "NotBefore" in event:
+                        event_list.append(event["Code"] + "@" + event["NotBefore"].strftime('%Y-%m-%d'))
+                    else:
+                        event_list.append(event["Code"])
+
+                status_by_id[status["InstanceId"]] = [
+                    str(status.get("SystemStatus", {}).get("Status", "")),
+                    str(status.get("InstanceStatus", {}).get("Status", "")),
+                    " ".join(event_list)
+                ]
+
+    return status_by_id
+
+## set every status to zero for a region so the alarms see a 0 rather than missing data
+def init_region_metrics(metric_counts, account_id, region):
+    for this_status in ["Working", "PingLost", "NoSSMRecord"]:
+        metric_counts.setdefault(("InstanceCount", account_id, region, "Status", this_status), 0)
+
+## tally one ec2 instance into the counts we publish, regardless of whether it ends up in the CSV
+def count_instance_metrics(metric_counts, account_id, region, ssm_matches):
+    if len(ssm_matches) == 0:
+        this_status = "NoSSMRecord"
+    elif ssm_matches[0].ping_status in ssm_broken_ping_statuses:
+        this_status = "PingLost"
+    else:
+        this_status = "Working"
+    metric_counts[("InstanceCount", account_id, region, "Status", this_status)] += 1
+
+    if len(ssm_matches) > 0:
+        # bucket agent versions by major.minor so the dimension count stays small
+        agent_bucket = ".".join(str(ssm_matches[0].agent_version or "unknown").split(".")[:2])
+        metric_key = ("AgentVersionCount", account_id, region, "AgentVersion", agent_bucket)
+        metric_counts[metric_key] = metric_counts.get(metric_key, 0) + 1
+
+## send all the counts to cloudwatch in as few put_metric_data calls as the limits allow
+## returns how many calls it took
+def publish_metrics(cloudwatch_client, namespace, metric_counts, timestamp):
+    metric_data = []
+    for (metric_name, account_id, region, dimension_name, dimension_value), this_count in sorted(metric_counts.items()):
+        metric_data.append({
+            'MetricName': metric_name,
+            'Dimensions': [
+                {
+                    'Name': 'Account',
+                    'Value': account_id
+                },
+                {
+                    'Name': 'Region',
+                    'Value': region
+                },
+                {
+                    'Name': dimension_name,
+                    'Value': dimension_value
+                },
+            ],
+            'Timestamp': timestamp,
+            'Value': this_count,
+            'Unit': 'Count'
+        })
+
+    call_count = 0
+    for i in range(0, len(metric_data), max_metric_data_per_call):
+        cloudwatch_client.put_metric_data(
+            Namespace=namespace,
+            MetricData=metric_data[i:i + max_metric_data_per_call]
+        )
+        call_count = call_count + 1
+
+    return call_count
+
+## turn the per-endpoint paths into the single value we print in the CSV
+def get_network_reason(network_inventory, subnet_id, public_ip):
+    if network_inventory is None:
+        return "UNKNOWN"
+    if subnet_id is None or subnet_id == "None":
+        return "NO SUBNET"
+
+    subnet_paths = get_subnet_paths(network_inventory, subnet_id)
+
+    reachable = []
+    unverified = []
+    unreachable = []
+    for this_service in ssm_endpoint_services:
+        this_path = subnet_paths[this_service]
+        # an igw route only helps if the instance actually has a public address
+        if this_path == "IGW" and (public_ip is None or public_ip == "None"):
+            this_path = "IGW NO PUBLIC IP"
+
+        if this_path in ["VPCE", "NAT", "IGW"]:
+            reachable.append(this_path)
+        elif this_path in ["TGW", "PEERING", "APPLIANCE", "OTHER"]:
+            unverified.append(this_path)
+        else:
+            unreachable.append(this_service + " (" + this_path + ")")
+
+    if len(unreachable) > 0:
+        return "NO PATH TO " + " ".join(unreachable)
+    if len(unverified) > 0:
+        return "UNVERIFIED VIA " + "/".join(sorted(set(unverified)))
+    return "REACHABLE VIA " + "/".join(sorted(set(reachable)))
+
 def main():
     args = setup_args()
 
+    ## everything from here on is timed when --trace is on, the file is written on the way out
+    if args.trace:
+        aws_trace.start(str(args.trace), "ec2-ssm.py")
+
     if args.broken:
         broken = args.broken
     else:
@@ -101,12 +427,47 @@ def main():
     else:
         allprofilesallregions = False
 
+    if args.publish_metrics == "True" or args.publish_metrics == "true":
+        publish = True
+    else:
+        publish = False
+
+    if args.metrics_namespace:
+        metrics_namespace = str(args.metrics_namespace)
+    else:
+        metrics_namespace = "AWSAdminScripts/SSM"
+
+    ## with --cache True, repeat runs within the TTLs are served from the local inventory cache instead of the API
+    ## metrics that go to CloudWatch have to be live, so --publish-metrics always goes to the API
+    if (args.cache == "True" or args.cache == "true") and publish:
+        print("Ignoring --cache True, --publish-metrics needs live data", file=sys.stderr)
+        inventory_cache = None
+    elif args.cache == "True" or args.cache == "true":
+        if args.max_age:
+            inventory_cache = aws_inventory_cache.InventoryCache(max_age=int(args.max_age))
+        else:
+            inventory_cache = aws_inventory_cache.InventoryCache()
+    else:
+        inventory_cache = None
+
+    ## a token bucket per account/region/service keeps us under the API limits, optionally shared with other scripts
+    if args.rate_limit_file:
+        rate_limiter = aws_rate_limit.RateLimiter(state_file=str(args.rate_limit_file))
+    elif args.rate_limit == "shared":
+        rate_limiter = aws_rate_limit.RateLimiter(state_file=aws_rate_limit.default_state_file)
+    elif args.rate_limit == "True" or args.rate_limit == "true":
+        rate_limiter = aws_rate_limit.RateLimiter()
+    else:
+        rate_limiter = None
 
     ## Addresses the case where user just wants to use environment variables or default profile
     if (profile == "noprofile"):
-        session = boto3.Session()
+        session = aws_session.new_session()
     else:
-        session = boto3.Session(profile_name=profile)   
+        session = aws_session.new_session(profile)   
+
+    ## --publish-metrics sends from this session, the profile loop below reuses the name session for each profile
+    metrics_session = session
     
     ## If profile is set to "all", get a list of available local profiles on this box
     if allprofilesallregions == "True" or allprofilesallregions == "true":
@@ -150,7 +511,11 @@ def main():
         "EC2 Instance Type" + "," + 
         "EC2 Avail Zone" + "," +
         "EC2 Instance Profile" + "," +
-        "EC2 Instance State"
+        "EC2 Instance State" + "," +
+        "SSM Network Path" + "," +
+        "EC2 System Status" + "," +
+        "EC2 Instance Status" + "," +
+        "EC2 Scheduled Events"
     )   
 
     # set up an empty list to track account ids and errors
@@ -159,15 +524,19 @@ def main():
 
     account_id_list = []
     error_list = []
+    metric_counts = {}
 
     for this_profile in profile_list:
+        profile_span = aws_trace.begin(this_profile, "profile")
+
         # Open a session and get the info for list particular profile
         # UNLESS they didn't specify a profile at all in which case just use env vars or whatever they're doing
         if this_profile == "noprofile":
-            session = boto3.Session()
+            session = aws_session.new_session()
         else:
-            session = boto3.Session(profile_name=this_profile)
+            session = aws_session.new_session(this_profile)
 
+        sts_span = aws_trace.begin("sts")
         try:
             STS_CLIENT = session.client('sts')
             CURRENT_ACCOUNT_ID = STS_CLIENT.get_caller_identity()['Account']
@@ -176,135 +545,125 @@ def main():
             if CURRENT_ACCOUNT_ID not in account_id_list:
                 account_id_list.append(CURRENT_ACCOUNT_ID)
                 continue_listing = True
+                aws_inventory_cache.enable_cache(session, CURRENT_ACCOUNT_ID, inventory_cache)
+                aws_rate_limit.enable_rate_limit(session, CURRENT_ACCOUNT_ID, rate_limiter)
+                aws_trace.enable_tracing(session, CURRENT_ACCOUNT_ID)
             else:
                 continue_listing = False
         except:
             error_list.append("ERROR: cannot get the current Account ID from the STS service for profile " + this_profile + ".  This can be caused by a profile meant for a snow family device or insufficient permissions")
             continue_listing = False
+        sts_span.end()
         
         if continue_listing == True:
             # Loop over the region_list, which is either a single specified region or all of them
 
             for region in region_list:
+                region_span = aws_trace.begin(region, "region", {'account': CURRENT_ACCOUNT_ID})
+                describe_span = aws_trace.begin("describe")
+
+                ## the instances and ssm agents are kept as compact records with just the fields the report uses
+                ec2_client = session.client('ec2',region_name=region)
+                ec2_data = list(aws_records.page_records(ec2_client.get_paginator('describe_instances').paginate(), 'Reservations', aws_records.instance_record))
 
-                ## see: https://session.amazonaws.com/v1/documentation/api/latest/reference/services/ssm.html#SSM.Client.describe_instance_information
-                ec2 = session.resource('ec2',region_name=region)
-                ec2_data = ec2.instances.all()
+                ## one sweep of the network config for the whole region, used to explain why an agent can't phone home
+                try:
+                    network_inventory = get_network_inventory(ec2_client, region)
+                except Exception as exc:
+                    error_list.append("ERROR: could not read the VPC endpoints/route tables/subnets in " + region + " for profile " + this_profile + ": " + str(exc))
+                    network_inventory = None
 
-                ## see: https://session.amazonaws.com/v1/documentation/api/latest/reference/services/ssm.html#SSM.Client.describe_instance_information
+                ## see: https://boto3.amazonaws.com/v1/documentation/api/latest/reference/services/ssm.html#SSM.Client.describe_instance_information
                 ssm = session.client('ssm',region_name=region)
-                ssm_instances=[]
-                nextToken=""
-                while True:
-                    if nextToken == "":
-                        ssm_data = ssm.describe_instance_information(
-                            Filters=[
-                                {
-                                    'Key': 'ResourceType',
-                                    'Values': [
-                                        'EC2Instance',
-                                ]
-                                },
-                            ],
-                            MaxResults=50
-                        )
+                ssm_pages = ssm.get_paginator('describe_instance_information').paginate(
+                    Filters=[
+                        {
+                            'Key': 'ResourceType',
+                            'Values': [
+                                'EC2Instance',
+                            ]
+                        },
+                    ],
+                    MaxResults=50
+                )
+                ssm_instances = aws_records.page_records(ssm_pages, 'InstanceInformationList', aws_records.ssm_agent_record)
+
+                ## index the ssm records by instance id so each ec2 instance is a dictionary lookup instead of a scan
+                ssm_by_id = {}
+                for ssm_details in ssm_instances:
+                    ssm_by_id.setdefault(ssm_details.instance_id, []).append(ssm_details)
+
+                ## status checks tell us if the box itself is impaired, which is the first thing to rule out when ssm loses it
+                ## if we only want broken agents, only ask about the ones that could end up in the report
+                try:
+                    if broken == "True":
+                        candidate_ids = []
+                        for instance in ec2_data:
+                            ssm_matches = ssm_by_id.get(instance.instance_id, [])
+                            if len(ssm_matches) == 0:
+                                candidate_ids.append(instance.instance_id)
+                            else:
+                                for ssm_details in ssm_matches:
+                                    if ssm_details.ping_status in ssm_broken_ping_statuses:
+                                        candidate_ids.append(instance.instance_id)
+                                        break
+                        status_by_id = get_instance_status(ec2_client, candidate_ids)
                     else:
-                        ssm_data = ssm.describe_instance_information(
-                            Filters=[
-                                {
-                                    'Key': 'ResourceType',
-                                    'Values': [
-                                        'EC2Instance',
-                                ]
-                                },
-                            ],
-                            MaxResults=50,
-                            NextToken=nextToken
-                        )
+                        status_by_id = get_instance_status(ec2_client)
+                except Exception as exc:
+                    error_list.append("ERROR: could not read the instance status checks in " + region + " for profile " + this_profile + ": " + str(exc))
+                    status_by_id = {}
+
+                if publish:
+                    init_region_metrics(metric_counts, CURRENT_ACCOUNT_ID, region)
+
+                describe_span.end()
+                join_span = aws_trace.begin("join", args={'instances': len(ec2_data)})
 
-                    ssm_instances += ssm_data["InstanceInformationList"]
-                    try:
-                        nextToken = ssm_data["NextToken"]
-                    except KeyError as error:
-                        break
-                    
                 ## loop over the list retrieved from ec2
                 for instance in ec2_data:
                     
-                    # stringify instance attributes from boto3 resource
-                    ec2_id = str(instance.id)
+                    # stringify instance attributes from the instance record
+                    ec2_id = str(instance.instance_id)
                     ec2_type = str(instance.instance_type)
-                    ec2_ip = str(instance.private_ip_address)
-                    ec2_pub = str(instance.public_ip_address)
-                    ec2_state = str(instance.state["Name"])
+                    ec2_ip = str(instance.private_ip)
+                    ec2_pub = str(instance.public_ip)
+                    ec2_state = str(instance.state)
+                    ec2_network = get_network_reason(network_inventory, instance.subnet_id, instance.public_ip)
+                    ec2_status = status_by_id.get(ec2_id, ["", "", ""])
 
-                    # As this is a reference which could possibly be of type None, add this logic to prevent an error
-                    if instance.placement is not None:
-                        ec2_az = str(instance.placement["AvailabilityZone"])
-                    else:
-                        ec2_az = "None"
+                    if publish:
+                        count_instance_metrics(metric_counts, CURRENT_ACCOUNT_ID, region, ssm_by_id.get(ec2_id, []))
+
+                    ec2_az = str(instance.availability_zone)
 
                     # As this is a reference which could possibly be of type None, add this logic to prevent an error
-                    if instance.iam_instance_profile is not None:
-                        ec2_iam = str(instance.iam_instance_profile["Arn"].split("/")[1])
+                    if instance.iam_profile_arn is not None:
+                        ec2_iam = str(instance.iam_profile_arn.split("/")[1])
                     else:
                         ec2_iam = "None"
 
                     ## first set a marker so we can tell if there is an ec2 instance with no corresponding ssm record at all.  We will count this as broken too.
                     no_ssm_hits = True
 
-                    ## loop over the list retrieved from ssm
-                    for ssm_details in ssm_instances:   
-                        
+                    ## loop over the ssm records for this instance id (normally just the one)
+                    for ssm_details in ssm_by_id.get(ec2_id, []):
+
                         ## if this record's ec2 instance id matches the ec2 record's, we know we are talking about the same box
-                        ## is this idiomatic python?  no, but it keeps us from querying the AWS API more than once (cost savings / rate limit avoidance)
 
-                        if (ssm_details["InstanceId"]) == instance.id:
+                        if ssm_details.instance_id == instance.instance_id:
                             
                             # we found a corresponding record, so don't worry about this anymore
                             no_ssm_hits = False
 
-                            try:
-                                ssm_computername = str(ssm_details['ComputerName'])
-                            except KeyError as error:
-                                ssm_computername = ""
-
-                            try: 
-                                ssm_platformtype = str(ssm_details['PlatformType'])
-                            except KeyError as error:
-                                ssm_platformtype = ""
-
-                            try: 
-                                ssm_platformname = str(ssm_details['PlatformName'])
-                            except KeyError as error:
-                                ssm_platformname = ""
-
-                            try: 
-                                ssm_platformversion = str(ssm_details['PlatformVersion'])
-                            except KeyError as error:
-                                ssm_platformversion = ""
-
-                            try: 
-                                ssm_ipaddress = str(ssm_details['IPAddress'])
-                            except KeyError as error:
-                                ssm_ipaddress = ""
-
-                            try: 
-                                ssm_agentversion = str(ssm_details['AgentVersion'])
-                            except KeyError as error:
-                                ssm_agentversion = ""
-
-                            try: 
-                            
-                                ssm_pingstatus = str(ssm_details['PingStatus'])
-                            except KeyError as error:
-                                ssm_pingstatus = ""
-
-                            
-                            try: 
-                                ssm_resourcetype = str(ssm_details['ResourceType'])
-                            except KeyError as error:
-                                ssm_resourcetype = ""
+                            ssm_computername = ssm_details.computer_name
+                            ssm_platformtype = ssm_details.platform_type
+                            ssm_platformname = ssm_details.platform_name
+                            ssm_platformversion = ssm_details.platform_version
+                            ssm_ipaddress = ssm_details.ip_address
+                            ssm_agentversion = ssm_details.agent_version
+                            ssm_pingstatus = ssm_details.ping_status
+                            ssm_resourcetype = ssm_details.resource_type
                             
                             ssm_broken = "SSM WORKING"
                             ssm_broken_reason = "NONE"
@@ -317,7 +676,7 @@ def main():
                                 ## This means they set the arg so only broken ones show.  
                                 
                                 ## The following will detect brokenness
-                                if (ssm_pingstatus == "Inactive" or ssm_pingstatus == "Lost Connection"):
+                                if (ssm_pingstatus in ssm_broken_ping_statuses):
                                     ssm_showme = True
                                     ssm_broken = "SSM BROKEN"
                                     ssm_broken_reason = "PING LOST"
@@ -349,7 +708,11 @@ def main():
                                     ec2_type + "," + 
                                     ec2_az + "," + 
                                     ec2_iam + "," +
-                                    ec2_state
+                                    ec2_state + "," +
+                                    ec2_network + "," +
+                                    ec2_status[0] + "," +
+                                    ec2_status[1] + "," +
+                                    ec2_status[2]
                                 )
                             next
                     
@@ -375,9 +738,39 @@ def main():
                             ec2_type + "," + 
                             ec2_az + "," + 
                             ec2_iam + "," +
-                            ec2_state
+                            ec2_state + "," +
+                            ec2_network + "," +
+                            ec2_status[0] + "," +
+                            ec2_status[1] + "," +
+                            ec2_status[2]
                         )
 
+                join_span.end()
+                region_span.end()
+
+        profile_span.end()
+
+    # everything goes to cloudwatch from the session we started with, i.e. the account this runs in
+    if publish:
+        publish_span = aws_trace.begin("publish")
+        if args.metrics_region:
+            metrics_region = str(args.metrics_region)
+        elif metrics_session.region_name:
+            metrics_region = metrics_session.region_name
+        else:
+            metrics_region = "us-east-1"
+
+        try:
+            if args.metrics_endpoint:
+                cloudwatch = metrics_session.client('cloudwatch',region_name=metrics_region,endpoint_url=str(args.metrics_endpoint))
+            else:
+                cloudwatch = metrics_session.client('cloudwatch',region_name=metrics_region)
+            call_count = publish_metrics(cloudwatch, metrics_namespace, metric_counts, datetime.utcnow())
+            print("Published " + str(len(metric_counts)) + " metrics to " + metrics_namespace + " in " + str(call_count) + " put_metric_data calls", file=sys.stderr)
+        except Exception as exc:
+            error_list.append("ERROR: could not publish metrics to CloudWatch: " + str(exc))
+        publish_span.end()
+
     # print out any error messages we flagged along the way
     for this_error in error_list:
         print(this_error)
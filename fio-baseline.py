@@ -0,0 +1,399 @@
+#!/usr/bin/python3
+
+"""
+Keeps the results of fioparser.sh / fio-benchmark.py runs in a local SQLite file and compares a new run against the
+earlier ones, so you don't have to diff output directories by hand after every FSx or EBS configuration change.
+
+commands:
+
+    store
+        Parse the fio json+ results in one or more directories and add them to the store under a target name and label.
+        Each run is kept with its host, target, pattern, block size, iodepth and fio timestamp, plus its IOPS, bandwidth,
+        percentiles and compressed latency histogram
+
+    compare
+        For every pattern/bs/iodepth point, compare the candidate runs (by default the most recent label for the target)
+        against the baseline runs (by default every other label for the target within --days).  Reports the change in
+        IOPS, bandwidth and p99 with a bootstrap confidence interval, and flags the points where the whole interval is
+        on the wrong side of --threshold percent as REGRESSION (or IMPROVED).  A point with fewer than 2 runs on either
+        side gets no interval and is flagged "insufficient runs" instead
+
+    list
+        Show the targets and labels in the store
+
+arguments:
+
+    -d or --directory [String ...]
+        Directories with fio json+ output to store (store only)
+
+    -t or --target [String]
+        What was tested, e.g. fsx-ontap-vol1 or ebs-gp3-3000 (required for store and compare)
+
+    -l or --label [String]
+        Name for this batch of runs (store: default is the current date and time, compare: the candidate label)
+
+    -b or --baseline [String]
+        Comma separated labels to use as the baseline (compare only, default is every other label within --days)
+
+    --days [Number]
+        How far back the default baseline looks (default is 365)
+
+    --host [String]
+        Only compare runs from this host
+
+    --threshold [Number]
+        Smallest change in percent worth flagging (default is 5)
+
+    --confidence [Number]
+        Confidence level for the bootstrap intervals (default is 95)
+
+    --db [String]
+        The SQLite file (default is ~/fio-results.sqlite)
+
+    -o or --output [String]
+        Also write the comparison to this CSV
+
+prerequisites:
+
+    pip3 install numpy
+
+examples:
+
+    python3 fio-baseline.py store -t fsx-ontap-vol1 -d /ontap/output -l before-throughput-change
+
+    python3 fio-baseline.py store -t fsx-ontap-vol1 -d /ontap/output -l after-throughput-change
+
+    python3 fio-baseline.py compare -t fsx-ontap-vol1
+
+        Compares after-throughput-change (the latest) with everything stored for fsx-ontap-vol1 in the past year
+"""
+
+import argparse
+import csv
+import os
+import sqlite3
+import sys
+import time
+import zlib
+from datetime import datetime, timezone
+
+import numpy as np
+
+import fioparser
+
+default_db = os.path.join(os.path.expanduser('~'), 'fio-results.sqlite')
+
+## the measurements we compare, and which direction is bad for each
+compare_metrics = [
+    ("iops", "lower"),
+    ("bw_mib", "lower"),
+    ("clat_p99_ms", "higher"),
+]
+
+bootstrap_samples = 2000
+
+def setup_args():
+    parser = argparse.ArgumentParser(
+        description='Arguments')
+
+    parser.add_argument('command',
+                        choices=['store', 'compare', 'list'],
+                        help='store, compare or list')
+
+    parser.add_argument('-d', '--directory',
+                        required=False,
+                        action='store',
+                        nargs='+',
+                        help='Directories with fio json+ results')
+
+    parser.add_argument('-t', '--target',
+                        required=False,
+                        action='store',
+                        help='What was tested')
+
+    parser.add_argument('-l', '--label',
+                        required=False,
+                        action='store',
+                        help='Label for this batch of runs')
+
+    parser.add_argument('-b', '--baseline',
+                        required=False,
+                        action='store',
+                        help='Comma separated baseline labels')
+
+    parser.add_argument('--days',
+                        required=False,
+                        action='store',
+                        help='How far back the default baseline looks (default is 365)')
+
+    parser.add_argument('--host',
+                        required=False,
+                        action='store',
+                        help='Only compare runs from this host')
+
+    parser.add_argument('--threshold',
+                        required=False,
+                        action='store',
+                        help='Smallest change in percent worth flagging (default is 5)')
+
+    parser.add_argument('--confidence',
+                        required=False,
+                        action='store',
+                        help='Confidence level in percent (default is 95)')
+
+    parser.add_argument('--db',
+                        required=False,
+                        action='store',
+                        help='SQLite file to use')
+
+    parser.add_argument('-o', '--output',
+                        required=False,
+                        action='store',
+                        help='CSV to write the comparison to')
+
+    return (parser.parse_args())
+
+def open_store(db_file):
+    if os.path.dirname(db_file):
+        os.makedirs(os.path.dirname(db_file), exist_ok=True)
+    connection = sqlite3.connect(db_file)
+    connection.execute(
+        'CREATE TABLE IF NOT EXISTS fio_runs ('
+        'target TEXT, label TEXT, host TEXT, pattern TEXT, bs TEXT, iodepth INTEGER, timestamp REAL, '
+        'runtime_s REAL, bw_mib REAL, iops REAL, clat_p50_ms REAL, clat_p90_ms REAL, clat_p99_ms REAL, clat_p999_ms REAL, '
+        'histogram BLOB, '
+        'PRIMARY KEY (target, host, pattern, bs, iodepth, timestamp))'
+    )
+    connection.execute('CREATE INDEX IF NOT EXISTS fio_runs_label ON fio_runs (target, label)')
+    return connection
+
+## parse every fio result in the directories and add them to the store, returns how many runs went in
+def store_runs(connection, target, label, directories):
+    rows = []
+    for directory in directories:
+        for name in sorted(os.listdir(directory)):
+            path = os.path.join(directory, name)
+            if not os.path.isfile(path):
+                continue
+            fio_data = fioparser.load_fio_json(path)
+            if fio_data is None:
+                continue
+            histogram = fioparser.fio_histogram(fio_data)
+            row = fioparser.fio_row(path, fio_data, histogram)
+            if row is None:
+                continue
+            row = dict(zip(fioparser.result_dtype.names, row))
+            timestamp = float(fio_data.get("timestamp", os.path.getmtime(path)))
+
+            rows.append((
+                target, label, row["host"], row["pattern"], row["bs"], row["iodepth"], timestamp,
+                row["runtime_s"], row["bw_mib"], row["iops"],
+                row["clat_p50_ms"], row["clat_p90_ms"], row["clat_p99_ms"], row["clat_p999_ms"],
+                zlib.compress(histogram.tobytes(), 6)
+            ))
+
+    connection.executemany('INSERT OR REPLACE INTO fio_runs VALUES (?,?,?,?,?,?,?,?,?,?,?,?,?,?,?)', rows)
+    connection.commit()
+    return len(rows)
+
+## pull the runs for a target as column arrays, optionally limited to some labels, a host, and a time window
+def load_runs(connection, target, labels=None, host=None, since=None):
+    query = 'SELECT label, host, pattern, bs, iodepth, timestamp, iops, bw_mib, clat_p99_ms FROM fio_runs WHERE target=?'
+    params = [target]
+    if labels is not None:
+        query += ' AND label IN (' + ','.join('?' * len(labels)) + ')'
+        params += list(labels)
+    if host is not None:
+        query += ' AND host=?'
+        params.append(host)
+    if since is not None:
+        query += ' AND timestamp>=?'
+        params.append(since)
+
+    rows = connection.execute(query, params).fetchall()
+    columns = ["label", "host", "pattern", "bs", "iodepth", "timestamp", "iops", "bw_mib", "clat_p99_ms"]
+    runs = {}
+    for i, name in enumerate(columns):
+        runs[name] = np.array([r[i] for r in rows])
+    return runs
+
+## bootstrap interval for the percent change in the mean from baseline to candidate
+## both sets are resampled with replacement in one go, so this is a handful of array operations per point
+def bootstrap_delta(baseline, candidate, rng, confidence=95.0):
+    baseline_means = baseline[rng.integers(0, len(baseline), (bootstrap_samples, len(baseline)))].mean(axis=1)
+    candidate_means = candidate[rng.integers(0, len(candidate), (bootstrap_samples, len(candidate)))].mean(axis=1)
+    valid = baseline_means != 0
+    deltas = (candidate_means[valid] - baseline_means[valid]) / baseline_means[valid] * 100.0
+
+    tail = (100.0 - confidence) / 2.0
+    low, high = np.percentile(deltas, [tail, 100.0 - tail])
+    return float(low), float(high)
+
+## compare candidate runs against baseline runs per pattern/bs/iodepth
+def compare_runs(baseline, candidate, threshold=5.0, confidence=95.0):
+    rng = np.random.default_rng(0)
+    comparison = []
+
+    def point_keys(runs):
+        return np.char.add(np.char.add(np.char.add(runs["pattern"].astype(str), "|"), runs["bs"].astype(str)),
+                           np.char.add("|", runs["iodepth"].astype(str)))
+
+    baseline_keys = point_keys(baseline)
+    candidate_keys = point_keys(candidate)
+
+    for key in np.unique(candidate_keys):
+        in_baseline = baseline_keys == key
+        in_candidate = candidate_keys == key
+        if not in_baseline.any():
+            continue
+
+        pattern, bs, iodepth = key.split("|")
+        point = {
+            "pattern": pattern,
+            "bs": bs,
+            "iodepth": int(iodepth),
+            "baseline_runs": int(in_baseline.sum()),
+            "candidate_runs": int(in_candidate.sum()),
+        }
+        flags = []
+        # resampling one run just gives that run back every time, so there's no interval to speak of
+        enough_runs = point["baseline_runs"] >= 2 and point["candidate_runs"] >= 2
+        if not enough_runs:
+            flags.append("insufficient runs")
+        for metric, bad_direction in compare_metrics:
+            base_values = baseline[metric][in_baseline].astype(float)
+            cand_values = candidate[metric][in_candidate].astype(float)
+            base_mean = base_values.mean()
+            cand_mean = cand_values.mean()
+            if base_mean != 0:
+                delta = (cand_mean - base_mean) / base_mean * 100.0
+            else:
+                delta = 0.0
+
+            point[metric + "_baseline"] = round(float(base_mean), 3)
+            point[metric + "_candidate"] = round(float(cand_mean), 3)
+            point[metric + "_delta_pct"] = round(delta, 1)
+            if not enough_runs:
+                point[metric + "_ci_low_pct"] = None
+                point[metric + "_ci_high_pct"] = None
+                continue
+            low, high = bootstrap_delta(base_values, cand_values, rng, confidence)
+            point[metric + "_ci_low_pct"] = round(low, 1)
+            point[metric + "_ci_high_pct"] = round(high, 1)
+
+            # only flag it when the whole interval is past the threshold
+            if bad_direction == "lower" and high < -threshold:
+                flags.append(metric + " REGRESSION")
+            elif bad_direction == "higher" and low > threshold:
+                flags.append(metric + " REGRESSION")
+            elif bad_direction == "lower" and low > threshold:
+                flags.append(metric + " IMPROVED")
+            elif bad_direction == "higher" and high < -threshold:
+                flags.append(metric + " IMPROVED")
+
+        point["flags"] = " ".join(flags)
+        comparison.append(point)
+
+    comparison.sort(key=lambda p: (p["pattern"], p["bs"], p["iodepth"]))
+    return comparison
+
+## "low..high" for the printed table, empty when there weren't enough runs for an interval
+def ci_text(point, metric):
+    if point[metric + "_ci_low_pct"] is None:
+        return ""
+    return str(point[metric + "_ci_low_pct"]) + ".." + str(point[metric + "_ci_high_pct"])
+
+def main():
+    args = setup_args()
+
+    if args.db:
+        db_file = str(args.db)
+    else:
+        db_file = default_db
+
+    connection = open_store(db_file)
+
+    if args.command == "list":
+        for target, label, runs, first, last in connection.execute(
+                'SELECT target, label, COUNT(*), MIN(timestamp), MAX(timestamp) FROM fio_runs GROUP BY target, label ORDER BY target, MIN(timestamp)'):
+            print(target + "," + label + "," + str(runs) + " runs," +
+                  datetime.fromtimestamp(first, timezone.utc).strftime('%Y-%m-%d %H:%M') + "," +
+                  datetime.fromtimestamp(last, timezone.utc).strftime('%Y-%m-%d %H:%M'))
+        return
+
+    if not args.target:
+        sys.exit("ERROR: " + args.command + " needs a target (-t)")
+    target = str(args.target)
+
+    if args.command == "store":
+        if not args.directory:
+            sys.exit("ERROR: store needs at least one results directory (-d)")
+        if args.label:
+            label = str(args.label)
+        else:
+            label = datetime.now(timezone.utc).strftime('%Y-%m-%d %H:%M')
+        stored = store_runs(connection, target, label, args.directory)
+        print("Stored " + str(stored) + " runs for " + target + " as " + label + " in " + db_file)
+        return
+
+    if args.threshold:
+        threshold = float(args.threshold)
+    else:
+        threshold = 5.0
+
+    if args.confidence:
+        confidence = float(args.confidence)
+    else:
+        confidence = 95.0
+
+    if args.days:
+        since = time.time() - float(args.days) * 86400
+    else:
+        since = time.time() - 365 * 86400
+
+    # the candidate is the named label or the one with the newest runs
+    if args.label:
+        candidate_label = str(args.label)
+    else:
+        latest = connection.execute('SELECT label FROM fio_runs WHERE target=? ORDER BY timestamp DESC LIMIT 1', (target,)).fetchone()
+        if latest is None:
+            sys.exit("ERROR: nothing stored for " + target)
+        candidate_label = latest[0]
+
+    if args.baseline:
+        baseline_labels = str(args.baseline).split(",")
+        baseline = load_runs(connection, target, baseline_labels, args.host)
+    else:
+        baseline = load_runs(connection, target, None, args.host, since)
+        keep = baseline["label"] != candidate_label if len(baseline["label"]) > 0 else np.array([], dtype=bool)
+        baseline = {k: v[keep] for k, v in baseline.items()}
+    candidate = load_runs(connection, target, [candidate_label], args.host)
+
+    if len(candidate["label"]) == 0 or len(baseline["label"]) == 0:
+        sys.exit("ERROR: need runs in both the candidate (" + candidate_label + ") and the baseline to compare")
+
+    comparison = compare_runs(baseline, candidate, threshold, confidence)
+
+    print("Comparing " + candidate_label + " (" + str(len(candidate["label"])) + " runs) against " +
+          str(len(np.unique(baseline["label"]))) + " baseline labels (" + str(len(baseline["label"])) + " runs), " +
+          str(confidence) + "% intervals")
+    print("pattern,bs,iodepth,IOPS change %,IOPS CI,MiB/s change %,MiB/s CI,p99 change %,p99 CI,flags")
+    for point in comparison:
+        print(
+            point["pattern"] + "," + point["bs"] + "," + str(point["iodepth"]) + "," +
+            ",".join(str(point[metric + "_delta_pct"]) + "," + ci_text(point, metric) for metric, _ in compare_metrics) + "," +
+            point["flags"]
+        )
+
+    regressions = [p for p in comparison if "REGRESSION" in p["flags"]]
+    print(" ")
+    print(str(len(regressions)) + " of " + str(len(comparison)) + " points regressed by more than " + str(threshold) + "%")
+
+    if args.output and len(comparison) > 0:
+        with open(str(args.output), 'w', encoding='utf-8', newline='') as f:
+            writer = csv.DictWriter(f, fieldnames=list(comparison[0].keys()))
+            writer.writeheader()
+            writer.writerows(comparison)
+
+if __name__ == "__main__":
+    exit(main())
@@ -0,0 +1,639 @@
+#!/usr/bin/python3
+
+"""
+Runs the same fio job matrix as fioparser.sh (seqread/seqwrite 64k, randread/randwrite 8k) but sweeps iodepth adaptively
+instead of running all 21 depths from 1 to 100.  For each pattern it doubles the iodepth until an extra step adds less
+than --threshold percent IOPS while p99 latency goes up, then bisects back towards the knee to pin it down.
+Most volumes flatten out well before iodepth 100, so this usually takes a third of the time of the full sweep.
+
+Every run is written as <host>-<pattern>-<iodepth> json+ in the output directory, the same as fioparser.sh, so the
+results and summary CSVs from fioparser.py are directly comparable with a full sweep.
+
+arguments:
+
+    -w or --working [String]
+        Directory on the volume you want to test (default is /ontap/working)
+
+    -o or --output [String]
+        Where the fio results and CSVs go (default is /ontap/output)
+
+    -p or --patterns [String]
+        Comma separated list of patterns to run (default is seqread,seqwrite,randread,randwrite)
+
+    -t or --threshold [Number]
+        Stop going deeper once a step adds less than this percentage of IOPS while p99 rises (default is 5)
+
+    -m or --maxdepth [Number]
+        Never go past this iodepth (default is 100)
+
+    -r or --refine [Number]
+        How many extra runs to spend narrowing down the knee per pattern (default is 3)
+
+    --adaptive [True/False]
+        Set to False to run the full fixed list of depths like fioparser.sh (default is True)
+
+    --ioengine [String]
+        fio ioengine (default is libaio)
+
+    --direct [1/0]
+        Whether fio uses O_DIRECT (default is 1).  tmpfs doesn't support O_DIRECT, so use 0 there
+
+    --size [String]
+        File size per job (default is 4G)
+
+    --ramp [Number]
+        Seconds of ramp time per run (default is 20)
+
+    --runtime [Number]
+        Seconds of measured runtime per run (default is 30, or 50 as the upper limit with --steady True)
+
+    --steady [True/False]
+        Stream fio's status every --interval seconds and stop each job as soon as IOPS and bandwidth settle,
+        instead of always running the full ramp + runtime (default is False).  --ramp defaults to 0 in this mode
+        and --runtime becomes the most any one job is allowed to run
+        Note: with no ramp, fio's totals and percentiles include the warm-up seconds before the job settled
+
+    --window [Number]
+        Number of status samples the steady state test looks at (default is 5)
+
+    --slope [Number]
+        Steady once the trend across the window is under this percent of the mean per sample (default is 1)
+
+    --variation [Number]
+        ...and the coefficient of variation across the window is under this percent (default is 5)
+
+    --interval [Number]
+        Seconds between fio status reports in steady mode (default is 1)
+
+    -c or --clients [String]
+        Comma separated fio servers (host or host:port, the port defaults to 8765) to run every job on at the same time
+        instead of running fio locally.  Start them with "fio --server" (or "fio --server=,8766" for another port) and
+        make sure --working exists on each.  One fio process drives all of them, so every job starts on all the
+        servers together, and its json+ is split into one file per client kept as <host_port>-<pattern>-<iodepth>.
+        The sweep follows the aggregate: IOPS and bandwidth added up, p99 from the merged latency bins.
+        Not available with --steady
+
+    --scaling [True/False]
+        With --clients, repeat the sweep with 1, 2, ... up to all the clients, each in its own clients-<n> directory,
+        and write fio-scaling.csv showing aggregate throughput against the number of clients (default is False)
+
+prerequisites:
+
+    fio (apt install fio || yum install fio)
+    pip3 install numpy
+
+examples:
+
+    python3 fio-benchmark.py -w /zfs/working -o /zfs/output
+
+        Adaptive sweep of all four patterns against an FSx for OpenZFS volume mounted to /zfs
+
+    python3 fio-benchmark.py -w /dev/shm/fiotest -o /tmp/fioout --ioengine io_uring --direct 0 --size 256M --ramp 1 --runtime 5
+
+        Quick local check of the driver against tmpfs (a loop device mounted somewhere works too, and can keep --direct 1)
+
+    python3 fio-benchmark.py -w /zfs/working -o /zfs/output --steady True
+
+        Adaptive sweep where every job stops once it has settled (at most 50 seconds each)
+
+    python3 fio-benchmark.py -w /ontap/working -o /ontap/output -c 10.0.1.10,10.0.1.11,10.0.1.12 --scaling True
+
+        Drives the same sweep from three instances running "fio --server" and shows how far the volume scales with clients
+
+    fio --server=,8765 --daemonize=/tmp/fio1.pid; fio --server=,8766 --daemonize=/tmp/fio2.pid
+    python3 fio-benchmark.py -w /dev/shm/fiotest -o /tmp/fioout -c localhost:8765,localhost:8766 --scaling True --direct 0 --size 256M --ramp 1 --runtime 5
+
+        Local check of the client mode with two fio servers on this box
+"""
+
+import argparse
+import csv
+import json
+import os
+import signal
+import subprocess
+import sys
+import time
+
+import numpy as np
+
+import fioparser
+
+## the job matrix from fioparser.sh: pattern name -> (fio rw, block size)
+sweep_patterns = {
+    "seqread": ("read", "64k"),
+    "seqwrite": ("write", "64k"),
+    "randread": ("randread", "8k"),
+    "randwrite": ("randwrite", "8k"),
+}
+
+## the fixed list fioparser.sh runs, used when --adaptive False
+full_sweep_depths = [1, 2, 3, 4, 5, 6, 7, 8, 9, 10, 15, 20, 25, 30, 40, 50, 60, 70, 80, 90, 100]
+
+def setup_args():
+    parser = argparse.ArgumentParser(
+        description='Arguments')
+
+    parser.add_argument('-w', '--working',
+                        required=False,
+                        action='store',
+                        help='Directory on the volume to test')
+
+    parser.add_argument('-o', '--output',
+                        required=False,
+                        action='store',
+                        help='Directory for the results')
+
+    parser.add_argument('-p', '--patterns',
+                        required=False,
+                        action='store',
+                        help='Comma separated patterns to run')
+
+    parser.add_argument('-t', '--threshold',
+                        required=False,
+                        action='store',
+                        help='Minimum percent IOPS gain worth going deeper for (default is 5)')
+
+    parser.add_argument('-m', '--maxdepth',
+                        required=False,
+                        action='store',
+                        help='Maximum iodepth (default is 100)')
+
+    parser.add_argument('-r', '--refine',
+                        required=False,
+                        action='store',
+                        help='Extra runs per pattern to narrow down the knee (default is 3)')
+
+    parser.add_argument('--adaptive',
+                        required=False,
+                        action='store',
+                        help='False runs the full fixed sweep (default is True)')
+
+    parser.add_argument('--ioengine',
+                        required=False,
+                        action='store',
+                        help='fio ioengine (default is libaio)')
+
+    parser.add_argument('--direct',
+                        required=False,
+                        action='store',
+                        help='1 to use O_DIRECT, 0 not to (default is 1)')
+
+    parser.add_argument('--size',
+                        required=False,
+                        action='store',
+                        help='File size per job (default is 4G)')
+
+    parser.add_argument('--ramp',
+                        required=False,
+                        action='store',
+                        help='Ramp time in seconds (default is 20)')
+
+    parser.add_argument('--runtime',
+                        required=False,
+                        action='store',
+                        help='Runtime in seconds (default is 30)')
+
+    parser.add_argument('--steady',
+                        required=False,
+                        action='store',
+                        help='Stop each job once it reaches steady state (default is False)')
+
+    parser.add_argument('--window',
+                        required=False,
+                        action='store',
+                        help='Samples in the steady state window (default is 5)')
+
+    parser.add_argument('--slope',
+                        required=False,
+                        action='store',
+                        help='Max slope in percent of mean per sample (default is 1)')
+
+    parser.add_argument('--variation',
+                        required=False,
+                        action='store',
+                        help='Max coefficient of variation in percent (default is 5)')
+
+    parser.add_argument('--interval',
+                        required=False,
+                        action='store',
+                        help='Seconds between status samples (default is 1)')
+
+    parser.add_argument('-c', '--clients',
+                        required=False,
+                        action='store',
+                        help='Comma separated fio servers (host or host:port) to run the jobs on')
+
+    parser.add_argument('--scaling',
+                        required=False,
+                        action='store',
+                        help='Repeat the sweep for 1 up to all the clients (default is False)')
+
+    return (parser.parse_args())
+
+## build the fio command line for one run, same options as fioparser.sh apart from the ones you can override
+def fio_command(working, output_file, rw, bs, iodepth, settings):
+    return [
+        "fio",
+        "--name=fiotest",
+        "--directory=" + working,
+        "--ioengine=" + settings["ioengine"],
+        "--direct=" + str(settings["direct"]),
+        "--numjobs=2",
+        "--nrfiles=4",
+        "--runtime=" + str(settings["runtime"]),
+        "--group_reporting",
+        "--time_based",
+        "--stonewall",
+        "--size=" + settings["size"],
+        "--ramp_time=" + str(settings["ramp"]),
+        "--bs=" + bs,
+        "--rw=" + rw,
+        "--iodepth=" + str(iodepth),
+        "--fallocate=none",
+        "--output-format=json+",
+        "--output=" + output_file,
+    ]
+
+## fio --client only takes jobs from a job file (which it sends to the server), so write the same options as a file
+def fio_job_file(path, working, rw, bs, iodepth, settings):
+    options = [c[2:] for c in fio_command(working, "", rw, bs, iodepth, settings)[1:] if not c.startswith("--output")]
+    with open(path, 'w', encoding='utf-8') as f:
+        f.write("[fiotest]\n")
+        for option in options:
+            if option.startswith("name="):
+                continue
+            f.write(option + "\n")
+
+## "host" or "host:port" -> what fio --client wants ("host,port"), and a label that's safe in a file name
+def fio_client_address(client):
+    if ":" in client:
+        host, port = client.rsplit(":", 1)
+    else:
+        host, port = client, "8765"
+    return host + "," + port, host + "_" + port
+
+## run one job on every client at once through fio's client/server mode
+## a single fio process drives all the servers (one --client=<server> <job file> pair each), so the jobs are started
+## together and their json+ comes back in one document, with a client_stats entry per server
+## that document is split into one file per client, and the runs are merged the same way fioparser.py -m does it:
+## IOPS and bandwidth added across the clients, percentiles from the merged bins
+def run_fio_clients(working, output_dir, clients, pattern, iodepth, settings):
+    rw, bs = sweep_patterns[pattern]
+    job_file = os.path.join(output_dir, "fio-benchmark-" + pattern + "-" + str(iodepth) + ".fio")
+    fio_job_file(job_file, working, rw, bs, iodepth, settings)
+
+    combined_file = os.path.join(output_dir, "all-clients-" + pattern + "-" + str(iodepth) + ".json")
+    command = ["fio", "--output-format=json+", "--output=" + combined_file]
+    for client in clients:
+        command += ["--client=" + fio_client_address(client)[0], job_file]
+    subprocess.run(command, stdout=subprocess.DEVNULL, check=True)
+    os.remove(job_file)
+
+    fio_data = fioparser.load_fio_json(combined_file)
+    if fio_data is None:
+        raise RuntimeError("fio didn't write any JSON to " + combined_file)
+    client_jobs = fioparser.fio_jobs(fio_data)
+
+    rows = []
+    histograms = []
+    for client in clients:
+        address, label = fio_client_address(client)
+        host, port = address.split(",")
+        jobs = [job for job in client_jobs if job.get("hostname") == host and str(job.get("port", port)) == port]
+        if len(jobs) == 0:
+            raise RuntimeError("no results for " + client + " in " + combined_file)
+
+        # the same layout as a single fio --client run, so fioparser.py reads each client as its own host
+        client_data = {key: value for key, value in fio_data.items() if key != "client_stats"}
+        client_data["client_stats"] = jobs
+        output_file = os.path.join(output_dir, label + "-" + pattern + "-" + str(iodepth))
+        with open(output_file, 'w', encoding='utf-8') as f:
+            json.dump(client_data, f)
+
+        histogram = fioparser.fio_histogram(client_data)
+        rows.append(fioparser.fio_row(output_file, client_data, histogram))
+        histograms.append(histogram)
+    os.remove(combined_file)
+
+    merged = fioparser.merge_results(np.array(rows, dtype=fioparser.result_dtype), np.array(histograms, dtype=np.int64))[0]
+    return merged[0]
+
+## true once the last window of samples is flat (small slope) and quiet (small variation)
+## samples is a list of per-interval values, e.g. IOPS
+def steady_state_reached(samples, window, max_slope_pct, max_cv_pct):
+    if len(samples) < window:
+        return False
+
+    values = np.array(samples[-window:], dtype=float)
+    mean = values.mean()
+    if mean <= 0:
+        return False
+
+    slope = np.polyfit(np.arange(window), values, 1)[0]
+    if abs(slope) / mean * 100.0 > max_slope_pct:
+        return False
+    if values.std() / mean * 100.0 > max_cv_pct:
+        return False
+    return True
+
+## add up the IOs and bytes fio has done so far across all jobs and directions
+def status_totals(status):
+    ios = 0
+    io_bytes = 0
+    for job in status.get("jobs", []):
+        for direction in ["read", "write", "trim"]:
+            ios += job.get(direction, {}).get("total_ios", 0)
+            io_bytes += job.get(direction, {}).get("io_bytes", 0)
+    return ios, io_bytes
+
+## run fio with periodic json status on stdout and interrupt it once IOPS and bandwidth settle
+## fio still prints its final report when interrupted, which is what ends up in output_file
+def run_fio_steady(command, output_file, settings):
+    command = [c for c in command if not c.startswith("--output=")]
+    command.append("--status-interval=" + str(settings["interval"]))
+
+    start_time = time.time()
+    process = subprocess.Popen(command, stdout=subprocess.PIPE)
+    decoder = json.JSONDecoder()
+    buffer = ""
+    last_status = None
+    previous = None
+    iops_samples = []
+    bw_samples = []
+    converged = False
+
+    while True:
+        chunk = os.read(process.stdout.fileno(), 1 << 20)
+        if not chunk:
+            break
+        buffer += chunk.decode('utf-8', errors='replace')
+
+        # fio writes one complete JSON document per interval, pull out as many as we have
+        while True:
+            start = buffer.find('{')
+            if start < 0:
+                buffer = ""
+                break
+            try:
+                status, end = decoder.raw_decode(buffer, start)
+            except ValueError:
+                buffer = buffer[start:]
+                break
+            buffer = buffer[end:]
+            last_status = status
+
+            ios, io_bytes = status_totals(status)
+            timestamp = status.get("timestamp_ms", time.time() * 1000.0) / 1000.0
+            # the counters stay at zero through any ramp time, there's nothing to judge until IO shows up
+            if previous is not None and ios > previous[0] and timestamp > previous[2]:
+                elapsed = timestamp - previous[2]
+                iops_samples.append((ios - previous[0]) / elapsed)
+                bw_samples.append((io_bytes - previous[1]) / elapsed)
+            previous = (ios, io_bytes, timestamp)
+
+            if (not converged
+                    and steady_state_reached(iops_samples, settings["window"], settings["slope"], settings["variation"])
+                    and steady_state_reached(bw_samples, settings["window"], settings["slope"], settings["variation"])):
+                converged = True
+                process.send_signal(signal.SIGINT)
+
+    if process.wait() not in [0, -signal.SIGINT] and not converged:
+        raise subprocess.CalledProcessError(process.returncode, command)
+    if last_status is None:
+        raise RuntimeError("fio didn't print any JSON status")
+
+    last_status["fio-benchmark"] = {
+        "converged": converged,
+        "wall_clock_s": round(time.time() - start_time, 1),
+        "samples": len(iops_samples),
+    }
+    with open(output_file, 'w', encoding='utf-8') as f:
+        json.dump(last_status, f)
+
+## run fio once and hand back its parsed row (see fioparser.result_dtype)
+def run_fio(working, output_dir, host, pattern, iodepth, settings):
+    rw, bs = sweep_patterns[pattern]
+    output_file = os.path.join(output_dir, host + "-" + pattern + "-" + str(iodepth))
+    command = fio_command(working, output_file, rw, bs, iodepth, settings)
+
+    if settings["steady"]:
+        run_fio_steady(command, output_file, settings)
+    else:
+        subprocess.run(command, check=True, stdout=subprocess.DEVNULL)
+
+    fio_data = fioparser.load_fio_json(output_file)
+    if fio_data is None:
+        raise RuntimeError("fio didn't write any JSON to " + output_file)
+    return fioparser.fio_row(output_file, fio_data)
+
+## sweep iodepth for one pattern, probe(iodepth) runs the job and returns (iops, p99)
+## returns the measurements by depth and the depth we think the knee is at
+def adaptive_sweep(probe, max_depth=100, threshold=5.0, refine_steps=3):
+    measurements = {}
+
+    def measure(depth):
+        if depth not in measurements:
+            measurements[depth] = probe(depth)
+        return measurements[depth]
+
+    # double the depth until the extra IOPS aren't worth the extra latency
+    probed = []
+    depth = 1
+    plateau = False
+    while True:
+        iops, p99 = measure(depth)
+        if len(probed) > 0:
+            prev_iops, prev_p99 = measurements[probed[-1]]
+            if prev_iops > 0:
+                gain = (iops - prev_iops) / prev_iops * 100.0
+            else:
+                gain = 100.0
+            if gain < threshold and p99 > prev_p99:
+                plateau = True
+        probed.append(depth)
+        if plateau or depth >= max_depth:
+            break
+        depth = min(depth * 2, max_depth)
+
+    if not plateau or len(probed) < 3:
+        best = max(measurements, key=lambda d: measurements[d][0])
+        return measurements, best
+
+    # the step into probed[-1] didn't help, so the knee sits somewhere after probed[-3] and at or before probed[-2]
+    plateau_iops = max(measurements[probed[-1]][0], measurements[probed[-2]][0])
+    lo = probed[-3]
+    hi = probed[-2]
+    for _ in range(refine_steps):
+        if hi - lo <= 1:
+            break
+        mid = (lo + hi) // 2
+        iops, p99 = measure(mid)
+        if iops >= plateau_iops * (1 - threshold / 100.0):
+            hi = mid
+        else:
+            lo = mid
+
+    return measurements, hi
+
+def main():
+    args = setup_args()
+
+    if args.working:
+        working = str(args.working)
+    else:
+        working = "/ontap/working"
+
+    if args.output:
+        output_dir = str(args.output)
+    else:
+        output_dir = "/ontap/output"
+
+    if args.patterns:
+        patterns = str(args.patterns).split(",")
+    else:
+        patterns = list(sweep_patterns.keys())
+
+    for pattern in patterns:
+        if pattern not in sweep_patterns:
+            sys.exit("ERROR: unknown pattern " + pattern + ", pick from " + ",".join(sweep_patterns.keys()))
+
+    if args.threshold:
+        threshold = float(args.threshold)
+    else:
+        threshold = 5.0
+
+    if args.maxdepth:
+        max_depth = int(args.maxdepth)
+    else:
+        max_depth = 100
+
+    if args.refine:
+        refine_steps = int(args.refine)
+    else:
+        refine_steps = 3
+
+    if args.adaptive == "False" or args.adaptive == "false":
+        adaptive = False
+    else:
+        adaptive = True
+
+    if args.steady == "True" or args.steady == "true":
+        steady = True
+    else:
+        steady = False
+
+    # in steady mode the status stream decides when the job is warmed up and done, runtime is just the cap
+    settings = {
+        "ioengine": str(args.ioengine) if args.ioengine else "libaio",
+        "direct": str(args.direct) if args.direct else "1",
+        "size": str(args.size) if args.size else "4G",
+        "ramp": int(args.ramp) if args.ramp else (0 if steady else 20),
+        "runtime": int(args.runtime) if args.runtime else (50 if steady else 30),
+        "steady": steady,
+        "window": int(args.window) if args.window else 5,
+        "slope": float(args.slope) if args.slope else 1.0,
+        "variation": float(args.variation) if args.variation else 5.0,
+        "interval": int(args.interval) if args.interval else 1,
+    }
+
+    if args.clients:
+        clients = str(args.clients).split(",")
+    else:
+        clients = []
+
+    if args.scaling == "True" or args.scaling == "true":
+        scaling = True
+    else:
+        scaling = False
+
+    if len(clients) > 0 and steady:
+        sys.exit("ERROR: --steady needs fio's status stream, which fio --client doesn't give us, so it can't be used with --clients")
+    if scaling and len(clients) == 0:
+        sys.exit("ERROR: --scaling needs a list of fio servers in --clients")
+
+    # each pass is one full sweep: locally, on all the clients, or with --scaling on the first 1, 2, ... clients
+    if scaling:
+        passes = [(os.path.join(output_dir, "clients-" + str(n)), clients[:n]) for n in range(1, len(clients) + 1)]
+    else:
+        passes = [(output_dir, clients)]
+
+    # with --clients the working directory is on the fio servers, not here
+    if len(clients) == 0:
+        os.makedirs(working, exist_ok=True)
+    host = os.uname().nodename
+    start_time = time.time()
+    run_count = 0
+    scaling_rows = []
+
+    for pass_dir, pass_clients in passes:
+        os.makedirs(pass_dir, exist_ok=True)
+        if len(pass_clients) > 0:
+            print("Running on " + str(len(pass_clients)) + " clients: " + ",".join(pass_clients))
+
+        for pattern in patterns:
+
+            def probe(iodepth):
+                if len(pass_clients) > 0:
+                    row = dict(zip(fioparser.merged_dtype.names, run_fio_clients(working, pass_dir, pass_clients, pattern, iodepth, settings)))
+                    row["converged"] = ""
+                else:
+                    row = dict(zip(fioparser.result_dtype.names, run_fio(working, pass_dir, host, pattern, iodepth, settings)))
+                if row["converged"] == "yes":
+                    steady_note = ", settled after " + str(round(row["runtime_s"], 1)) + "s"
+                elif row["converged"] == "no":
+                    steady_note = ", did not settle in " + str(round(row["runtime_s"], 1)) + "s"
+                else:
+                    steady_note = ""
+                print(pattern + " iodepth " + str(iodepth) + ": " + str(round(row["iops"], 1)) + " IOPS, p99 " + str(round(row["clat_p99_ms"], 3)) + "ms" + steady_note)
+                return row["iops"], row["clat_p99_ms"]
+
+            if adaptive:
+                measurements, knee = adaptive_sweep(probe, max_depth, threshold, refine_steps)
+                print(pattern + ": knee at iodepth " + str(knee) + " after " + str(len(measurements)) + " runs")
+            else:
+                measurements = {}
+                for iodepth in full_sweep_depths:
+                    if iodepth <= max_depth:
+                        measurements[iodepth] = probe(iodepth)
+            run_count += len(measurements)
+
+        # parse everything that's in the output directory the same way fioparser.sh would
+        results, histograms = fioparser.load_results_with_histograms(pass_dir)
+        summary = fioparser.summarize(results)
+        fioparser.write_results_csv(results, os.path.join(pass_dir, "fio-results.csv"))
+        fioparser.write_summary_csv(summary, os.path.join(pass_dir, "fio-results-summary.csv"))
+        print("Results written to " + os.path.join(pass_dir, "fio-results.csv") + " and " + os.path.join(pass_dir, "fio-results-summary.csv"))
+
+        # with clients, the per-client runs are also merged into aggregate numbers per pattern and iodepth
+        if len(pass_clients) > 0:
+            merged = fioparser.merge_results(results, histograms)[0]
+            fioparser.write_results_csv(merged, os.path.join(pass_dir, "fio-results-merged.csv"))
+            for row in merged.tolist():
+                scaling_rows.append((len(pass_clients),) + row)
+            print("Aggregate results written to " + os.path.join(pass_dir, "fio-results-merged.csv"))
+
+    if scaling:
+        scaling_output = os.path.join(output_dir, "fio-scaling.csv")
+        with open(scaling_output, 'w', encoding='utf-8', newline='') as f:
+            writer = csv.writer(f)
+            writer.writerow(("clients",) + fioparser.merged_dtype.names)
+            for row in scaling_rows:
+                writer.writerow([round(v, 3) if isinstance(v, float) else v for v in row])
+
+        # best aggregate IOPS per pattern for each client count
+        iops_column = 1 + fioparser.merged_dtype.names.index("iops")
+        print(" ")
+        for pattern in patterns:
+            line = pattern + " best IOPS by clients:"
+            for pass_dir, pass_clients in passes:
+                best = max([row[iops_column] for row in scaling_rows if row[0] == len(pass_clients) and row[1] == pattern], default=0.0)
+                line += " " + str(len(pass_clients)) + "=" + str(round(best, 1))
+            print(line)
+        print("Scaling results written to " + scaling_output)
+
+    print(" ")
+    print(str(run_count) + " fio runs in " + str(round((time.time() - start_time) / 60, 1)) + " minutes (the full sweep is " + str(len(full_sweep_depths) * len(patterns) * len(passes)) + ")")
+
+if __name__ == "__main__":
+    exit(main())
@@ -0,0 +1,686 @@
+#!/usr/bin/python3
+
+"""
+Parses the fio results written by fioparser.sh (fio --output-format=json+) into a table of bandwidth, IOPS
+and completion latency percentiles per IO pattern and iodepth, then works out where each pattern saturates.
+
+This replaces the python2 fio-parser.py (https://github.com/jtulak/fio-parser) that fioparser.sh used to call.
+
+arguments:
+
+    -d or --directory [String ...]
+        Directory (or directories) holding the fio output files.  Every file in them that contains fio JSON is read,
+        anything else is ignored
+
+    -o or --output [String]
+        Where to write the results CSV (default is <directory>/fio-results.csv)
+        The per-pattern summary goes next to it as <name>-summary.csv
+
+    -l or --p99limit [Number]
+        Latency budget in milliseconds for the "best IOPS at p99 < X ms" column of the summary (default is 10)
+
+    -k or --knee [Number]
+        A pattern counts as saturated at the first iodepth that reaches this fraction of its best IOPS (default is 0.9)
+
+    -m or --merge [True/False]
+        Also merge every run that shares a pattern, block size and iodepth, across hosts and repeated runs, into
+        <name>-merged.csv (default is False).  The json+ latency bins of all the runs are added together and the
+        percentiles are worked out from the merged histogram, so they're exact to fio's bucket precision rather than an
+        average of percentiles.  IOPS and bandwidth are averaged over repeats of the same host and added up across hosts
+
+    -L or --latlog [String ...]
+        Analyze one or more fio per-IO latency logs (write_lat_log with log_avg_msec=0) instead of a results directory.
+        All the logs given (e.g. one per job with --numjobs=2) are combined into one time series of p50/p99/p99.9 per
+        second, written to -o (default is fio-latency.csv next to the first log), and any stretch of seconds whose p99
+        is more than --outlier times the median p99 is reported as an outlier window in <name>-outliers.csv
+        Logs written with log_unix_epoch=1 are counted from the earliest first sample of all the logs given
+
+    --outlier [Number]
+        How many times the median p99 a second has to be to count as an outlier (default is 3)
+
+    --units [ns/us]
+        Unit of the latency values in the logs (default is ns, which is what fio 3.x writes)
+
+prerequisites:
+
+    pip3 install numpy
+
+examples:
+
+    python3 fioparser.py -d /zfs/output
+
+        Writes /zfs/output/fio-results.csv and /zfs/output/fio-results-summary.csv
+
+    python3 fioparser.py -d /zfs/output -l 2 -o ./zfs.csv
+
+        Same, but the summary looks for the best IOPS with p99 under 2ms and both CSVs go to the current directory
+
+    python3 fioparser.py -L /zfs/output/fiotest_clat.1.log /zfs/output/fiotest_clat.2.log
+
+        Per-second latency percentiles and outlier windows from a tail-latency run
+
+    python3 fioparser.py -d ./hostA-run1 ./hostA-run2 ./hostB-run1 -m True -o ./fsx.csv
+
+        Results from three directories, plus fsx-merged.csv with the runs merged per pattern and iodepth
+
+notes:
+
+    The pattern (seqread, seqwrite, randread, randwrite...) and iodepth come from the job options fio records in its
+    JSON, and the host name from the file name fioparser.sh gives each run (<host>-<pattern>-<iodepth>).
+    Latencies are completion latency (clat) in milliseconds, bandwidth is MiB/s.
+    runtime_s is how long fio actually measured for.  converged is only filled in for fio-benchmark.py --steady runs,
+    and says whether the job settled before hitting its maximum runtime.
+    If a run has more than one job (no --group_reporting), IOPS and bandwidth are added up and the latency bins of the
+    jobs are merged before the percentiles are worked out.  Output without json+ bins falls back to the worst job's percentile.
+    Output from fio --client (client_stats instead of jobs) is read the same way.
+
+    Latency logs can run to many GB, so they're memory-mapped and parsed a chunk at a time straight into NumPy arrays.
+    Each second only keeps a histogram in fio's own log-linear buckets (1856 counters), so memory depends on how
+    many seconds the log covers, not how many IOs it holds, and the percentiles are exact to fio's bucket precision.
+"""
+
+import argparse
+import csv
+import io
+import json
+import mmap
+import os
+import re
+import sys
+
+import numpy as np
+
+## fio's rw option mapped to the names fioparser.sh uses for its output files
+rw_patterns = {
+    "read": "seqread",
+    "write": "seqwrite",
+    "rw": "seqrw",
+    "readwrite": "seqrw",
+    "randread": "randread",
+    "randwrite": "randwrite",
+    "randrw": "randrw",
+    "trim": "seqtrim",
+    "randtrim": "randtrim",
+}
+
+## the percentiles we pull out of fio's clat_ns percentile list, with the column names we give them
+percentile_columns = [
+    ("50.000000", "clat_p50_ms"),
+    ("90.000000", "clat_p90_ms"),
+    ("99.000000", "clat_p99_ms"),
+    ("99.900000", "clat_p999_ms"),
+]
+
+result_dtype = np.dtype([
+    ("host", "U64"),
+    ("pattern", "U16"),
+    ("bs", "U16"),
+    ("iodepth", "i4"),
+    ("numjobs", "i4"),
+    ("runtime_s", "f8"),
+    ("converged", "U3"),
+    ("bw_mib", "f8"),
+    ("iops", "f8"),
+    ("clat_mean_ms", "f8"),
+] + [(name, "f8") for _, name in percentile_columns])
+
+## fio's latency histogram layout (FIO_IO_U_PLAT_* in fio's stat.h): 29 groups of 64 log-linear buckets
+plat_bits = 6
+plat_val = 1 << plat_bits
+plat_group_nr = 29
+plat_nr = plat_group_nr * plat_val
+
+## how much of a latency log we parse at a time
+latlog_chunk_bytes = 8 << 20
+
+## latency log timestamps at or above this (September 2001 in ms) are wall clock ones from log_unix_epoch=1,
+## a run would have to go on for 31 years to get there counting from the start of the job
+unix_epoch_ms_threshold = 10 ** 12
+
+def setup_args():
+    parser = argparse.ArgumentParser(
+        description='Arguments')
+
+    parser.add_argument('-d', '--directory',
+                        required=False,
+                        action='store',
+                        nargs='+',
+                        help='Directory with the fio json+ output files')
+
+    parser.add_argument('-o', '--output',
+                        required=False,
+                        action='store',
+                        help='Where to write the results CSV')
+
+    parser.add_argument('-l', '--p99limit',
+                        required=False,
+                        action='store',
+                        help='p99 latency budget in ms for the summary (default is 10)')
+
+    parser.add_argument('-k', '--knee',
+                        required=False,
+                        action='store',
+                        help='Fraction of best IOPS that counts as saturated (default is 0.9)')
+
+    parser.add_argument('-m', '--merge',
+                        required=False,
+                        action='store',
+                        help='Merge runs per pattern/iodepth across hosts and repeats (default is False)')
+
+    parser.add_argument('-L', '--latlog',
+                        required=False,
+                        action='store',
+                        nargs='+',
+                        help='fio per-IO latency log(s) to analyze')
+
+    parser.add_argument('--outlier',
+                        required=False,
+                        action='store',
+                        help='Outlier factor over the median p99 (default is 3)')
+
+    parser.add_argument('--units',
+                        required=False,
+                        action='store',
+                        help='ns or us (default is ns)')
+
+    return (parser.parse_args())
+
+## read one fio output file and return its JSON, or None if it isn't one
+## fio sometimes prints warnings ahead of the JSON, so skip to the first brace
+def load_fio_json(path):
+    with open(path, 'r', encoding='utf-8', errors='replace') as f:
+        text = f.read()
+
+    start = text.find('{')
+    if start < 0:
+        return None
+    try:
+        return json.loads(text[start:])
+    except ValueError:
+        return None
+
+## work out the host name fioparser.sh baked into the file name (<host>-<pattern>-<iodepth>)
+def host_from_filename(path, pattern, iodepth):
+    name = os.path.basename(path)
+    name = re.sub(r'\.json$', '', name)
+    suffix = "-" + pattern + "-" + str(iodepth)
+    if name.endswith(suffix):
+        return name[:-len(suffix)]
+    return name
+
+## options can be set globally or per job, the job ones win
+def job_options(fio_data, job):
+    options = dict(fio_data.get("global options", {}))
+    options.update(job.get("job options", {}))
+    return options
+
+## the directions that actually did some IO in a job
+def active_directions(job):
+    directions = []
+    for direction in ["read", "write", "trim"]:
+        if job.get(direction, {}).get("io_bytes", 0) > 0:
+            directions.append(job[direction])
+    return directions
+
+## turn a json+ clat_ns "bins" dict ({latency ns: count}) into a dense array of fio's buckets
+def bins_to_histogram(bins):
+    histogram = np.zeros(plat_nr, dtype=np.int64)
+    if bins:
+        values = np.fromiter((int(k) for k in bins.keys()), dtype=np.int64, count=len(bins))
+        counts = np.fromiter(bins.values(), dtype=np.int64, count=len(bins))
+        np.add.at(histogram, plat_val_to_idx(values), counts)
+    return histogram
+
+## the job entries of a run.  Output from fio --client (fio-benchmark.py --clients) has them under client_stats,
+## along with an "All clients" total when one fio talked to several servers, which we skip so nothing counts twice
+def fio_jobs(fio_data):
+    if "client_stats" in fio_data:
+        return [job for job in fio_data["client_stats"] if job.get("jobname") != "All clients"]
+    return fio_data.get("jobs", [])
+
+## all the completion latency bins of a run added together, across jobs and directions
+def fio_histogram(fio_data):
+    histogram = np.zeros(plat_nr, dtype=np.int64)
+    for job in fio_jobs(fio_data):
+        for direction in active_directions(job):
+            histogram += bins_to_histogram(direction.get("clat_ns", {}).get("bins"))
+    return histogram
+
+## turn one fio JSON document into a row tuple matching result_dtype
+## pass the run's histogram in if you already have it, otherwise it's built from the json+ bins
+def fio_row(path, fio_data, histogram=None):
+    jobs = fio_jobs(fio_data)
+    if len(jobs) == 0:
+        return None
+
+    options = job_options(fio_data, jobs[0])
+    pattern = rw_patterns.get(options.get("rw", options.get("readwrite", "read")), options.get("rw", "unknown"))
+    iodepth = int(options.get("iodepth", 1))
+    bs = str(options.get("bs", ""))
+    numjobs = int(options.get("numjobs", 1))
+
+    # fio-benchmark.py records whether a steady state run settled before its maximum runtime
+    steady_state = fio_data.get("fio-benchmark", {})
+    if "converged" in steady_state:
+        converged = "yes" if steady_state["converged"] else "no"
+    else:
+        converged = ""
+
+    runtime_s = 0.0
+    bw_kib = 0.0
+    iops = 0.0
+    clat_mean_ns = 0.0
+    percentiles = [0.0] * len(percentile_columns)
+
+    for job in jobs:
+        for direction in active_directions(job):
+            runtime_s = max(runtime_s, direction.get("runtime", 0) / 1000.0)
+            bw_kib += direction.get("bw", 0)
+            iops += direction.get("iops", 0)
+            clat = direction.get("clat_ns", {})
+            clat_mean_ns = max(clat_mean_ns, clat.get("mean", 0))
+            job_percentiles = clat.get("percentile", {})
+            for i, (key, _) in enumerate(percentile_columns):
+                percentiles[i] = max(percentiles[i], job_percentiles.get(key, 0))
+
+    # with json+ bins the percentiles come from the merged histogram of all the jobs, which is what fio itself
+    # would report for a single job and is right for several, unlike taking the worst one
+    if histogram is None:
+        histogram = fio_histogram(fio_data)
+    if histogram.sum() > 0:
+        percentiles = histogram_percentiles(histogram, [float(key) for key, _ in percentile_columns])[0]
+
+    return (
+        host_from_filename(path, pattern, iodepth),
+        pattern,
+        bs,
+        iodepth,
+        numjobs,
+        runtime_s,
+        converged,
+        bw_kib / 1024.0,
+        iops,
+        clat_mean_ns / 1e6,
+    ) + tuple(p / 1e6 for p in percentiles)
+
+## read every fio JSON file in one or more directories into a structured array sorted by host, pattern and iodepth,
+## along with a matching 2D array of each run's latency histogram
+def load_results_with_histograms(directories):
+    if isinstance(directories, str):
+        directories = [directories]
+
+    rows = []
+    histograms = []
+    for directory in directories:
+        for name in sorted(os.listdir(directory)):
+            path = os.path.join(directory, name)
+            if not os.path.isfile(path):
+                continue
+            fio_data = load_fio_json(path)
+            if fio_data is None:
+                continue
+            histogram = fio_histogram(fio_data)
+            row = fio_row(path, fio_data, histogram)
+            if row is not None:
+                rows.append(row)
+                histograms.append(histogram)
+
+    results = np.array(rows, dtype=result_dtype)
+    histograms = np.array(histograms, dtype=np.int64).reshape(-1, plat_nr)
+    order = np.lexsort((results["iodepth"], results["pattern"], results["host"]))
+    return results[order], histograms[order]
+
+## same as above without the histograms
+def load_results(directories):
+    return load_results_with_histograms(directories)[0]
+
+merged_dtype = np.dtype([
+    ("pattern", "U16"),
+    ("bs", "U16"),
+    ("iodepth", "i4"),
+    ("hosts", "i4"),
+    ("runs", "i4"),
+    ("bw_mib", "f8"),
+    ("iops", "f8"),
+] + [(name, "f8") for _, name in percentile_columns])
+
+## merge every run that shares pattern, block size and iodepth by adding up their latency bins
+## IOPS and bandwidth are averaged over repeats of the same host, then added across hosts (they ran side by side)
+def merge_results(results, histograms):
+    point_key = np.char.add(np.char.add(np.char.add(results["pattern"], "|"), results["bs"]), np.char.add("|", results["iodepth"].astype("U8")))
+    host_key = np.char.add(np.char.add(point_key, "|"), results["host"])
+
+    points, point_index = np.unique(point_key, return_inverse=True)
+    host_points, host_index = np.unique(host_key, return_inverse=True)
+
+    merged_histograms = np.zeros((len(points), plat_nr), dtype=np.int64)
+    np.add.at(merged_histograms, point_index, histograms)
+
+    # average each host's repeats, then add the hosts up
+    repeats = np.bincount(host_index)
+    host_iops = np.bincount(host_index, weights=results["iops"]) / repeats
+    host_bw = np.bincount(host_index, weights=results["bw_mib"]) / repeats
+    host_point = np.zeros(len(host_points), dtype=np.int64)
+    host_point[host_index] = point_index
+
+    first = np.zeros(len(points), dtype=np.int64)
+    first[point_index[::-1]] = np.arange(len(results))[::-1]
+
+    merged = np.zeros(len(points), dtype=merged_dtype)
+    merged["pattern"] = results["pattern"][first]
+    merged["bs"] = results["bs"][first]
+    merged["iodepth"] = results["iodepth"][first]
+    merged["hosts"] = np.bincount(host_point, minlength=len(points))
+    merged["runs"] = np.bincount(point_index, minlength=len(points))
+    merged["iops"] = np.bincount(host_point, weights=host_iops, minlength=len(points))
+    merged["bw_mib"] = np.bincount(host_point, weights=host_bw, minlength=len(points))
+
+    percentiles = histogram_percentiles(merged_histograms, [float(key) for key, _ in percentile_columns]) / 1e6
+    for i, (_, name) in enumerate(percentile_columns):
+        merged[name] = percentiles[:, i]
+
+    order = np.lexsort((merged["iodepth"], merged["pattern"]))
+    return merged[order], merged_histograms[order]
+
+## per host/pattern: best IOPS, where it saturates, and the best IOPS that still keeps p99 under the budget
+def summarize(results, p99_limit_ms=10.0, knee=0.9):
+    summary = []
+    if len(results) == 0:
+        return summary
+
+    # results are sorted, so each host/pattern is a contiguous run of rows
+    group_key = np.char.add(np.char.add(results["host"], "|"), results["pattern"])
+    new_group = np.ones(len(results), dtype=bool)
+    new_group[1:] = group_key[1:] != group_key[:-1]
+    group_starts = np.flatnonzero(new_group)
+    group_ids = np.cumsum(new_group) - 1
+
+    best_iops = np.maximum.reduceat(results["iops"], group_starts)
+
+    # a row is past the knee once it gets within that fraction of its group's best
+    saturated = results["iops"] >= knee * best_iops[group_ids]
+    budget_iops = np.where(results["clat_p99_ms"] < p99_limit_ms, results["iops"], -1.0)
+
+    for g, start in enumerate(group_starts):
+        end = group_starts[g + 1] if g + 1 < len(group_starts) else len(results)
+        best_index = start + int(np.argmax(results["iops"][start:end]))
+        saturation_index = start + int(np.argmax(saturated[start:end]))
+        budget_index = start + int(np.argmax(budget_iops[start:end]))
+        has_budget = budget_iops[budget_index] >= 0
+
+        summary.append({
+            "host": results["host"][start],
+            "pattern": results["pattern"][start],
+            "bs": results["bs"][start],
+            "best_iops": round(float(best_iops[g]), 1),
+            "best_iops_iodepth": int(results["iodepth"][best_index]),
+            "best_bw_mib": round(float(results["bw_mib"][best_index]), 1),
+            "saturation_iodepth": int(results["iodepth"][saturation_index]),
+            "saturation_iops": round(float(results["iops"][saturation_index]), 1),
+            "saturation_p99_ms": round(float(results["clat_p99_ms"][saturation_index]), 3),
+            "p99_limit_ms": p99_limit_ms,
+            "best_iops_under_p99_limit": round(float(results["iops"][budget_index]), 1) if has_budget else "",
+            "best_iops_under_p99_limit_iodepth": int(results["iodepth"][budget_index]) if has_budget else "",
+        })
+
+    return summary
+
+## map latencies (ns) to fio's histogram bucket index, the vectorized version of plat_val_to_idx() in fio's stat.c
+def plat_val_to_idx(values):
+    values = np.asarray(values, dtype=np.int64)
+    msb = np.frexp(np.maximum(values, 1).astype(np.float64))[1].astype(np.int64) - 1
+    error_bits = np.maximum(msb - plat_bits, 0)
+    idx = np.where(
+        msb <= plat_bits,
+        values,
+        ((error_bits + 1) << plat_bits) + ((values >> error_bits) & (plat_val - 1))
+    )
+    return np.clip(idx, 0, plat_nr - 1)
+
+## the latency (ns) fio reports for a bucket, the vectorized version of plat_idx_to_val()
+def plat_idx_to_val(idx):
+    idx = np.asarray(idx, dtype=np.int64)
+    error_bits = np.maximum((idx >> plat_bits) - 1, 0)
+    base = np.left_shift(1, error_bits + plat_bits)
+    k = idx % plat_val
+    return np.where(idx < (plat_val << 1), idx, base + (k + 0.5) * np.left_shift(1, error_bits)).astype(np.int64)
+
+## percentiles (ns) of each row of a 2D array of bucket counts, picked the same way fio does:
+## the first bucket where the running count reaches p% of the total
+def histogram_percentiles(histograms, percentiles):
+    histograms = np.atleast_2d(histograms)
+    cumulative = np.cumsum(histograms, axis=1)
+    totals = cumulative[:, -1]
+    bucket_values = plat_idx_to_val(np.arange(histograms.shape[1]))
+
+    columns = []
+    for p in percentiles:
+        reached = cumulative >= (p / 100.0 * totals)[:, None]
+        columns.append(np.where(totals > 0, bucket_values[np.argmax(reached, axis=1)], 0))
+    return np.stack(columns, axis=1)
+
+## walk a fio latency log a chunk at a time, yielding (time_ms, latency) arrays
+## lines look like "time_ms, value, direction, block size, offset[, priority]"
+def read_latency_log(path, chunk_bytes=latlog_chunk_bytes):
+    with open(path, 'rb') as f:
+        if os.fstat(f.fileno()).st_size == 0:
+            return
+        with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as log:
+            first_line_end = log.find(b'\n')
+            if first_line_end < 0:
+                first_line_end = len(log)
+            column_count = log[:first_line_end].count(b',') + 1
+
+            position = 0
+            released = 0
+            while position < len(log):
+                end = min(position + chunk_bytes, len(log))
+                if end < len(log):
+                    end = log.rfind(b'\n', position, end) + 1
+                    if end <= position:
+                        end = min(position + chunk_bytes, len(log))
+                chunk = log[position:end]
+
+                # a truncated last line (fio still writing) is dropped rather than read as a short sample
+                if end == len(log) and not chunk.endswith(b'\n'):
+                    last_line_start = chunk.rfind(b'\n') + 1
+                    if chunk[last_line_start:].count(b',') + 1 != column_count:
+                        chunk = chunk[:last_line_start]
+
+                # only the time and latency columns are parsed, the rest of the line is skipped
+                if chunk.strip():
+                    values = np.loadtxt(io.BytesIO(chunk), delimiter=',', dtype=np.int64, usecols=(0, 1), ndmin=2)
+                else:
+                    values = np.zeros((0, 2), dtype=np.int64)
+
+                # hand the pages we're done with back so a multi-GB log doesn't pile up in memory
+                done = (end // mmap.PAGESIZE) * mmap.PAGESIZE
+                if hasattr(log, 'madvise') and done > released:
+                    log.madvise(mmap.MADV_DONTNEED, released, done - released)
+                    released = done
+                position = end
+
+                yield values[:, 0], values[:, 1]
+
+## the first timestamp in a latency log, or None if it has no samples
+def first_log_time(path):
+    with open(path, 'rb') as f:
+        line = f.readline()
+    try:
+        return int(line.split(b',')[0])
+    except ValueError:
+        return None
+
+## per-interval latency histograms for a set of logs, one row per interval from time 0
+## logs written with log_unix_epoch=1 have wall clock timestamps, those are counted from the earliest first sample
+## of all of them (rather than from 1970), which keeps logs from different jobs or hosts lined up with each other
+def latency_histograms(paths, interval_ms=1000, units="ns", chunk_bytes=latlog_chunk_bytes):
+    histograms = np.zeros((0, plat_nr), dtype=np.int64)
+
+    first_times = {path: first_log_time(path) for path in paths}
+    epoch_times = [t for t in first_times.values() if t is not None and t >= unix_epoch_ms_threshold]
+    epoch_origin = min(epoch_times, default=0)
+
+    for path in paths:
+        if first_times[path] is not None and first_times[path] >= unix_epoch_ms_threshold:
+            origin = epoch_origin
+        else:
+            origin = 0
+        for time_ms, latency in read_latency_log(path, chunk_bytes):
+            if len(time_ms) == 0:
+                continue
+            if units == "us":
+                latency = latency * 1000
+            interval = (time_ms - origin) // interval_ms
+            first = int(interval.min())
+            last = int(interval.max())
+
+            if last >= len(histograms):
+                grown = np.zeros((max(last + 1, len(histograms) * 2), plat_nr), dtype=np.int64)
+                grown[:len(histograms)] = histograms
+                histograms = grown
+
+            counts = np.bincount((interval - first) * plat_nr + plat_val_to_idx(latency), minlength=(last - first + 1) * plat_nr)
+            histograms[first:last + 1] += counts.reshape(-1, plat_nr)
+
+    # trim the spare rows from growing the array
+    used = np.flatnonzero(histograms.sum(axis=1))
+    if len(used) == 0:
+        return histograms[:0]
+    return histograms[:used[-1] + 1]
+
+## runs of consecutive intervals whose p99 is more than factor times the median p99
+def outlier_windows(p99, factor=3.0):
+    active = p99 > 0
+    if not active.any():
+        return []
+    limit = factor * np.median(p99[active])
+    flagged = np.concatenate(([False], p99 > limit, [False]))
+    changes = np.flatnonzero(flagged[1:] != flagged[:-1])
+
+    windows = []
+    for start, end in zip(changes[0::2], changes[1::2]):
+        windows.append((int(start), int(end - 1), float(p99[start:end].max())))
+    return windows
+
+## the -L mode: per-second percentiles and outlier windows for one or more latency logs
+def analyze_latency_logs(paths, output, factor=3.0, units="ns"):
+    histograms = latency_histograms(paths, units=units)
+    if len(histograms) == 0:
+        sys.exit("ERROR: no latency samples found in " + " ".join(paths))
+
+    counts = histograms.sum(axis=1)
+    percentiles = histogram_percentiles(histograms, [50.0, 99.0, 99.9]) / 1e6
+    windows = outlier_windows(percentiles[:, 1], factor)
+
+    with open(output, 'w', encoding='utf-8', newline='') as f:
+        writer = csv.writer(f)
+        writer.writerow(["second", "ios", "clat_p50_ms", "clat_p99_ms", "clat_p999_ms"])
+        for second in range(len(histograms)):
+            writer.writerow([second, int(counts[second])] + [round(float(v), 3) for v in percentiles[second]])
+
+    outlier_output = re.sub(r'\.csv$', '', output) + "-outliers.csv"
+    with open(outlier_output, 'w', encoding='utf-8', newline='') as f:
+        writer = csv.writer(f)
+        writer.writerow(["start_second", "end_second", "max_clat_p99_ms"])
+        for start, end, worst in windows:
+            writer.writerow([start, end, round(worst, 3)])
+
+    overall = histogram_percentiles(histograms.sum(axis=0), [50.0, 99.0, 99.9])[0] / 1e6
+    print(str(int(counts.sum())) + " IOs over " + str(len(histograms)) + " seconds, overall p50 " + str(round(float(overall[0]), 3)) +
+          "ms p99 " + str(round(float(overall[1]), 3)) + "ms p99.9 " + str(round(float(overall[2]), 3)) + "ms")
+    for start, end, worst in windows:
+        print("outlier: seconds " + str(start) + "-" + str(end) + ", p99 up to " + str(round(worst, 3)) + "ms")
+    print(" ")
+    print("Results written to " + output + " and " + outlier_output)
+
+def write_results_csv(results, filename):
+    with open(filename, 'w', encoding='utf-8', newline='') as f:
+        writer = csv.writer(f)
+        writer.writerow(results.dtype.names)
+        for row in results.tolist():
+            writer.writerow([round(v, 3) if isinstance(v, float) else v for v in row])
+
+def write_summary_csv(summary, filename):
+    with open(filename, 'w', encoding='utf-8', newline='') as f:
+        if len(summary) == 0:
+            return
+        writer = csv.DictWriter(f, fieldnames=list(summary[0].keys()))
+        writer.writeheader()
+        writer.writerows(summary)
+
+def main():
+    args = setup_args()
+
+    if args.latlog:
+        if args.output:
+            output = str(args.output)
+        else:
+            output = os.path.join(os.path.dirname(os.path.abspath(args.latlog[0])), "fio-latency.csv")
+        if args.outlier:
+            factor = float(args.outlier)
+        else:
+            factor = 3.0
+        if args.units:
+            units = str(args.units)
+        else:
+            units = "ns"
+        return analyze_latency_logs(args.latlog, output, factor, units)
+
+    if not args.directory:
+        sys.exit("ERROR: give either a results directory with -d or latency logs with -L")
+
+    directories = [str(d) for d in args.directory]
+    for directory in directories:
+        if not os.path.isdir(directory):
+            sys.exit("ERROR: " + directory + " is not a directory")
+
+    if args.output:
+        output = str(args.output)
+    else:
+        output = os.path.join(directories[0], "fio-results.csv")
+    summary_output = re.sub(r'\.csv$', '', output) + "-summary.csv"
+    merged_output = re.sub(r'\.csv$', '', output) + "-merged.csv"
+
+    if args.merge == "True" or args.merge == "true":
+        merge = True
+    else:
+        merge = False
+
+    if args.p99limit:
+        p99_limit_ms = float(args.p99limit)
+    else:
+        p99_limit_ms = 10.0
+
+    if args.knee:
+        knee = float(args.knee)
+    else:
+        knee = 0.9
+
+    results, histograms = load_results_with_histograms(directories)
+    if len(results) == 0:
+        sys.exit("ERROR: no fio JSON output found in " + " ".join(directories) + " (fio needs --output-format=json+)")
+
+    summary = summarize(results, p99_limit_ms, knee)
+    write_results_csv(results, output)
+    write_summary_csv(summary, summary_output)
+
+    for this_summary in summary:
+        print(
+            this_summary["host"] + " " + this_summary["pattern"] +
+            ": best " + str(this_summary["best_iops"]) + " IOPS at iodepth " + str(this_summary["best_iops_iodepth"]) +
+            ", saturates at iodepth " + str(this_summary["saturation_iodepth"]) +
+            ", best under p99 " + str(p99_limit_ms) + "ms: " + str(this_summary["best_iops_under_p99_limit"])
+        )
+
+    if merge:
+        merged = merge_results(results, histograms)[0]
+        write_results_csv(merged, merged_output)
+        print(" ")
+        print("Merged " + str(len(results)) + " runs into " + str(len(merged)) + " pattern/iodepth points, written to " + merged_output)
+
+    print(" ")
+    print("Results written to " + output + " and " + summary_output)
+
+if __name__ == "__main__":
+    exit(main())
@@ -1,14 +1,12 @@
 #!/bin/bash
 
-# This is a wrapper script which will run fioparser 4 times with different IO patterns.
+# This is a wrapper script which will run fio 4 times with different IO patterns, then parse the results with fioparser.py.
 # Courtesy of this article: https://anfcommunity.com/2020/11/20/how-to-nfs-performance-assessment-using-fio-and-fio-parser/
 
 # PREREQUISITES
 
 # 1.    fio (apt install fio || yum install fio)
-# 2.    fioparser (git clone https://github.com/jtulak/fio-parser.git)
-# 3.    python2.x (apt install python2 || yum install python2 )
-# 4.    numpy, hurry (pip2 install numpy && pip2 install hurry)
+# 2.    python3 + numpy (pip3 install numpy)
 
 # OPTIONS:
 
@@ -23,6 +21,7 @@
 #       ./fioparser.sh --w /zfs/working --o /zfs/output
 
 #       In the above example, I am testing an FSX for OpenZFS volume mounted to /zfs
+#       The results end up in /zfs/output/fio-results.csv with a per-pattern summary in /zfs/output/fio-results-summary.csv
 
 # NOTES:
 
@@ -30,6 +29,9 @@
 #   You could reduce the runtime of this to 30 min or so by capping it at 10, or 15 min by capping it at 5, but you get
 #   less information about how more heavy-hitting workloads will behave
 
+#   --w and --o are what fio and fioparser.py actually use.  Older copies of this script parsed them but still ran
+#   everything in /ontap/working and /ontap/output, so a job that passes them now reads and writes where it says
+
 # set defaults here
 WORKING="/ontap/working"
 OUTPUT="/ontap/output"
@@ -46,19 +48,19 @@ while [ $# -gt 0 ]; do
 done
 
 for i in 1 2 3 4 5 6 7 8 9 10 15 20 25 30 40 50 60 70 80 90 100; do 
-    fio --name=fiotest --directory=$WORKING --ioengine=libaio --direct=1 --numjobs=2 --nrfiles=4 --runtime=30 --group_reporting --time_based --stonewall --size=4G --ramp_time=20 --bs=64k --rw=read --iodepth=$i --fallocate=none --output=$OUTPUT/$(uname -n)-seqread-$i; 
+    fio --name=fiotest --directory=$w --ioengine=libaio --direct=1 --numjobs=2 --nrfiles=4 --runtime=30 --group_reporting --time_based --stonewall --size=4G --ramp_time=20 --bs=64k --rw=read --iodepth=$i --fallocate=none --output-format=json+ --output=$o/$(uname -n)-seqread-$i; 
 done
 
 for i in 1 2 3 4 5 6 7 8 9 10 15 20 25 30 40 50 60 70 80 90 100; do 
-    fio --name=fiotest --directory=$WORKING --ioengine=libaio --direct=1 --numjobs=2 --nrfiles=4 --runtime=30 --group_reporting --time_based --stonewall --size=4G --ramp_time=20 --bs=64k --rw=write --iodepth=$i --fallocate=none --output=$OUTPUT/$(uname -n)-seqwrite-$i;
+    fio --name=fiotest --directory=$w --ioengine=libaio --direct=1 --numjobs=2 --nrfiles=4 --runtime=30 --group_reporting --time_based --stonewall --size=4G --ramp_time=20 --bs=64k --rw=write --iodepth=$i --fallocate=none --output-format=json+ --output=$o/$(uname -n)-seqwrite-$i;
 done
 
 for i in 1 2 3 4 5 6 7 8 9 10 15 20 25 30 40 50 60 70 80 90 100; do 
-    fio --name=fiotest --directory=$WORKING --ioengine=libaio --direct=1 --numjobs=2 --nrfiles=4 --runtime=30 --group_reporting --time_based --stonewall --size=4G --ramp_time=20 --bs=8k --rw=randread --iodepth=$i --fallocate=none --output=$OUTPUT/$(uname -n)-randread-$i;
+    fio --name=fiotest --directory=$w --ioengine=libaio --direct=1 --numjobs=2 --nrfiles=4 --runtime=30 --group_reporting --time_based --stonewall --size=4G --ramp_time=20 --bs=8k --rw=randread --iodepth=$i --fallocate=none --output-format=json+ --output=$o/$(uname -n)-randread-$i;
 done
 
 for i in 1 2 3 4 5 6 7 8 9 10 15 20 25 30 40 50 60 70 80 90 100; do
-    fio --name=fiotest --directory=$WORKING --ioengine=libaio --direct=1 --numjobs=2 --nrfiles=4 --runtime=30 --group_reporting --time_based --stonewall --size=4G --ramp_time=20 --bs=8k --rw=randwrite --iodepth=$i --fallocate=none --output=$OUTPUT/$(uname -n)-randwrite-$i;
+    fio --name=fiotest --directory=$w --ioengine=libaio --direct=1 --numjobs=2 --nrfiles=4 --runtime=30 --group_reporting --time_based --stonewall --size=4G --ramp_time=20 --bs=8k --rw=randwrite --iodepth=$i --fallocate=none --output-format=json+ --output=$o/$(uname -n)-randwrite-$i;
 done
 
-/ontap/fio-parser/fio-parser.py -d $OUTPUT
+python3 "$(dirname "$0")/fioparser.py" -d $o
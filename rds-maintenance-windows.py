@@ -13,6 +13,17 @@ arguments:
         Specify the AWS client profile to use - found under ~/.aws/credentials
         If you don't have multiple profiles, leave this alone
 
+    --cache [True/False]
+        Serve repeat describe calls from the local inventory cache in ~/.cache/aws-admin-scripts (default is False)
+        Cached answers can be minutes old, see aws_inventory_cache.py for the per-call TTLs
+
+    --max-age [seconds]
+        Override every inventory cache TTL.  0 means always go to the API (the cache is still refreshed)
+
+    --trace [full path to the file]
+        Record a timeline of the run (STS, the region and every API call) as Chrome Trace Event JSON that opens in
+        https://ui.perfetto.dev or chrome://tracing.  See aws_trace.py
+
 prerequisites:
 
     pip install boto3
@@ -30,6 +41,9 @@ examples:
 
 import boto3
 import argparse
+import aws_inventory_cache
+import aws_records
+import aws_trace
 from datetime import datetime
 from datetime import timedelta
 
@@ -52,6 +66,21 @@ def setup_args():
                         action='store',
                         help='If you want to use a non-default profile')
 
+    parser.add_argument('--cache',
+                        required=False,
+                        action='store',
+                        help='Serve repeat describe calls from the local inventory cache (default is False)')
+
+    parser.add_argument('--max-age',
+                        required=False,
+                        action='store',
+                        help='Override the inventory cache TTLs, in seconds (0 forces fresh data)')
+
+    parser.add_argument('--trace',
+                        required=False,
+                        action='store',
+                        help='Write a Chrome trace of the run to this file')
+
     return (parser.parse_args())
 
 def main():
@@ -74,11 +103,27 @@ def main():
     else:
         profile = "noprofile"
 
+    ## with --cache True, repeat runs within the TTLs are served from the local inventory cache instead of the API
+    if args.cache == "True" or args.cache == "true":
+        if args.max_age:
+            inventory_cache = aws_inventory_cache.InventoryCache(max_age=int(args.max_age))
+        else:
+            inventory_cache = aws_inventory_cache.InventoryCache()
+    else:
+        inventory_cache = None
+
+    ## everything from here on is timed when --trace is on, the file is written on the way out
+    if args.trace:
+        aws_trace.start(str(args.trace), "rds-maintenance-windows.py")
+
     ## Addresses the case where user just wants to use environment variables or default profile
     if (profile == "noprofile"):
         session = boto3.Session()
     else:
         session = boto3.Session(profile_name=profile)   
+
+    ## the account id is only looked up for the cache, so without it the API calls are labelled with the profile
+    aws_trace.enable_tracing(session, profile)
     
     ## set up the timezone-to-region mapping
     region_utc_offset_no_dst = {
@@ -117,11 +162,24 @@ def main():
         "ap-southeast-4" : "12"
     }
 
+    ## the cache is keyed by account, so we need to know which one this profile points to (only with --cache True)
+    if inventory_cache is not None:
+        try:
+            with aws_trace.span("sts"):
+                CURRENT_ACCOUNT_ID = session.client('sts').get_caller_identity()['Account']
+            aws_inventory_cache.enable_cache(session, CURRENT_ACCOUNT_ID, inventory_cache)
+        except:
+            inventory_cache = None
+
+    ## the instances are paged in while the rows print, so the region span covers both
+    region_span = aws_trace.begin(region, "region")
+
     ## boto3 is the main python sdk for AWS
     ## you open connections on a per-service basis
     rds = session.client('rds',region_name=region)
 
-    rds_data = rds.describe_db_instances()
+    ## every page of instances, kept as records with just the fields the report uses
+    rds_data = aws_records.page_records(rds.get_paginator('describe_db_instances').paginate(), 'DBInstances', aws_records.rds_instance_record)
 
     if fieldnames == "True":
         ## create header for the CSV but only if the argument -f True was passed
@@ -140,17 +198,17 @@ def main():
             "MW Local End"
         )
 
-    for instance in rds_data['DBInstances']:
-        rds_instance_DBInstanceIdentifier = str(instance['DBInstanceIdentifier'])
-        rds_instance_DBInstanceClass = str(instance['DBInstanceClass'])
-        rds_instance_Engine = str(instance['Engine'])
-        rds_instance_EngineVersion = str(instance['EngineVersion'])
-        rds_instance_DBInstanceStatus = str(instance['DBInstanceStatus'])
-        rds_instance_AvailabilityZone = str(instance['AvailabilityZone'])
-        rds_instance_AutoMinorVersionUpgrade = str(instance['AutoMinorVersionUpgrade'])
+    for instance in rds_data:
+        rds_instance_DBInstanceIdentifier = str(instance.identifier)
+        rds_instance_DBInstanceClass = str(instance.instance_class)
+        rds_instance_Engine = str(instance.engine)
+        rds_instance_EngineVersion = str(instance.engine_version)
+        rds_instance_DBInstanceStatus = str(instance.status)
+        rds_instance_AvailabilityZone = str(instance.availability_zone)
+        rds_instance_AutoMinorVersionUpgrade = str(instance.auto_minor_version_upgrade)
 
         ## convert to the time zone the region is actually in
-        rds_instance_PreferredMaintenanceWindow_UTC = str(instance['PreferredMaintenanceWindow'])
+        rds_instance_PreferredMaintenanceWindow_UTC = str(instance.maintenance_window)
         rds_instance_PreferredMaintenanceWindow_UTC_day_start = rds_instance_PreferredMaintenanceWindow_UTC[0:3]
         # rds_instance_PreferredMaintenanceWindow_UTC_day_end = rds_instance_PreferredMaintenanceWindow_UTC[10:13]
         rds_instance_PreferredMaintenanceWindow_UTC_time_start = rds_instance_PreferredMaintenanceWindow_UTC[4:9]
@@ -192,6 +250,8 @@ def main():
             rds_instance_PreferredMaintenanceWindow_local_time_end         
         )
 
+    region_span.end()
+
 if __name__ == "__main__":
     exit(main())                        
                     